@@ -17,6 +17,12 @@ class RobotController:
         self.updownposition = 0.0
         self.fork_threshold = 0.005
         self.fork_msg = meteorcar()
+        # 牙叉絕對位置控制 (比例 + 速度斜坡 + deadband), 以 Tk after 固定週期執行, 不阻塞介面
+        self.fork_kp = 40000.0          # 每公尺誤差輸出的 fork_velocity
+        self.fork_min_velocity = 1000.0 # forklift_driver 會把 1~1000 的命令補到 1000
+        self.fork_max_accel = 16000.0   # fork_velocity 每秒最大變化量
+        self.fork_period = 0.05
+        self.fork_target = None
 
         # 假設 /cmd_vel 控制機器人移動，/cmd_fork 控制牙叉動作
         self.pub_cmd_vel = rospy.Publisher('/cmd_vel', Twist, queue_size=1)
@@ -90,6 +96,7 @@ class RobotController:
 
     def send_fork_command(self, direction):
         """ 發送牙叉升降指令 """
+        self.fork_target = None  # 手動操作時取消絕對位置控制
         self.fork_msg.fork_velocity = self.fork_speed * direction
         self.pub_fork.publish(self.fork_msg)
 
@@ -107,20 +114,34 @@ class RobotController:
     
     def move_fork(self, abs_pos):
         """ 移動牙叉到指定位置 """
-        while True:
-            if(abs_pos < 0):
-                return
-            
-            if self.updownposition < abs_pos - self.fork_threshold:
-                self.fork_msg.fork_velocity = 2000.0
-                self.pub_fork.publish(self.fork_msg)
-            elif self.updownposition > abs_pos + self.fork_threshold:
-                self.fork_msg.fork_velocity = -2000.0
-                self.pub_fork.publish(self.fork_msg)
-            else:
-                self.fork_msg.fork_velocity = 0.0
-                self.pub_fork.publish(self.fork_msg)
-                return
+        if(abs_pos < 0):
+            return
+        self.fork_msg.fork_velocity = 0.0
+        if self.fork_target is None:
+            self.window.after(int(self.fork_period * 1000), self.fork_control_step)
+        self.fork_target = abs_pos
+
+    def fork_control_step(self):
+        """ 每個週期依誤差輸出比例的 fork_velocity, 到位後停止 """
+        if self.fork_target is None or rospy.is_shutdown():
+            return
+        error = self.fork_target - self.updownposition
+        if abs(error) <= self.fork_threshold:
+            self.fork_msg.fork_velocity = 0.0
+            self.pub_fork.publish(self.fork_msg)
+            self.fork_target = None
+            return
+        limit = max(self.fork_speed, self.fork_min_velocity)
+        u = max(self.fork_min_velocity, min(limit, self.fork_kp * abs(error))) * (1 if error > 0 else -1)
+        v = self.fork_msg.fork_velocity
+        if v * u <= 0:
+            v = self.fork_min_velocity * (1 if u > 0 else -1)
+        else:
+            step = self.fork_max_accel * self.fork_period
+            v = max(v - step, min(v + step, u))
+        self.fork_msg.fork_velocity = v
+        self.pub_fork.publish(self.fork_msg)
+        self.window.after(int(self.fork_period * 1000), self.fork_control_step)
 
     def update_robot_speed(self, value):
         """ 更新機器人移動速度倍率，並顯示在 Label """
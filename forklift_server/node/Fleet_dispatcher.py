@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 常駐的車隊派工: 任務由 ~submit service 或 ~jobs 參數進入佇列, 依路徑表的行駛成本派給閒置的車, 各車的任務同時執行
+import rospy
+import actionlib
+import threading
+from actionlib_msgs.msg import GoalStatus
+from forklift_server.msg import PBVSMegaposeAction, PBVSMegaposeGoal, TopologyMapAction, TopologyMapGoal, FleetMetrics
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyRouteTable import RouteTable
+from FleetDispatch import Dispatcher, FleetMetrics as Metrics
+from forklift_server.srv import FleetJob, FleetJobResponse
+
+# 與 ctrl_server_megapose 的 command 格式相同, $pick, $place, $layer 由任務內容代入
+DEFAULT_STEPS = [
+    ['TopologyMap', '$pick'],
+    ['PBVS', 'parking_forkcamera', '$layer'],
+    ['PBVS', 'raise_pallet', '$layer'],
+    ['TopologyMap', '$place'],
+    ['PBVS', 'parking_bodycamera', '$layer'],
+    ['PBVS', 'drop_pallet', '$layer']
+]
+
+
+class Robot():
+    # 每台車各自的 action client, 放在 robot 的 namespace 底下
+    def __init__(self, name):
+        self.name = name
+        self.topology = actionlib.SimpleActionClient('/%s/TopologyMap_server' % name, TopologyMapAction)
+        self.pbvs = actionlib.SimpleActionClient('/%s/PBVS_server' % name, PBVSMegaposeAction)
+
+    def call(self, client, goal, timeout, goal_timeout):
+        # goal_timeout 秒內沒有結束就取消 goal 並回傳失敗, 0 為不限
+        if not client.wait_for_server(rospy.Duration(timeout)):
+            rospy.logwarn("%s: action server %s not available" % (self.name, client.action_client.ns))
+            return False
+        client.send_goal(goal)
+        if not client.wait_for_result(rospy.Duration(goal_timeout)):
+            rospy.logwarn("%s: %s did not finish in %.1f s, cancel goal" % (self.name, client.action_client.ns, goal_timeout))
+            client.cancel_goal()
+            client.wait_for_result(rospy.Duration(timeout))
+            return False
+        result = client.get_result()
+        return client.get_state() == GoalStatus.SUCCEEDED and result is not None and result.result != 'fail'
+
+
+class FleetDispatcher():
+    def __init__(self):
+        self.init_param()
+        self.lock = threading.Lock()
+        self.dispatcher = Dispatcher(RouteTable(self.graph), self.robots, self.age_weight)
+        self.metrics = Metrics(rospy.get_time(), self.metrics_window)
+        self.clients = {name: Robot(name) for name in self.robots}
+        for job in self.jobs:
+            self.submit(job[0], job[1], job[2] if len(job) > 2 else 0.0)
+        self.service = rospy.Service(rospy.get_name() + "/submit", FleetJob, self.cbSubmit)
+        self.metrics_pub = rospy.Publisher(rospy.get_name() + "/metrics", FleetMetrics, queue_size=1, latch=True)
+        self.dispatch_timer = rospy.Timer(rospy.Duration(self.dispatch_period), self.cbDispatch)
+        self.metrics_timer = rospy.Timer(rospy.Duration(self.metrics_period), self.cbMetrics)
+
+    def init_param(self):
+        self.graph = rospy.get_param(rospy.get_name() + "/graph", {})
+        self.robots = rospy.get_param(rospy.get_name() + "/robots", {})  # robot namespace -> 起始節點
+        self.steps = rospy.get_param(rospy.get_name() + "/job_steps", DEFAULT_STEPS)
+        self.jobs = rospy.get_param(rospy.get_name() + "/jobs", [])  # 啟動時的任務 [[pick, place, layer_dist], ...]
+        self.age_weight = rospy.get_param(rospy.get_name() + "/age_weight", 0.0)
+        self.dispatch_period = rospy.get_param(rospy.get_name() + "/dispatch_period", 0.5)
+        self.metrics_period = rospy.get_param(rospy.get_name() + "/metrics_period", 5.0)
+        self.metrics_window = rospy.get_param(rospy.get_name() + "/metrics_window", 3600.0)
+        self.server_timeout = rospy.get_param(rospy.get_name() + "/server_timeout", 10.0)
+        self.goal_timeout = rospy.get_param(rospy.get_name() + "/goal_timeout", 600.0)
+        rospy.loginfo("robots: %s" % self.robots)
+
+    def submit(self, pick, place, layer_dist):
+        for node in (pick, place):
+            if node not in self.graph and not any(node in neighbors for neighbors in self.graph.values()):
+                return None, "unknown node %s" % node
+        with self.lock:
+            job = self.dispatcher.submit(pick, place, layer_dist, rospy.get_time())
+        rospy.loginfo("queued %s" % job)
+        return job, "queued"
+
+    def cbSubmit(self, req):
+        job, message = self.submit(req.pick, req.place, req.layer_dist)
+        if job is None:
+            return FleetJobResponse(False, -1, message)
+        return FleetJobResponse(True, job.job_id, message)
+
+    def cbDispatch(self, event):
+        with self.lock:
+            jobs = self.dispatcher.assign(rospy.get_time())
+            for job in jobs:
+                self.metrics.record_assigned(job)
+        for job in jobs:
+            rospy.logwarn("assign %s to %s, queued %.1f s" % (job, job.robot, job.assigned - job.submitted))
+            threading.Thread(target=self.execute, args=(job,), daemon=True).start()
+
+    def execute(self, job):
+        robot = self.clients[job.robot]
+        node = None
+        success = True
+        for step in self.steps:
+            step = [{'$pick': job.pick, '$place': job.place, '$layer': job.layer_dist}.get(x, x) for x in step]
+            if rospy.is_shutdown():
+                success = False
+                break
+            rospy.loginfo("%s %s: %s" % (job.robot, job, step))
+            if step[0] == 'TopologyMap':
+                success = robot.call(robot.topology, TopologyMapGoal(goal=step[1]), self.server_timeout, self.goal_timeout)
+                if success:
+                    node = step[1]
+            elif step[0] == 'PBVS' or step[0] == 'odom':
+                success = robot.call(robot.pbvs, PBVSMegaposeGoal(command=step[1], layer_dist=float(step[2])), self.server_timeout, self.goal_timeout)
+            else:
+                rospy.logwarn("error command: %s" % step)
+                success = False
+            if not success:
+                break
+        with self.lock:
+            job = self.dispatcher.finish(job.robot, node, 'success' if success else 'fail', rospy.get_time())
+            self.metrics.record_finished(job, success)
+        rospy.logwarn("%s %s %s in %.1f s" % (job.robot, job, job.result, job.finished - job.assigned))
+
+    def cbMetrics(self, event):
+        now = rospy.get_time()
+        with self.lock:
+            jobs_per_hour = self.metrics.jobs_per_hour(now)
+            mean, longest = self.metrics.queue_latency(now)
+            msg = FleetMetrics(
+                queued = len(self.dispatcher.queue),
+                running = len(self.dispatcher.busy),
+                completed = len(self.metrics.completed),
+                failed = self.metrics.failed,
+                jobs_per_hour = jobs_per_hour,
+                queue_latency_mean = mean,
+                queue_latency_max = longest)
+        self.metrics_pub.publish(msg)
+
+
+if __name__ == '__main__':
+    rospy.init_node('Fleet_dispatcher')
+    rospy.logwarn(rospy.get_name() + " started")
+    dispatcher = FleetDispatcher()
+    rospy.spin()
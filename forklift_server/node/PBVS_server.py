@@ -15,7 +15,10 @@ script_dir = os.path.dirname( __file__ )
 mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
 sys.path.append( mymodule_dir )
 from PBVS import PBVS
-from ekf import KalmanFilter
+from GoalControl import set_goal_result
+from ekf import load_marker_ekf, OdometryHistory
+from MarkerHistory import MarkerHistory
+from DetectionStream import DetectionStream
 
 class Subscriber():
     def __init__(self):
@@ -23,11 +26,30 @@ class Subscriber():
         tag_detections_up = rospy.get_param(rospy.get_name() + "/tag_detections_up", "/tag_detections_up")
         tag_detections_down = rospy.get_param(rospy.get_name() + "/tag_detections_down", "/tag_detections_down")
         forkpos = rospy.get_param(rospy.get_name() + "/forkpos", "/forkpos")
+        self.marker_timeout = rospy.get_param(rospy.get_name() + "/marker_timeout", 0.5)
+        self.settle_time = rospy.get_param(rospy.get_name() + "/settle_time", 0.5)
+        self.predict_marker = rospy.get_param(rospy.get_name() + "/predict_marker", True)
+        self.docking_path = rospy.get_param(rospy.get_name() + "/docking_path", True)
+        self.docking_lookahead = rospy.get_param(rospy.get_name() + "/docking_lookahead", 0.4)
+        self.docking_approach_ratio = rospy.get_param(rospy.get_name() + "/docking_approach_ratio", 2.0)
+        self.docking_min_distance = rospy.get_param(rospy.get_name() + "/docking_min_distance", 2.0)
+        self.docking_skip_lateral = rospy.get_param(rospy.get_name() + "/docking_skip_lateral", 0.4)
+        self.docking_tolerance = rospy.get_param(rospy.get_name() + "/docking_tolerance", 0.05)
+        self.docking_decel = rospy.get_param(rospy.get_name() + "/docking_decel", 0.2)
+        self.fork_deadband = rospy.get_param(rospy.get_name() + "/fork_deadband", 0.005)
+        self.fork_lead = rospy.get_param(rospy.get_name() + "/fork_lead", 0.2)
+        self.fork_speed = rospy.get_param(rospy.get_name() + "/fork_speed", 0.05)
+        self.fork_settle_wait = rospy.get_param(rospy.get_name() + "/fork_settle_wait", 0.3)
+        self.marker = DetectionStream()
         self.sub_info_marker = rospy.Subscriber(tag_detections_up, AprilTagDetectionArray, self.cbGetMarker_up, queue_size = 1)
         self.sub_info_marker = rospy.Subscriber(tag_detections_down, AprilTagDetectionArray, self.cbGetMarker_down, queue_size = 1)
         self.sub_odom_robot = rospy.Subscriber(odom, Odometry, self.cbGetRobotOdom, queue_size = 1)
         self.sub_forwardbackpostion = rospy.Subscriber(forkpos, forkposition, self.cbGetforkpos, queue_size = 1)
-        self.ekf_theta = KalmanFilter()
+        self.marker_ekf = load_marker_ekf()
+        self.odom_history = OdometryHistory()
+        self.marker_history = MarkerHistory(rospy.get_param(rospy.get_name() + "/marker_history_size", 64),
+                                            rospy.get_param(rospy.get_name() + "/marker_estimator", "huber"),
+                                            odometry=self.odom_history, camera_x=self.marker_ekf.camera_x)
         self.init_parame()
 
     def init_parame(self):
@@ -36,6 +58,7 @@ class Subscriber():
         self.robot_2d_pose_x = 0.0
         self.robot_2d_pose_y = 0.0
         self.robot_2d_theta = 0.0
+        self.odom_stamp = None  # 最新一筆里程計的時間 (s)
         self.previous_robot_2d_theta = 0.0
         self.total_robot_2d_theta = 0.0
         # AprilTag_param
@@ -47,8 +70,8 @@ class Subscriber():
         # Forklift_param
         self.forwardbackpostion = 0.0
         self.updownposition = 0.0
-        #ekf
-        self.ekf_theta.init(1,1,5)
+        self.marker_camera = None  # 目前 EKF 估計所用的相機與 tag (updown, tag id)
+        self.marker_covariance = None  # EKF 的 3x3 共變異數 (x, y, theta)
     def __del__(self):
         self.window.destroy()
 
@@ -58,17 +81,33 @@ class Subscriber():
     def SpinOnce_fork(self):
         return self.forwardbackpostion, self.updownposition
 
+    def fnMarkerUpdate(self, x, y, theta, stamp, tag_id):
+        # 相機量測以影像時間之後的里程計推算到現在再送入 EKF, 換相機或 tag 時重新初始化; marker_2d_* 改用融合後的估計值
+        # MarkerHistory 以 (相機, tag id) 分開保存, 換 tag 後的估計不會混入前一個 tag 的偵測
+        key = ('up' if self.updown else 'down', tag_id)
+        if self.marker_camera != key:
+            self.marker_ekf.reset()
+            self.marker_camera = key
+        stamp = stamp.to_sec() if not stamp.is_zero() else rospy.get_time()
+        self.marker_history.add(x, y, theta, stamp, key)
+        self.marker_ekf.update(x, y, theta, self.odom_history.motion_since(stamp))
+        self.fnMarkerEstimate()
+
+    def fnMarkerEstimate(self):
+        estimate = self.marker_ekf.estimate()
+        if estimate is not None:
+            self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, self.marker_covariance = estimate
+
     def cbGetMarker_up(self, msg):
         try:
             if self.updown == True:
                 # print("up tag")
                 marker_msg = msg.detections[0].pose.pose.pose
+                tag_id = tuple(msg.detections[0].id)
                 quaternion = (marker_msg.orientation.x, marker_msg.orientation.y, marker_msg.orientation.z, marker_msg.orientation.w)
                 theta = tf.transformations.euler_from_quaternion(quaternion)[1]
-                theta = self.ekf_theta.update(theta)
-                self.marker_2d_pose_x = -marker_msg.position.z
-                self.marker_2d_pose_y = marker_msg.position.x + self.offset_x
-                self.marker_2d_theta = -theta
+                self.fnMarkerUpdate(-marker_msg.position.z, marker_msg.position.x + self.offset_x, -theta, msg.header.stamp, tag_id)
+                self.marker.update(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, msg.header.stamp)
             else:
                 pass
         except:
@@ -79,12 +118,11 @@ class Subscriber():
             if self.updown == False:
                 # print("down tag")
                 marker_msg = msg.detections[0].pose.pose.pose
+                tag_id = tuple(msg.detections[0].id)
                 quaternion = (marker_msg.orientation.x, marker_msg.orientation.y, marker_msg.orientation.z, marker_msg.orientation.w)
                 theta = tf.transformations.euler_from_quaternion(quaternion)[1]
-                theta = self.ekf_theta.update(theta)
-                self.marker_2d_pose_x = -marker_msg.position.z
-                self.marker_2d_pose_y = marker_msg.position.x + self.offset_x
-                self.marker_2d_theta = -theta
+                self.fnMarkerUpdate(-marker_msg.position.z, marker_msg.position.x + self.offset_x, -theta, msg.header.stamp, tag_id)
+                self.marker.update(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, msg.header.stamp)
 
             else:
                 pass
@@ -106,6 +144,13 @@ class Subscriber():
         self.robot_2d_pose_y = msg.pose.pose.position.y
         self.robot_2d_theta = theta
 
+        # 相機偵測之間以里程計推算 marker 相對位置, marker_2d_* 以 odom 頻率更新
+        stamp = msg.header.stamp.to_sec() if not msg.header.stamp.is_zero() else rospy.get_time()
+        self.odom_stamp = stamp
+        delta = self.odom_history.update(self.robot_2d_pose_x, self.robot_2d_pose_y, theta, stamp)
+        if delta is not None and self.marker_ekf.predict(*delta):
+            self.fnMarkerEstimate()
+
         if (self.robot_2d_theta - self.previous_robot_2d_theta) > 5.:
             d_theta = (self.robot_2d_theta - self.previous_robot_2d_theta) - 2 * math.pi
         elif (self.robot_2d_theta - self.previous_robot_2d_theta) < -5.:
@@ -129,16 +174,23 @@ class PBVSAction():
         self._action_name = name
         self._as = actionlib.SimpleActionServer(self._action_name, forklift_server.msg.PBVSAction, execute_cb=self.execute_cb, auto_start = False)
         self._result = forklift_server.msg.PBVSResult()
+        self.PBVS = None
+        self._as.register_preempt_callback(self.preempt_cb)
         self._as.start()
 
+    def preempt_cb(self):
+        # cancel 一收到就先停車與牙叉, sequence 在下一個步驟邊界結束
+        rospy.logwarn('PBVS cancel requested')
+        if self.PBVS is not None:
+            self.PBVS.fnStopMotion()
+
     def execute_cb(self, msg):
         rospy.loginfo('PBVS receive command : %s' % (msg))
         
         self.PBVS = PBVS(self._as, self.subscriber, msg)
-        rospy.logwarn('PBVS Succeeded')
-        self._result.result = 'PBVS Succeeded'
+        outcome = self.PBVS.run()
         self.subscriber.updown = True
-        self._as.set_succeeded(self._result)
+        set_goal_result(self._as, self._result, outcome)
         self.PBVS = None
 
 
@@ -16,6 +16,9 @@ script_dir = os.path.dirname( __file__ )
 mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
 sys.path.append( mymodule_dir )
 from PBVS_differential import PBVS
+from GoalControl import set_goal_result
+from ekf import OdometryHistory
+from MarkerHistory import MarkerHistory
 
 from dataclasses import dataclass
 @dataclass
@@ -37,6 +40,12 @@ class Subscriber():
         self.pose_topic = rospy.get_param(rospy.get_name() + "/pose_topic", "/oilpalm")
         self.object_filter = rospy.get_param(rospy.get_name() + "/object_filter", True)
         self.confidence_minimum = rospy.get_param(rospy.get_name() + "/confidence_minimum", 0.5)
+        self.control_rate = rospy.get_param(rospy.get_name() + "/control_rate", 20.0)  # sequence 控制迴圈頻率 (Hz)
+        self.settle_time = rospy.get_param(rospy.get_name() + "/settle_time", 0.5)  # 誤差在門檻內且停止變化多久算收斂 (s)
+        self.goal_timeout = rospy.get_param(rospy.get_name() + "/goal_timeout", 0.0)  # 一個 goal 最長執行時間 (s), 0 為不限
+        self.feedback_rate = rospy.get_param(rospy.get_name() + "/feedback_rate", 5.0)  # action feedback 發布頻率 (Hz), 0 為不發布
+        self.marker_history_size = rospy.get_param(rospy.get_name() + "/marker_history_size", 64)  # 保留的偵測筆數
+        self.marker_estimator = rospy.get_param(rospy.get_name() + "/marker_estimator", "huber")  # huber / median
         self.arm_status_topic = rospy.get_param(rospy.get_name() + "/arm_status_topic", "/arm_current_status")
         self.arm_control_topic = rospy.get_param(rospy.get_name() + "/arm_control_topic", "/cmd_cut_pliers")
 
@@ -96,6 +105,9 @@ class Subscriber():
         self.marker_2d_pose_y = 0.0
         self.marker_2d_pose_z = 0.0
         self.marker_2d_theta = 0.0
+        self.marker_stamp = 0.0  # 收到偵測的時間
+        self.odom_history = OdometryHistory()  # 以收到的時間記錄, 與 marker_stamp 同一時基
+        self.marker_history = MarkerHistory(self.marker_history_size, self.marker_estimator, odometry=self.odom_history)
         # Forklift_param
         self.updownposition = 0.0
         # confidence_param
@@ -188,6 +200,9 @@ class Subscriber():
         return self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
                self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_pose_z, self.marker_2d_theta
     
+    def SpinOnce_stamp(self):
+        return self.marker_stamp
+
     def SpinOnce_confidence(self):
         return self.sub_detectionConfidence
 
@@ -200,6 +215,8 @@ class Subscriber():
             self.marker_2d_pose_y = marker_msg.position.x + self.camera_tag_offset_x
             self.marker_2d_pose_z = marker_msg.position.y  # 更新z轴信息
             self.marker_2d_theta = -theta
+            self.marker_stamp = rospy.get_time()
+            self.marker_history.add(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, self.marker_stamp)
             # rospy.loginfo("Pose: x={:.3f}, y={:.3f}, theta={:.3f}".format(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta))
         except:
             pass
@@ -218,6 +235,7 @@ class Subscriber():
         self.robot_2d_pose_x = msg.pose.pose.position.x
         self.robot_2d_pose_y = msg.pose.pose.position.y
         self.robot_2d_theta = theta
+        self.odom_history.update(self.robot_2d_pose_x, self.robot_2d_pose_y, theta, rospy.get_time())
 
         d_theta = self.robot_2d_theta - self.previous_robot_2d_theta
         if d_theta > math.pi:
@@ -240,28 +258,36 @@ class PBVSAction():
         self._action_name = name
         self._as = actionlib.SimpleActionServer(self._action_name, forklift_server.msg.PBVSMegaposeAction, execute_cb=self.execute_callback, auto_start = False)
         self._result = forklift_server.msg.PBVSResult()
+        self.PBVS = None
+        self._as.register_preempt_callback(self.preempt_callback)
         self._as.start()
 
+    def preempt_callback(self):
+        # cancel 一收到就先停車與手臂, sequence 在下一個步驟邊界結束
+        rospy.logwarn('PBVS cancel requested')
+        if self.PBVS is not None:
+            self.PBVS.fnStopMotion()
+
     def execute_callback(self, msg):
         # rospy.loginfo('Received goal: Command={}, layer_dist={}'.format(self.command, self.layer_dist))
         rospy.logwarn('PBVS receive command : %s' % (msg))
         self.PBVS = PBVS(self._as, self.subscriber, msg)
 
         if(msg.command == "fruit_docking"):
-            self.PBVS.fruit_docking()
+            outcome = self.PBVS.fruit_docking()
         elif(msg.command == "odom_front"):
-            self.PBVS.odom_front()
+            outcome = self.PBVS.odom_front()
         elif(msg.command == "odom_turn"):
-            self.PBVS.odom_turn()
+            outcome = self.PBVS.odom_turn()
         else:
             rospy.logwarn("Unknown command")
             self._result.result = 'fail'
             self._as.set_aborted(self._result)
+            self.PBVS = None
             return
-        
-        rospy.logwarn('PBVS Succeeded')
-        self._result.result = 'PBVS Succeeded'
-        self._as.set_succeeded(self._result)
+
+        self.PBVS.progress.stop()
+        set_goal_result(self._as, self._result, outcome)
         self.PBVS = None
 
 
@@ -17,6 +17,9 @@ script_dir = os.path.dirname( __file__ )
 mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
 sys.path.append( mymodule_dir )
 from PBVS_megapose import PBVS
+from GoalControl import set_goal_result
+from ekf import OdometryHistory, propagate_marker
+from MarkerHistory import MarkerHistory
 
 from dataclasses import dataclass
 @dataclass
@@ -41,6 +44,15 @@ class Subscriber():
         self.object_filter = rospy.get_param(rospy.get_name() + "/object_filter", True)
         self.forkpos = rospy.get_param(rospy.get_name() + "/forkpos", "/forkpos")
         self.confidence_minimum = rospy.get_param(rospy.get_name() + "/confidence_minimum", 0.5)
+        self.control_rate = rospy.get_param(rospy.get_name() + "/control_rate", 20.0)  # sequence 控制迴圈頻率 (Hz)
+        self.settle_time = rospy.get_param(rospy.get_name() + "/settle_time", 0.5)  # 誤差在門檻內且停止變化多久算收斂 (s)
+        self.goal_timeout = rospy.get_param(rospy.get_name() + "/goal_timeout", 0.0)  # 一個 goal 最長執行時間 (s), 0 為不限
+        self.feedback_rate = rospy.get_param(rospy.get_name() + "/feedback_rate", 5.0)  # action feedback 發布頻率 (Hz), 0 為不發布
+        self.predict_marker = rospy.get_param(rospy.get_name() + "/predict_marker", True)  # 偵測之間以里程計推算 marker 位置
+        self.marker_latency = rospy.get_param(rospy.get_name() + "/marker_latency", 0.0)  # megapose 影像到結果的延遲 (s)
+        self.camera_x = rospy.get_param(rospy.get_name() + "/camera_x", 0.0)  # 相機相對車體旋轉中心的前後位置 (m)
+        self.marker_history_size = rospy.get_param(rospy.get_name() + "/marker_history_size", 64)  # 每個物件保留的偵測筆數
+        self.marker_estimator = rospy.get_param(rospy.get_name() + "/marker_estimator", "huber")  # huber / median
 
         rospy.loginfo("Get subscriber topic parameter")
         rospy.loginfo("odom_topic: {}, type: {}".format(self.odom_topic, type(self.odom_topic)))
@@ -123,6 +135,40 @@ class Subscriber():
         rospy.loginfo("drop_pallet_drop_height_layer2: {}, type: {}".format(self.drop_pallet_drop_height_layer2, type(self.drop_pallet_drop_height_layer2)))
         rospy.loginfo("drop_pallet_back_distance: {}, type: {}".format(self.drop_pallet_back_distance, type(self.drop_pallet_back_distance)))
 
+        # Fork pre-positioning setting
+        self.fork_init_tolerance = rospy.get_param(rospy.get_name() + "/fork_init_tolerance", 0.01)
+        self.fork_height_limit_stopped = rospy.get_param(rospy.get_name() + "/fork_height_limit_stopped", 1.0)
+        self.fork_height_limit_moving = rospy.get_param(rospy.get_name() + "/fork_height_limit_moving", 0.05)
+        self.fork_height_limit_speed = rospy.get_param(rospy.get_name() + "/fork_height_limit_speed", 0.3)
+
+        rospy.loginfo("Get fork pre-positioning parameter")
+        rospy.loginfo("fork_init_tolerance: {}, type: {}".format(self.fork_init_tolerance, type(self.fork_init_tolerance)))
+        rospy.loginfo("fork_height_limit_stopped: {}, type: {}".format(self.fork_height_limit_stopped, type(self.fork_height_limit_stopped)))
+        rospy.loginfo("fork_height_limit_moving: {}, type: {}".format(self.fork_height_limit_moving, type(self.fork_height_limit_moving)))
+        rospy.loginfo("fork_height_limit_speed: {}, type: {}".format(self.fork_height_limit_speed, type(self.fork_height_limit_speed)))
+
+        # Fork controller setting
+        self.fork_kp = rospy.get_param(rospy.get_name() + "/fork_kp", 60000.0)
+        self.fork_ki = rospy.get_param(rospy.get_name() + "/fork_ki", 0.0)
+        self.fork_kd = rospy.get_param(rospy.get_name() + "/fork_kd", 0.0)
+        self.fork_max_velocity = rospy.get_param(rospy.get_name() + "/fork_max_velocity", 3600.0)
+        self.fork_min_velocity = rospy.get_param(rospy.get_name() + "/fork_min_velocity", 1000.0)
+        self.fork_max_accel = rospy.get_param(rospy.get_name() + "/fork_max_accel", 16000.0)
+        self.fork_deadband = rospy.get_param(rospy.get_name() + "/fork_deadband", 0.005)
+        self.fork_lead = rospy.get_param(rospy.get_name() + "/fork_lead", 0.25)
+        self.fork_settle_time = rospy.get_param(rospy.get_name() + "/fork_settle_time", 0.1)
+
+        rospy.loginfo("Get fork controller parameter")
+        rospy.loginfo("fork_kp: {}, type: {}".format(self.fork_kp, type(self.fork_kp)))
+        rospy.loginfo("fork_ki: {}, type: {}".format(self.fork_ki, type(self.fork_ki)))
+        rospy.loginfo("fork_kd: {}, type: {}".format(self.fork_kd, type(self.fork_kd)))
+        rospy.loginfo("fork_max_velocity: {}, type: {}".format(self.fork_max_velocity, type(self.fork_max_velocity)))
+        rospy.loginfo("fork_min_velocity: {}, type: {}".format(self.fork_min_velocity, type(self.fork_min_velocity)))
+        rospy.loginfo("fork_max_accel: {}, type: {}".format(self.fork_max_accel, type(self.fork_max_accel)))
+        rospy.loginfo("fork_deadband: {}, type: {}".format(self.fork_deadband, type(self.fork_deadband)))
+        rospy.loginfo("fork_lead: {}, type: {}".format(self.fork_lead, type(self.fork_lead)))
+        rospy.loginfo("fork_settle_time: {}, type: {}".format(self.fork_settle_time, type(self.fork_settle_time)))
+
     def init_parame(self):
         # Odometry_param
         self.is_odom_received = False
@@ -131,12 +177,16 @@ class Subscriber():
         self.robot_2d_theta = 0.0
         self.previous_robot_2d_theta = 0.0
         self.total_robot_2d_theta = 0.0
+        self.robot_2d_velocity = 0.0
         # AprilTag_param
         self.shelf_or_pallet = True
         self.offset_x = 0.0
         self.marker_2d_pose_x = 0.0
         self.marker_2d_pose_y = 0.0
         self.marker_2d_theta = 0.0
+        self.marker_stamp = 0.0  # 收到偵測的時間
+        self.odom_history = OdometryHistory()  # 以收到的時間記錄, 與 marker_stamp 同一時基
+        self.marker_history = MarkerHistory(self.marker_history_size, self.marker_estimator, odometry=self.odom_history, camera_x=self.camera_x)
         # Forklift_param
         self.updownposition = 0.0
         # confidence_param
@@ -184,11 +234,28 @@ class Subscriber():
         self.window.destroy()
 
     def SpinOnce(self):
+        marker_2d_pose_x, marker_2d_pose_y, marker_2d_theta = self.fnMarkerPredicted()
         return self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
-               self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta
+               marker_2d_pose_x, marker_2d_pose_y, marker_2d_theta
+
+    def fnMarkerPredicted(self):
+        # 最近一筆偵測以影像時間 (收到時間 - marker_latency) 之後的里程計推算到現在, 控制迴圈每次都拿到目前的相對位置
+        marker = (self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta)
+        if not self.predict_marker or self.marker_stamp == 0.0:
+            return marker
+        motion = self.odom_history.motion_since(self.marker_stamp - self.marker_latency)
+        if motion is None:
+            return marker
+        return propagate_marker(marker[0], marker[1], marker[2], motion[0], motion[1], motion[2], self.camera_x)
     def SpinOnce_fork(self):
         return self.updownposition
     
+    def SpinOnce_velocity(self):
+        return self.robot_2d_velocity
+
+    def SpinOnce_stamp(self):
+        return self.marker_stamp
+
     def SpinOnce_confidence(self):
         return self.sub_detectionConfidence
 
@@ -201,6 +268,8 @@ class Subscriber():
                 self.marker_2d_pose_x = -marker_msg.position.z
                 self.marker_2d_pose_y = marker_msg.position.x + self.offset_x
                 self.marker_2d_theta = -theta
+                self.marker_stamp = rospy.get_time()
+                self.marker_history.add(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, self.marker_stamp - self.marker_latency, 'pallet')
                 # rospy.loginfo("Pose: x={:.3f}, y={:.3f}, theta={:.3f}".format(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta))
             else:
                 pass
@@ -216,6 +285,8 @@ class Subscriber():
                 self.marker_2d_pose_x = -marker_msg.position.z
                 self.marker_2d_pose_y = marker_msg.position.x + self.offset_x
                 self.marker_2d_theta = -theta
+                self.marker_stamp = rospy.get_time()
+                self.marker_history.add(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta, self.marker_stamp - self.marker_latency, 'shelf')
                 # rospy.loginfo("Pose: x={:.3f}, y={:.3f}, theta={:.3f}".format(self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta))
             else:
                 pass
@@ -236,6 +307,8 @@ class Subscriber():
         self.robot_2d_pose_x = msg.pose.pose.position.x
         self.robot_2d_pose_y = msg.pose.pose.position.y
         self.robot_2d_theta = theta
+        self.robot_2d_velocity = abs(msg.twist.twist.linear.x)
+        self.odom_history.update(self.robot_2d_pose_x, self.robot_2d_pose_y, theta, rospy.get_time())
 
         d_theta = self.robot_2d_theta - self.previous_robot_2d_theta
         if d_theta > math.pi:
@@ -265,8 +338,16 @@ class PBVSAction():
         self._action_name = name
         self._as = actionlib.SimpleActionServer(self._action_name, forklift_server.msg.PBVSMegaposeAction, execute_cb=self.execute_callback, auto_start = False)
         self._result = forklift_server.msg.PBVSResult()
+        self.PBVS = None
+        self._as.register_preempt_callback(self.preempt_callback)
         self._as.start()
 
+    def preempt_callback(self):
+        # cancel 一收到就先停車與牙叉, sequence 在下一個步驟邊界結束
+        rospy.logwarn('PBVS cancel requested')
+        if self.PBVS is not None:
+            self.PBVS.fnStopMotion()
+
     def execute_callback(self, msg):
         # rospy.loginfo('Received goal: Command={}, layer_dist={}'.format(self.command, self.layer_dist))
         rospy.logwarn('PBVS receive command : %s' % (msg))
@@ -274,32 +355,36 @@ class PBVSAction():
 
         if(msg.command == "parking_bodycamera"):
             self.subscriber.shelf_or_pallet = False  # True: pallet, False: shelf
-            self.PBVS.parking_bodycamera()
+            outcome = self.PBVS.parking_bodycamera()
         elif(msg.command == "parking_forkcamera"):
             self.subscriber.shelf_or_pallet = True  # True: pallet, False: shelf
-            self.PBVS.parking_forkcamera()
+            outcome = self.PBVS.parking_forkcamera()
         elif(msg.command == "raise_pallet"):
             self.subscriber.shelf_or_pallet = False
-            self.PBVS.raise_pallet()
+            outcome = self.PBVS.raise_pallet()
         elif(msg.command == "drop_pallet"):
             self.subscriber.shelf_or_pallet = False
-            self.PBVS.drop_pallet()
+            outcome = self.PBVS.drop_pallet()
         elif(msg.command == "odom_front"):
             self.subscriber.shelf_or_pallet = False
-            self.PBVS.odom_front()
+            outcome = self.PBVS.odom_front()
         elif(msg.command == "odom_turn"):
             self.subscriber.shelf_or_pallet = False
-            self.PBVS.odom_turn()
+            outcome = self.PBVS.odom_turn()
+        elif(msg.command == "pre_position_fork"):
+            outcome = self.PBVS.pre_position_fork()
+        elif(msg.command in self.PBVS.sequences):  # config/PBVS_sequences_megapose.yaml 新增的 sequence
+            self.subscriber.shelf_or_pallet = False
+            outcome = self.PBVS.run_sequence(msg.command)
         else:
             rospy.logwarn("Unknown command")
             self._result.result = 'fail'
             self._as.set_aborted(self._result)
+            self.PBVS = None
             return
-        
-        rospy.logwarn('PBVS Succeeded')
-        self._result.result = 'PBVS Succeeded'
+
         # self.shelf_or_pallet = False
-        self._as.set_succeeded(self._result)
+        set_goal_result(self._as, self._result, outcome)
         self.PBVS = None
 
 
@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 多台車共用的路徑保留表, 單機測試時代替車隊 coordinator
+import rospy
+import math
+import threading
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyReservation import ReservationTable
+from forklift_server.srv import TopologyReserve, TopologyReserveResponse
+
+
+class ReservationServer():
+    def __init__(self):
+        self.table = ReservationTable()
+        self.lock = threading.Lock()
+        service = rospy.get_param(rospy.get_name() + "/service", "/topology_reservation")
+        self.service = rospy.Service(service, TopologyReserve, self.cbReserve)
+        self.expire_timer = rospy.Timer(rospy.Duration(1.0), self.cbExpire)
+
+    def cbReserve(self, req):
+        now = rospy.get_time()
+        with self.lock:
+            if req.command == "release":
+                self.table.release(req.robot)
+                return TopologyReserveResponse(success=True, depart=now, message="released")
+            elif req.command == "query":
+                reservations = self.table.others(req.robot)
+                resources, start, end = [list(r) for r in zip(*reservations)] if reservations else ([], [], [])
+                return TopologyReserveResponse(success=True, depart=now, message="%d reservations" % len(reservations),
+                                               resources=resources, start=start, end=end)
+            elif req.command != "reserve":
+                return TopologyReserveResponse(success=False, depart=now, message="unknown command %s" % req.command)
+
+            windows = list(zip(req.resources, req.start, req.end))
+            max_wait = req.max_wait if req.max_wait > 0 else math.inf
+            depart = self.table.schedule(req.robot, windows, now, max_wait)
+            if depart is None:
+                rospy.logwarn("%s: no conflict-free departure within %.1f s" % (req.robot, req.max_wait))
+                return TopologyReserveResponse(success=False, depart=now, message="no conflict-free departure")
+            self.table.reserve(req.robot, windows, depart, now)
+        rospy.loginfo("%s reserved %d windows, depart in %.2f s" % (req.robot, len(windows), depart - now))
+        return TopologyReserveResponse(success=True, depart=depart, message="reserved")
+
+    def cbExpire(self, event):
+        with self.lock:
+            self.table.expire(rospy.get_time())
+
+
+if __name__ == '__main__':
+    rospy.init_node('Reservation_server')
+    rospy.logwarn(rospy.get_name() + " started")
+    server = ReservationServer()
+    rospy.spin()
@@ -3,28 +3,152 @@
 import rospy
 import actionlib
 from move_base_msgs.msg import MoveBaseAction, MoveBaseGoal
+from actionlib_msgs.msg import GoalStatus
 import forklift_server.msg
 from geometry_msgs.msg import PoseStamped
 from nav_msgs.msg import Odometry
 from geometry_msgs.msg import Twist, Pose
 from visualization_msgs.msg import Marker
 import tf2_ros
-import heapq
 import math
+import threading
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyRouteTable import RouteTable
+from TopologyReservation import path_windows, ReservationPenalty
+from forklift_server.srv import TopologyEdge, TopologyEdgeResponse, TopologyReserve
 
 
 
 class TopologyMap():
-    def __init__(self, start_node):
+    def __init__(self, start_node, graph):
         # self.start_node  = input("輸入起始點: ")     
         self.start_node  = start_node
-
-    def path(self, goal):
+        self.planner = rospy.get_param(rospy.get_name() + "/planner", "table")  # table, astar, dijkstra
+        self.expanded = 0
+        self.lock = threading.Lock()  # 路徑查詢與線上改邊在不同 thread
+        self.weight_overrides = {}  # 線上修改過權重的邊 (start, goal) -> 權重, graph 重建後重新套用
+        self.route_table = None
+        self.update_graph(graph)
+
+    def update_graph(self, graph):
+        # 啟動時一次建立所有起點的路徑表; 節點超過 route_table_prebuild_limit 時先開始接受 goal, 所有起點由背景 thread 建立
+        prebuild_limit = rospy.get_param(rospy.get_name() + "/route_table_prebuild_limit", 2000)
+        start_time = rospy.get_time()
+        route_table = RouteTable(graph, prebuild = len(graph) <= prebuild_limit)
+        with self.lock:
+            self.reapply_edges(route_table)
+            self.route_table = route_table
+        if len(route_table.rows) < len(route_table):
+            rospy.loginfo("Route table for %d nodes is built in background" % len(route_table))
+            threading.Thread(target=self.build_rows, args=(route_table,), daemon=True).start()
+        else:
+            rospy.loginfo("Route table built for %d nodes in %.3f s" % (len(self.route_table), rospy.get_time() - start_time))
+        self.check_heuristic()
+
+    def build_rows(self, route_table):
+        # 每建立一個起點就釋放 lock, 查詢與線上改邊不必等整張表 (尚未建立的起點在查詢時建立); graph 重建後停止
+        start_time = rospy.get_time()
+        for source in range(len(route_table)):
+            with self.lock:
+                if route_table is not self.route_table or rospy.is_shutdown():
+                    return
+                route_table.row(source)
+        rospy.loginfo("Route table built for %d nodes in %.3f s" % (len(route_table), rospy.get_time() - start_time))
+
+    def reapply_edges(self, route_table):
+        # graph 參數重建路徑表時保留 TopologyEdge 服務的修改: 先套用權重, 再封閉邊 (解除封閉時回到修改後的權重)
+        if self.route_table is None:
+            return
+        edits = [("weight", edge, weight) for edge, weight in self.weight_overrides.items()]
+        edits += [("block", edge, None) for edge in self.route_table.blocked]
+        for command, (start, goal), weight in edits:
+            try:
+                if command == "weight":
+                    route_table.set_weight(start, goal, weight)
+                else:
+                    route_table.block_edge(start, goal)
+            except KeyError as e:
+                rospy.logwarn("%s %s -> %s discarded after graph change: %s" % (command, start, goal, e))
+                if command == "weight":
+                    del self.weight_overrides[(start, goal)]
+
+    def check_heuristic(self):
+        # A* 以 waypoints 的 x, y 歐氏距離為 heuristic, 縮放到不超過邊權重才保證最短路徑
+        self.heuristic_scale = 0.0
+        if self.planner != "astar":
+            return
+        missing = [node for node in self.route_table.nodes if node not in waypoints]
+        if missing:
+            rospy.logwarn("waypoints missing for %s, A* falls back to Dijkstra" % missing)
+            return
+        consistent_scale = self.route_table.consistent_heuristic_scale(waypoints)
+        scale = rospy.get_param(rospy.get_name() + "/astar_heuristic_scale", -1.0)
+        if scale < 0:
+            scale = consistent_scale
+        elif scale > consistent_scale:
+            rospy.logwarn("astar_heuristic_scale %.3f is not consistent with edge weights, use %.3f" % (scale, consistent_scale))
+            scale = consistent_scale
+        self.heuristic_scale = scale
+        rospy.loginfo("A* heuristic scale %.3f" % self.heuristic_scale)
+
+    def path(self, goal, penalty = None):
         print("Path from {} to {}:".format(self.start_node, goal))
-        self.parent, self.distance=self.dijkstra(graph,self.start_node)
-        path=self.distance_path(graph,self.start_node,goal)
-        self.start_node = goal
+        with self.lock:
+            self.expanded = 0
+            path = self.leg(self.start_node, goal, penalty)
+        if path:
+            self.start_node = goal
         return path
+
+    def tour(self, stops, ordered, penalty = None):
+        # 多個停靠點一次規劃, 回傳 (拜訪順序, 串接後的完整路徑, 每個停靠點在路徑中的 index)
+        with self.lock:
+            self.expanded = 0
+            if not ordered:
+                exact_limit = rospy.get_param(rospy.get_name() + "/tour_exact_limit", 10)
+                stops = self.route_table.visit_order(self.start_node, stops, exact_limit)
+            path = [self.start_node]
+            arrivals = []
+            for goal in stops:
+                if penalty is not None:
+                    penalty.offset = sum(self.route_table.weight(a, b) for a, b in zip(path, path[1:]))
+                leg = self.leg(path[-1], goal, penalty)
+                if not leg:
+                    return stops, [], []
+                path += leg[1:]
+                arrivals.append(len(path) - 1)
+            rospy.loginfo("Tour %s cost %.2f" % (stops, self.route_table.route_cost(self.start_node, stops)))
+        self.start_node = path[-1]
+        return stops, path, arrivals
+
+    def leg(self, start, goal, penalty = None):
+        # penalty (其他車的路徑保留) 會改變邊的成本, 不能使用預先建立的路徑表, 改為單次搜尋
+        if self.planner == "table" and penalty is None:
+            return self.route_table.path(start, goal)
+        path, expanded = self.route_table.astar(start, goal, waypoints, self.heuristic_scale, penalty)
+        rospy.loginfo("%s expanded %d nodes" % (self.planner, expanded))
+        self.expanded += expanded
+        return path
+
+    def update_edge(self, command, start, goal, weight = math.inf):
+        # 封閉/解除/修改一條邊, 路徑表只修補受影響的起點
+        with self.lock:
+            if command == "block":
+                repaired = self.route_table.block_edge(start, goal)
+            elif command == "unblock":
+                repaired = self.route_table.unblock_edge(start, goal)
+            elif command == "weight":
+                repaired = self.route_table.set_weight(start, goal, weight)
+                self.weight_overrides[(start, goal)] = weight
+            else:
+                raise ValueError("unknown command %s" % command)
+        self.check_heuristic()  # 權重變小可能讓原本的 scale 不再 consistent
+        return repaired
    
 
     # def find_point(self, goal):
@@ -33,47 +157,6 @@ class TopologyMap():
     #         if x == waypoints[i][0] and y == waypoints[i][1] and z == waypoints[i][2] and w == waypoints[i][3]:
     #             return i
 
-    # 初始化起点的距离  到自身为零 到其他节点为无穷大
-    def init_distance(self, graph,s): #传入图像 和起点
-        self.distance={s:0}
-        for vertex in graph:
-            if vertex !=s:
-                self.distance[vertex]=math.inf  #除到本身都为无穷大
-        return self.distance
-    def dijkstra(self,graph,s):
-        pqueue=[]     #创建一个队列
-        # 先添加一个起点到队列 和后面加入的排序  
-        # 此方法把 队列里面的元素按照优先排列 调用heapop时返回优先级最高的   比如数值最小的
-        heapq.heappush(pqueue,(0,s))  
-        seen=set() #储存出现过的点
-        self.parent={s:None}   #标记此节点的上一个节点  此节点为起点 则父节点为None  
-        self.distance=self.init_distance(graph,s)
-
-        while (len(pqueue)>0):
-            pair=heapq.heappop(pqueue)  #返回一个数值最小的元组 
-            dist=pair[0]  #提取距离
-            vertex=pair[1] #提取节点
-            seen.add(vertex) #添加出现过的节点
-            nodes=graph[vertex].keys()   #提取与vertex相连的节点
-            # print(nodes)
-            #核心算法
-            for w in nodes:
-                if w not in seen:
-                    if dist+graph[vertex][w]<self.distance[w]:
-                        #把路径短的添加到队列 并排序
-                        heapq.heappush(pqueue,(dist+graph[vertex][w],w))
-                        self.parent[w]=vertex  #记录父节点
-                        self.distance[w]=dist+graph[vertex][w] #更新起点到w节点的距离
-        return self.parent,self.distance
-    def distance_path(self,graph,s,end):
-        self.parent, self.distance = self.dijkstra(graph, s)
-        path=[end]  
-        while self.parent[end] !=None:
-            path.append(self.parent[end])
-            end=self.parent[end]
-        path.reverse()  
-        return path
-
 class Navigation():
     def __init__(self):
         # odom = rospy.get_param(rospy.get_name() + "/odom", "/odom")
@@ -104,12 +187,36 @@ class Navigation():
         else:
             return self.client.get_result()
 
+    def send(self, x, y, z, w):
+        # 只送出目標不等待, 供 goal chaining 使用
+        goal = MoveBaseGoal()
+        goal.target_pose.header.frame_id = "map"
+        goal.target_pose.header.stamp = rospy.Time.now()
+        goal.target_pose.pose.position.x = x
+        goal.target_pose.pose.position.y = y
+        goal.target_pose.pose.orientation.z = z
+        goal.target_pose.pose.orientation.w = w
+        self.client.send_goal(goal)
+
+    def wait_near(self, x, y, radius):
+        # 進入目標 radius 範圍內或 move_base 結束即返回, 回傳是否已結束
+        r = rospy.Rate(20)
+        while not rospy.is_shutdown():
+            if self.client.get_state() not in (GoalStatus.PENDING, GoalStatus.ACTIVE):
+                return True
+            if self.rx is not None and math.hypot(self.rx - x, self.ry - y) < radius:
+                return False
+            r.sleep()
+        return True
+
     def init_param(self):    
         self.trigger = True
         self.pre_odom = 0.0
         self.odom_pass = 0.0
+        self.rx, self.ry = None, None
     
     def get_pose(self, msg):
+        self.rx, self.ry = msg.position.x, msg.position.y
         self.rz, self.rw = msg.orientation.z, msg.orientation.w
         yaw_r = math.atan2(2 * self.rw * self.rz, self.rw * self.rw - self.rz * self.rz)
         if(yaw_r < 0):
@@ -178,9 +285,16 @@ class TopologyMapAction():
     def __init__(self, name):
         self._action_name = name        
         self.init_param()
-        self.TopologyMap = TopologyMap(self.start_node)      
+        self.TopologyMap = TopologyMap(self.start_node, graph)      
         self.Navigation = Navigation()
+        self.graph_timer = rospy.Timer(rospy.Duration(self.graph_check_period), self.cbCheckGraph)
+        self.edge_service = rospy.Service(rospy.get_name() + "/edge", TopologyEdge, self.cbEdge)
         self._as = actionlib.SimpleActionServer(self._action_name, forklift_server.msg.TopologyMapAction, execute_cb=self.execute_cb, auto_start = False)
+        # 路徑表與 action server 建立後才登記目前所在位置, 登記完成才接受 goal
+        if self.reservation and not self.reserve_path([self.start_node]):
+            rospy.logerr("%s cannot reserve start node %s" % (self.robot_name, self.start_node))
+            rospy.signal_shutdown("start node reservation failed")
+            return
         self._as.start()
 
     def init_param(self):
@@ -189,36 +303,210 @@ class TopologyMapAction():
         self.start_node = rospy.get_param(rospy.get_name() + "/start_node", "LD3")
         waypoints = rospy.get_param(rospy.get_name() + "/waypoints")
         graph = rospy.get_param(rospy.get_name() + "/graph")
+        self.graph_check_period = rospy.get_param(rospy.get_name() + "/graph_check_period", 1.0)
+        self.graph_version = rospy.get_param(rospy.get_name() + "/graph_version", 0)
+        self.pipelined = rospy.get_param(rospy.get_name() + "/pipelined", False)
+        self.chain_radius = rospy.get_param(rospy.get_name() + "/chain_radius", 0.5)
+        self.leg_delay = rospy.get_param(rospy.get_name() + "/leg_delay", 1.0)
+        # 多台車共用路徑保留表
+        self.reservation = rospy.get_param(rospy.get_name() + "/reservation", False)
+        self.robot_name = rospy.get_param(rospy.get_name() + "/robot_name", rospy.get_namespace().strip("/") or rospy.get_name())
+        self.reservation_time_per_weight = rospy.get_param(rospy.get_name() + "/reservation_time_per_weight", 1.0)  # 每單位邊權重預估行駛秒數
+        self.reservation_margin = rospy.get_param(rospy.get_name() + "/reservation_margin", 2.0)
+        self.reservation_max_wait = rospy.get_param(rospy.get_name() + "/reservation_max_wait", 60.0)
+        self.reservation_timeout = rospy.get_param(rospy.get_name() + "/reservation_timeout", 120.0)
+        if self.reservation:
+            service = rospy.get_param(rospy.get_name() + "/reservation_service", "/topology_reservation")
+            rospy.wait_for_service(service)
+            self.reserve_client = rospy.ServiceProxy(service, TopologyReserve)
+            rospy.on_shutdown(lambda: self.reserve_client("release", self.robot_name, [], [], [], 0.0))
         self.last_target_pose = None
+
+    def cbCheckGraph(self, event):
+        # 修改 graph 參數後需同時改變 graph_version, 這裡只比對版本, 版本改變才讀入 graph 重建路徑表
+        # (只改邊的權重或封閉請用 ~edge 服務)
+        global graph
+        version = rospy.get_param(rospy.get_name() + "/graph_version", self.graph_version)
+        if version == self.graph_version:
+            return
+        rospy.logwarn("graph_version %s -> %s, rebuild route table" % (self.graph_version, version))
+        self.graph_version = version
+        graph = rospy.get_param(rospy.get_name() + "/graph", graph)
+        self.TopologyMap.update_graph(graph)
+
+    def cbEdge(self, req):
+        edges = [(req.from_node, req.to_node)]
+        if req.bidirectional:
+            edges.append((req.to_node, req.from_node))
+        start_time = rospy.get_time()
+        repaired = 0
+        try:
+            for start, goal in edges:
+                repaired += self.TopologyMap.update_edge(req.command, start, goal, req.weight)
+        except (KeyError, ValueError) as e:
+            rospy.logwarn("edge %s failed: %s" % (req.command, e))
+            return TopologyEdgeResponse(False, str(e))
+        message = "%s %s, repaired %d route trees in %.3f ms" % (req.command, edges, repaired, (rospy.get_time() - start_time) * 1e3)
+        rospy.loginfo(message)
+        return TopologyEdgeResponse(True, message)
         
 
+    def reservation_penalty(self):
+        # 規劃前向 coordinator 取得其他車目前的保留, 路徑避開或延後通過已被保留的節點與走道; 沒有保留時使用路徑表
+        res = self.reserve_client("query", self.robot_name, [], [], [], 0.0)
+        if not res.success or not res.resources:
+            return None
+        now = rospy.get_time()
+        reservations = [(resource, start - now, end - now) for resource, start, end in zip(res.resources, res.start, res.end)]
+        return ReservationPenalty(reservations, waypoints, self.reservation_time_per_weight, self.node_delay(), self.reservation_margin)
+
+    def node_delay(self):
+        # 非 pipelined 模式每個節點出發前等待 leg_delay
+        return 0.0 if self.pipelined else self.leg_delay
+
+    def reserve_path(self, path):
+        # 向 coordinator 保留整條路徑的時段, 等到分配的出發時間才開始走; 終點保留到下一次規劃
+        # 每段時間包含出發前的 leg_delay, 第一段另加在起點的 leg_delay
+        durations = [self.TopologyMap.route_table.weight(a, b) * self.reservation_time_per_weight + self.node_delay()
+                     for a, b in zip(path, path[1:])]
+        if durations:
+            durations[0] += self.node_delay()
+        windows = path_windows(path, waypoints, durations, self.reservation_margin)
+        resources, start, end = [list(w) for w in zip(*windows)]
+        deadline = rospy.get_time() + self.reservation_timeout
+        while not rospy.is_shutdown():
+            res = self.reserve_client("reserve", self.robot_name, resources, start, end, self.reservation_max_wait)
+            if res.success:
+                break
+            if rospy.get_time() > deadline:
+                return False
+            self.publish_reservation_feedback('waiting for reservation: %s' % res.message)
+            rospy.sleep(1.0)
+        if rospy.is_shutdown():
+            return False
+        wait = res.depart - rospy.get_time()
+        if wait > 0:
+            rospy.loginfo('%s wait %.2f s for reserved departure' % (self.robot_name, wait))
+            self.publish_reservation_feedback('wait %.2f s for reserved departure' % wait)
+            rospy.sleep(wait)
+        return True
+
+    def publish_reservation_feedback(self, message):
+        # 啟動時登記起點還沒有 goal, 只記錄 log
+        if self._as.is_active():
+            self._feedback.feedback = str(message)
+            self._as.publish_feedback(self._feedback)
+        else:
+            rospy.loginfo(message)
+
+    def same_position(self, a, b):
+        return waypoints[a][0] == waypoints[b][0] and waypoints[a][1] == waypoints[b][1]
+
+    def follow_path(self, path, arrivals = ()):
+        # 接近目前節點 chain_radius 內就送出下一個節點的 MoveBaseGoal, 中間節點不停車
+        # 原地旋轉 (前後節點座標相同), 停靠點 (arrivals 中的 index) 或最後一個節點才等 move_base 完成
+        leg_start = rospy.get_time()
+        pending = False
+        for i in range(len(path)):
+            x, y, z, w = waypoints[path[i]][0:4]
+            self._feedback.remaining_legs = len(path) - 1 - i
+            if i > 0 and self.same_position(path[i-1], path[i]):
+                if pending:
+                    self.Navigation.client.wait_for_result()
+                    pending = False
+                rospy.loginfo('self_spin from %s to %s' % (path[i-1], path[i]))
+                self._feedback.feedback = str('self_spin from %s to %s' % (path[i-1], path[i]))
+                self._as.publish_feedback(self._feedback)
+                self.Navigation.self_spin(z, w)
+            else:
+                rospy.loginfo('Navigation to %s' % path[i])
+                self._feedback.feedback = str('Navigation to %s' % path[i])
+                self._as.publish_feedback(self._feedback)
+                self.Navigation.send(x, y, z, w)
+                pending = True
+                if i not in arrivals and i + 1 < len(path) and not self.same_position(path[i], path[i+1]):
+                    pending = not self.Navigation.wait_near(x, y, self.chain_radius)
+                else:
+                    self.Navigation.client.wait_for_result()
+                    pending = False
+            now = rospy.get_time()
+            self._feedback.feedback = str('leg %s %.2f s' % (path[i], now - leg_start))
+            self._as.publish_feedback(self._feedback)
+            leg_start = now
+        if pending:
+            self.Navigation.client.wait_for_result()
+
     def execute_cb(self, msg):
         rospy.loginfo('TopologyMap receive command : %s' % (msg))
-        if msg.goal != "" or (msg.target_name != "" and msg.target_pose == None):
-            if msg.goal != "":
-                path = self.TopologyMap.path(msg.goal)
+        self._result.visit_order = []
+        self._feedback.remaining_legs = -1
+        arrivals = ()
+        if msg.stops or msg.goal != "" or (msg.target_name != "" and msg.target_pose == None):
+            penalty = self.reservation_penalty() if self.reservation else None
+            reserved = None
+            if msg.stops:
+                stops, path, arrivals = self.TopologyMap.tour(msg.stops, msg.ordered, penalty)
+                print(stops, path)
+                self._result.visit_order = list(stops)
+                self._feedback.feedback = str('visit order %s, path %s' % (stops, path))
+                self._as.publish_feedback(self._feedback)
+                if not path:
+                    rospy.logerr('No path from %s through %s' % (self.TopologyMap.start_node, stops))
+                    self._result.result = 'fail'
+                    self._as.set_aborted(self._result)
+                    return
+            elif msg.goal != "":
+                path = self.TopologyMap.path(msg.goal, penalty)
                 print(path)
+                self._feedback.feedback = str('%s path %s, expanded %d nodes' % (self.TopologyMap.planner, path, self.TopologyMap.expanded))
+                self._as.publish_feedback(self._feedback)
+                if not path:
+                    rospy.logerr('No path from %s to %s' % (self.TopologyMap.start_node, msg.goal))
+                    self._result.result = 'fail'
+                    self._as.set_aborted(self._result)
+                    return
             elif msg.target_name != "":
                 path = [msg.target_name]
-
-            for i in range(len(path)):
-                rospy.sleep(1.0)
-                if (i > 0 and (waypoints[path[i]][0] == waypoints[path[i-1]][0] and waypoints[path[i]][1] == waypoints[path[i-1]][1])):
-                    rospy.loginfo('self_spin from %s to %s' %
-                                  (path[i-1], path[i]))
-                    self._feedback.feedback = str('self_spin from %s to %s' %(path[i-1], path[i]))
-                    self._as.publish_feedback(self._feedback)
-                    # rospy.loginfo('self_spin from %s to %s' % (path[i-1], path[i]))
-                    self.Navigation.self_spin(
-                        waypoints[path[i]][2], waypoints[path[i]][3])
-                    i = i + 1
-                    continue
-                else:
-                    rospy.loginfo('Navigation to %s' % path[i])
-                    self._feedback.feedback = str('Navigation to %s' % path[i])
-                    self._as.publish_feedback(self._feedback)
-                    self.Navigation.move(
-                        waypoints[path[i]][0], waypoints[path[i]][1], waypoints[path[i]][2], waypoints[path[i]][3])
+                if self.reservation:
+                    # 直接以 move_base 前往 target, 保留拓樸圖上從目前節點到 target 的路徑經過的位置與走道
+                    start_node = self.TopologyMap.start_node
+                    reserved = self.TopologyMap.path(msg.target_name, penalty)
+                    if not reserved:
+                        rospy.logerr('No path from %s to %s to reserve' % (start_node, msg.target_name))
+                        self._result.result = 'fail'
+                        self._as.set_aborted(self._result)
+                        return
+            reserved = reserved or path
+
+            if self.reservation and not self.reserve_path(reserved):
+                rospy.logerr('No conflict-free reservation for %s' % reserved)
+                self.TopologyMap.start_node = reserved[0]
+                self._result.result = 'fail'
+                self._as.set_aborted(self._result)
+                return
+
+            if self.pipelined:
+                self.follow_path(path, arrivals)
+            else:
+                for i in range(len(path)):
+                    rospy.sleep(self.leg_delay)
+                    self._feedback.remaining_legs = len(path) - 1 - i
+                    if (i > 0 and (waypoints[path[i]][0] == waypoints[path[i-1]][0] and waypoints[path[i]][1] == waypoints[path[i-1]][1])):
+                        rospy.loginfo('self_spin from %s to %s' %
+                                      (path[i-1], path[i]))
+                        self._feedback.feedback = str('self_spin from %s to %s' %(path[i-1], path[i]))
+                        self._as.publish_feedback(self._feedback)
+                        # rospy.loginfo('self_spin from %s to %s' % (path[i-1], path[i]))
+                        self.Navigation.self_spin(
+                            waypoints[path[i]][2], waypoints[path[i]][3])
+                        i = i + 1
+                        continue
+                    else:
+                        rospy.loginfo('Navigation to %s' % path[i])
+                        self._feedback.feedback = str('Navigation to %s' % path[i])
+                        self._as.publish_feedback(self._feedback)
+                        self.Navigation.move(
+                            waypoints[path[i]][0], waypoints[path[i]][1], waypoints[path[i]][2], waypoints[path[i]][3])
                 
 
         elif msg.target_pose != None:
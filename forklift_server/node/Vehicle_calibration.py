@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+import rospy
+import tf
+import threading
+from geometry_msgs.msg import Twist
+from nav_msgs.msg import Odometry
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from ekf import body_delta
+from VehicleCalibration import sweep_levels, fit_deadband, profile_fields, write_profile
+from VehicleProfile import profile_path
+
+# 自動量測致動器死區與增益, 取代 car_test.py 手動調整 min_forward / min_rotate
+# 直接發布 /cmd_vel (不經過 PBVS 的 CmdVel), 每個命令維持 hold 秒, 以 settle 秒之後的 /odom 位移計算穩態速度
+# 結果寫入 config/vehicle_<vehicle>.yaml, PBVS 的 load_profile 下次啟動時載入
+# 執行時車體前後需淨空約 linear_max * hold 公尺, 並可原地旋轉
+
+
+class Calibration():
+    def __init__(self):
+        self.vehicle = rospy.get_param(rospy.get_name() + "/vehicle", "forklift")
+        self.odom_topic = rospy.get_param(rospy.get_name() + "/odom", "/odom")
+        self.cmd_vel_topic = rospy.get_param(rospy.get_name() + "/cmd_vel", "/cmd_vel")
+        self.linear_max = rospy.get_param(rospy.get_name() + "/linear_max", 0.3)
+        self.angular_max = rospy.get_param(rospy.get_name() + "/angular_max", 0.5)
+        self.steps = rospy.get_param(rospy.get_name() + "/steps", 10)
+        self.hold = rospy.get_param(rospy.get_name() + "/hold", 2.0)
+        self.settle = rospy.get_param(rospy.get_name() + "/settle", 0.8)
+        self.pause = rospy.get_param(rospy.get_name() + "/pause", 1.0)
+        self.rate = rospy.get_param(rospy.get_name() + "/rate", 20.0)
+        self.linear_moving = rospy.get_param(rospy.get_name() + "/linear_moving", 0.005)
+        self.angular_moving = rospy.get_param(rospy.get_name() + "/angular_moving", 0.01)
+        self.margin = rospy.get_param(rospy.get_name() + "/margin", 1.1)
+        self.output = rospy.get_param(rospy.get_name() + "/output", profile_path(self.vehicle))
+
+        self.lock = threading.Lock()
+        self.pose = None
+        self.recording = False
+        self.pub_cmd_vel = rospy.Publisher(self.cmd_vel_topic, Twist, queue_size=1)
+        rospy.Subscriber(self.odom_topic, Odometry, self.cbGetRobotOdom, queue_size=10)
+        rospy.on_shutdown(self.fnStop)
+
+    def cbGetRobotOdom(self, msg):
+        quaternion = (msg.pose.pose.orientation.x, msg.pose.pose.orientation.y, msg.pose.pose.orientation.z, msg.pose.pose.orientation.w)
+        theta = tf.transformations.euler_from_quaternion(quaternion)[2]
+        stamp = msg.header.stamp.to_sec() if not msg.header.stamp.is_zero() else rospy.get_time()
+        pose = (stamp, msg.pose.pose.position.x, msg.pose.pose.position.y, theta)
+        with self.lock:
+            if self.recording and self.pose is not None:
+                # 逐筆累加車體座標的位移, 旋轉超過 180 度也不會折返
+                dx, _, dtheta = body_delta(self.pose, pose)
+                self.distance += dx
+                self.rotation += dtheta
+                self.recorded = pose[0] - self.record_start
+            self.pose = pose
+
+    def fnStop(self):
+        self.pub_cmd_vel.publish(Twist())
+
+    def fnStartRecording(self):
+        with self.lock:
+            self.distance = 0.0
+            self.rotation = 0.0
+            self.recorded = 0.0
+            self.record_start = self.pose[0]
+            self.recording = True
+
+    def fnMeasure(self, axis, command):
+        # 維持命令 hold 秒, 回傳 settle 秒之後的平均速度 (m/s 或 rad/s, 與命令同號)
+        twist = Twist()
+        if axis == 'linear':
+            twist.linear.x = command
+        else:
+            twist.angular.z = command
+        rate = rospy.Rate(self.rate)
+        start = rospy.get_time()
+        while not rospy.is_shutdown() and rospy.get_time() - start < self.hold:
+            if not self.recording and rospy.get_time() - start >= self.settle:
+                self.fnStartRecording()
+            self.pub_cmd_vel.publish(twist)
+            rate.sleep()
+        with self.lock:
+            self.recording = False
+            motion = self.distance if axis == 'linear' else self.rotation
+            recorded = self.recorded
+        self.fnStop()
+        rospy.sleep(self.pause)
+        if recorded <= 0:
+            raise RuntimeError('no odometry from {} while calibrating'.format(self.odom_topic))
+        return motion / recorded
+
+    def fnSweep(self, axis, maximum, moving):
+        # 由小到大正反交替掃過命令, 回傳 fit_deadband 的結果與原始樣本
+        commands, speeds = [], []
+        for command in sweep_levels(maximum, self.steps):
+            if rospy.is_shutdown():
+                break
+            speed = self.fnMeasure(axis, command)
+            rospy.loginfo("{} command {:.3f} -> {:.4f}".format(axis, command, speed))
+            commands.append(command)
+            speeds.append(speed)
+        samples = [[round(c, 4), round(v, 4)] for c, v in zip(commands, speeds)]
+        try:
+            result = fit_deadband(commands, speeds, moving)
+        except ValueError as e:
+            rospy.logwarn("{} calibration failed: {}".format(axis, e))
+            return None, samples
+        rospy.loginfo("{} deadband {:.4f}, gain {:.3f}, residual {:.4f}".format(axis, *result))
+        return result, samples
+
+    def run(self):
+        while not rospy.is_shutdown() and self.pose is None:
+            rospy.loginfo_throttle(5.0, "waiting for {}".format(self.odom_topic))
+            rospy.sleep(0.1)
+        linear, linear_samples = self.fnSweep('linear', self.linear_max, self.linear_moving)
+        angular, angular_samples = self.fnSweep('angular', self.angular_max, self.angular_moving)
+        if rospy.is_shutdown():
+            return
+        fields = profile_fields(linear, angular, self.margin)
+        if not fields:
+            rospy.logerr("calibration failed, {} not written".format(self.output))
+            return
+        write_profile(self.output, self.vehicle, fields, {'linear': linear_samples, 'angular': angular_samples})
+        rospy.loginfo("vehicle profile {}: {}".format(self.output, fields))
+
+
+if __name__ == "__main__":
+    rospy.init_node("Vehicle_calibration")
+    Calibration().run()
@@ -1,81 +1,102 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 import rospy
-import actionlib
 import forklift_server.msg
 import apriltag_ros.msg
 
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from ActionClientPool import ActionClientPool, CommandExecutor
+
 def PBVS_client(msg):
-    client = actionlib.SimpleActionClient('PBVS_server', forklift_server.msg.PBVSAction)
-    client.wait_for_server()
     command = forklift_server.msg.PBVSGoal(command=msg)
     # print("send ", command)
-    client.send_goal(command)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('PBVS', command, "PBVS " + msg).wait()
 
 def TopologyMap_client(msg):
-    client = actionlib.SimpleActionClient('TopologyMap_server', forklift_server.msg.TopologyMapAction)
-    client.wait_for_server()
-    goal = forklift_server.msg.TopologyMapGoal(goal=msg)
+    if isinstance(msg[1], list):
+        # ['TopologyMap', [stop, ...], ordered]: 多個停靠點一次規劃, 未給 ordered 時依序拜訪
+        goal = forklift_server.msg.TopologyMapGoal(stops=msg[1], ordered=bool(msg[2]) if len(msg) > 2 else True)
+    else:
+        goal = forklift_server.msg.TopologyMapGoal(goal=msg[1])
     # print("send ", goal)
-    client.send_goal(goal)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('TopologyMap', goal, "TopologyMap %s" % msg[1]).wait()
 
 def AprilTag_up_client(msg):
-    client = actionlib.SimpleActionClient('AprilTag_up_server', apriltag_ros.msg.AprilTagAction)
-    client.wait_for_server()
     goal = apriltag_ros.msg.AprilTagGoal(goal=msg)
     # print("send ", goal)
-    client.send_goal(goal)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('AprilTag_up', goal, "AprilTag_up %s" % msg).wait()
 
 def AprilTag_down_client(msg):
-    client = actionlib.SimpleActionClient('AprilTag_down_server', apriltag_ros.msg.AprilTagAction)
-    client.wait_for_server()
     goal = apriltag_ros.msg.AprilTagGoal(goal=msg)
     # print("send ", goal)
-    client.send_goal(goal)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('AprilTag_down', goal, "AprilTag_down %s" % msg).wait()
+
+def execute(msg):
+    start_time = rospy.get_time()
+    if(msg[0] == 'PBVS'):
+        rospy.logwarn("send PBVS: %s", msg[1])
+        if(msg[1] == 'parking_bodycamera' or msg[1] == 'drop_pallet'):
+            result = AprilTag_up_client(True)
+            print("AprilTag_up_client result ", result)
+            result = PBVS_client(msg[1])
+            print("PBVS_client result ", result)
+            result = AprilTag_up_client(False)
+            print("AprilTag_up_client result ", result)
+
+        elif(msg[1] == 'parking_forkcamera' or msg[1] == 'raise_pallet'):
+            result = AprilTag_down_client(True)
+            print("AprilTag_down_client result ", result)
+            result = PBVS_client(msg[1])
+            print("PBVS_client result ", result)
+            result = AprilTag_down_client(False)
+            print("AprilTag_down_client result ", result)
+
+    elif(msg[0] == 'TopologyMap'):
+        rospy.logwarn("send TopologyMap: %s", msg[1])
+        result = TopologyMap_client(msg)
+        print("TopologyMap result ", result)
+
+    elif(msg[0] == 'parallel'):
+        # ['parallel', [command, command, ...]]: 同時執行, 全部完成才進行下一個指令
+        rospy.logwarn("send parallel: %s", msg[1])
+        executor.parallel([lambda m=m: execute(m) for m in msg[1]])
+    else:
+        print("error command: ", msg)
+    rospy.loginfo("command %s took %.2f s" % (msg, rospy.get_time() - start_time))
 
 if __name__ == '__main__':
     rospy.init_node('ctrl_server')
     rospy.logwarn(rospy.get_name() + "start")
     rospy.logwarn("your command list:\n")
-    command = rospy.get_param(rospy.get_name() + "/command") 
+    command = rospy.get_param(rospy.get_name() + "/command")
     for i in command:
         print(i)
 
+    # 啟動時一次連線所有 action server
+    pool = ActionClientPool()
+    pool.add('PBVS', 'PBVS_server', forklift_server.msg.PBVSAction)
+    pool.add('TopologyMap', 'TopologyMap_server', forklift_server.msg.TopologyMapAction)
+    pool.add('AprilTag_up', 'AprilTag_up_server', apriltag_ros.msg.AprilTagAction)
+    pool.add('AprilTag_down', 'AprilTag_down_server', apriltag_ros.msg.AprilTagAction)
+    missing = pool.connect(rospy.get_param(rospy.get_name() + "/server_timeout", 0.0))
+    if missing:
+        rospy.logerr("action servers not available: %s, their commands will fail" % ", ".join(missing))
+    executor = CommandExecutor(pool)
+    rospy.on_shutdown(executor.cancel_all)
+
+    start_time = rospy.get_time()
     for msg in command:
         rospy.sleep(1)
-        if(msg[0] == 'PBVS'):
-            rospy.logwarn("send PBVS: %s", msg[1])
-            if(msg[1] == 'parking_bodycamera' or msg[1] == 'drop_pallet'):
-                result = AprilTag_up_client(True)
-                print("AprilTag_up_client result ", result)
-                result = PBVS_client(msg[1])
-                print("PBVS_client result ", result)
-                result = AprilTag_up_client(False)
-                print("AprilTag_up_client result ", result)
-
-            elif(msg[1] == 'parking_forkcamera' or msg[1] == 'raise_pallet'):
-                result = AprilTag_down_client(True)
-                print("AprilTag_down_client result ", result)
-                result = PBVS_client(msg[1])
-                print("PBVS_client result ", result)
-                result = AprilTag_down_client(False)
-                print("AprilTag_down_client result ", result)
+        execute(msg)
+        if rospy.is_shutdown():
+            break
 
-        elif(msg[0] == 'TopologyMap'):
-            rospy.logwarn("send TopologyMap: %s", msg[1])
-            result = TopologyMap_client(msg[1])
-            print("TopologyMap result ", result)
-        else:
-            print("error command: ", msg)
-            
+    rospy.loginfo("command list took %.2f s" % (rospy.get_time() - start_time))
+    executor.report()
     rospy.signal_shutdown("finish command list")
-  
-    
+
+
@@ -1,36 +1,35 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 import rospy
-import actionlib
+import math
+import threading
 from actionlib_msgs.msg import GoalStatus
 from move_base_msgs.msg import MoveBaseAction, MoveBaseGoal
 from forklift_server.msg import PBVSMegaposeAction, PBVSMegaposeGoal, TopologyMapAction, TopologyMapGoal
 from geometry_msgs.msg import PoseStamped
 
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from ActionClientPool import ActionClientPool, CommandExecutor
+
 def PBVS_client(msg):
-    client = actionlib.SimpleActionClient('PBVS_server', PBVSMegaposeAction)
-    rospy.loginfo("Waiting for PBVS_server...")
-    client.wait_for_server()
     command = PBVSMegaposeGoal(command=msg[1], layer_dist=msg[2])
     print("send ", command)
-    client.send_goal(command)
-    client.wait_for_result()
-    return client.get_result()
-
-def TopologyMap_client(msg):
-    client = actionlib.SimpleActionClient('TopologyMap_server', TopologyMapAction)
-    client.wait_for_server()
-    goal = TopologyMapGoal(goal=msg[1])
-    # print("send ", goal)
-    client.send_goal(goal)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('PBVS', command, "%s %s" % (msg[0], msg[1])).wait()
 
-def movebase_client(target,waypoints):
-    client = actionlib.SimpleActionClient('move_base', MoveBaseAction)
-    rospy.loginfo("Waiting for move_base server...")
-    client.wait_for_server()
+def TopologyMap_client(msg, feedback_cb=None):
+    if isinstance(msg[1], list):
+        # ['TopologyMap', [stop, ...], ordered]: 多個停靠點一次規劃
+        goal = TopologyMapGoal(stops=msg[1], ordered=bool(msg[2]) if len(msg) > 2 else True)
+    else:
+        goal = TopologyMapGoal(goal=msg[1])
+    # print("send ", goal)
+    return executor.send('TopologyMap', goal, "TopologyMap %s" % msg[1], feedback_cb).wait()
 
+def movebase_client(target,waypoints, feedback_cb=None):
     coords = waypoints[target]
     goal = MoveBaseGoal()
     goal.target_pose = PoseStamped()
@@ -42,10 +41,9 @@ def movebase_client(target,waypoints):
     goal.target_pose.pose.orientation.w = coords[3]
 
     rospy.loginfo("Sending Navigation goal for waypoint '%s': %s", target, goal)
-    client.send_goal(goal, done_cb=nav_done_cb)
-    client.wait_for_result()
-    
-    result = client.get_result()
+    step = executor.send('MoveBase', goal, "MoveBase %s" % target, feedback_cb)
+    result = step.wait()
+    nav_done_cb(step.state, result)
     rospy.loginfo("Navigation result: %s", result)
     return result
 
@@ -55,37 +53,112 @@ def nav_done_cb(state, result):
     else:
         rospy.loginfo("Navigation goal succeeded.")
 
+def execute(msg):
+    start_time = rospy.get_time()
+    if(msg[0] == 'PBVS' or msg[0] == 'odom'):
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}, {msg[2]}")
+        result = PBVS_client(msg)
+        print("PBVS_client result ", result)
+
+    elif(msg[0] == 'MoveBase'):
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}")
+        result = movebase_client(msg[1],waypoints)
+        print("MoveBase result ", result)
+
+    elif(msg[0] == 'TopologyMap'):
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}")
+        result = TopologyMap_client(msg)
+        print("TopologyMap result ", result)
+
+    elif(msg[0] == 'parallel'):
+        # ['parallel', [command, command, ...]]: 同時執行, 全部完成才進行下一個指令
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}")
+        executor.parallel([lambda m=m: execute(m) for m in msg[1]])
+
+    else:
+        print("error command: ", msg)
+    rospy.loginfo("command %s took %.2f s" % (msg, rospy.get_time() - start_time))
+
+def navigate_with_fork(msg, layer):
+    # 導航進入最後一段才開始把牙叉移到 layer 的初始高度, 導航與牙叉都完成才回傳
+    # TopologyMap: feedback 的 remaining_legs 為 0; MoveBase: 離目標 fork_preposition_distance 以內
+    # 沒有收到最後一段的 feedback (例如 target_pose 或導航失敗) 時, 導航結束後才調整
+    start_time = rospy.get_time()
+    fork = threading.Thread(target=execute, args=(['PBVS', 'pre_position_fork', layer],), daemon=True)
+    fork_lock = threading.Lock()
+    def start_fork(reason):
+        with fork_lock:
+            if fork.ident is None:
+                rospy.loginfo("pre_position_fork %s on %s, %.2f s after %s started" % (layer, reason, rospy.get_time() - start_time, msg[0]))
+                fork.start()
+
+    if msg[0] == 'TopologyMap':
+        def feedback_cb(feedback):
+            if feedback.remaining_legs == 0:
+                start_fork("last leg")
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}")
+        result = TopologyMap_client(msg, feedback_cb)
+    else:
+        x, y = waypoints[msg[1]][0:2]
+        def feedback_cb(feedback):
+            position = feedback.base_position.pose.position
+            if math.hypot(position.x - x, position.y - y) < fork_preposition_distance:
+                start_fork("%.1f m to goal" % fork_preposition_distance)
+        rospy.logwarn(f"send {msg[0]}: {msg[1]}")
+        result = movebase_client(msg[1], waypoints, feedback_cb)
+    print("%s result " % msg[0], result)
+    start_fork("arrival")
+    while fork.is_alive() and not rospy.is_shutdown():
+        fork.join(0.1)
+    rospy.loginfo("command %s with pre_position_fork took %.2f s" % (msg, rospy.get_time() - start_time))
+
+def next_fork_layer(command, index):
+    # 導航之後 (中間只有 odom 動作) 接著的 parking_forkcamera 的層數, 沒有則回傳 None
+    for msg in command[index+1:]:
+        if msg[0] == 'odom':
+            continue
+        if msg[0] == 'PBVS' and msg[1] == 'parking_forkcamera':
+            return msg[2]
+        return None
+    return None
+
 if __name__ == '__main__':
     rospy.init_node('ctrl_server_megapose')
     rospy.logwarn("%s started", rospy.get_name())
 
     # 從參數伺服器取得指令列表與導航點字典（直接作為 YAML 格式參數設定）
     command = rospy.get_param("~command", [])
+    fork_preposition = rospy.get_param("~fork_preposition", False)  # 導航最後一段預先調整牙叉高度
+    fork_preposition_distance = rospy.get_param("~fork_preposition_distance", 2.0)  # MoveBase 離目標多少公尺內開始調整 (m)
     waypoints = rospy.get_param("~waypoints", {})
 
     rospy.loginfo("Command list: %s", command)
     rospy.loginfo("Waypoints: %s", waypoints)
 
-    for msg in command:
-        rospy.sleep(1)
-        if(msg[0] == 'PBVS' or msg[0] == 'odom'):
-            rospy.logwarn(f"send {msg[0]}: {msg[1]}, {msg[2]}")
-            result = PBVS_client(msg)
-            print("PBVS_client result ", result)
-
-        elif(msg[0] == 'MoveBase'):
-            rospy.logwarn(f"send {msg[0]}: {msg[1]}")
-            result = movebase_client(msg[1],waypoints)
-            print("MoveBase result ", result)
-
-        elif(msg[0] == 'TopologyMap'):
-            rospy.logwarn(f"send {msg[0]}: {msg[1]}")
-            result = TopologyMap_client(msg)
-            print("TopologyMap result ", result)
+    # 啟動時一次連線所有 action server
+    pool = ActionClientPool()
+    pool.add('PBVS', 'PBVS_server', PBVSMegaposeAction)
+    pool.add('TopologyMap', 'TopologyMap_server', TopologyMapAction)
+    pool.add('MoveBase', 'move_base', MoveBaseAction)
+    missing = pool.connect(rospy.get_param("~server_timeout", 0.0))
+    if missing:
+        rospy.logerr("action servers not available: %s, their commands will fail" % ", ".join(missing))
+    executor = CommandExecutor(pool)
+    rospy.on_shutdown(executor.cancel_all)
 
+    start_time = rospy.get_time()
+    for i, msg in enumerate(command):
+        rospy.sleep(1)
+        layer = next_fork_layer(command, i) if fork_preposition and msg[0] in ('TopologyMap', 'MoveBase') else None
+        if layer is not None:
+            navigate_with_fork(msg, layer)
         else:
-            print("error command: ", msg)
-            
+            execute(msg)
+        if rospy.is_shutdown():
+            break
+
+    rospy.loginfo("command list took %.2f s" % (rospy.get_time() - start_time))
+    executor.report()
     rospy.signal_shutdown("finish command list")
   
     
@@ -1,26 +1,24 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 import rospy
-import actionlib
 import forklift_server.msg
 
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from ActionClientPool import ActionClientPool, CommandExecutor
+
 def PBVS_client(msg):
-    client = actionlib.SimpleActionClient('PBVS', forklift_server.msg.PBVSAction)
-    client.wait_for_server()
     command = forklift_server.msg.PBVSGoal(command=msg)
     print("send ", command)
-    client.send_goal(command)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('PBVS', command, "PBVS " + msg).wait()
 
 def TopologyMap_client(msg):
-    client = actionlib.SimpleActionClient('TopologyMap', forklift_server.msg.TopologyMapAction)
-    client.wait_for_server()
     goal = forklift_server.msg.TopologyMapGoal(goal=msg)
     print("send ", goal)
-    client.send_goal(goal)
-    client.wait_for_result()
-    return client.get_result()
+    return executor.send('TopologyMap', goal, "TopologyMap " + msg).wait()
 
 if __name__ == '__main__':
     rospy.init_node('ctrl_server')
@@ -40,6 +38,14 @@ if __name__ == '__main__':
         ['PBVS', 'down']
     ]
 
+    pool = ActionClientPool()
+    pool.add('PBVS', 'PBVS', forklift_server.msg.PBVSAction)
+    pool.add('TopologyMap', 'TopologyMap', forklift_server.msg.TopologyMapAction)
+    missing = pool.connect()
+    if missing:
+        rospy.logerr("action servers not available: %s, their commands will fail" % ", ".join(missing))
+    executor = CommandExecutor(pool)
+
     for msg in command:
         rospy.sleep(1)
         if(msg[0] == 'PBVS'):
@@ -50,6 +56,7 @@ if __name__ == '__main__':
             print("send TopologyMap: ", msg[1])
             result = TopologyMap_client(msg[1])
             print("result ", result)
+    executor.report()
 
 
   
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import rospy
+import actionlib
+import threading
+from actionlib_msgs.msg import GoalStatus
+
+
+class ActionClientPool():
+    # 啟動時建立並連線所有 action client, 之後每個指令重複使用
+    def __init__(self):
+        self.clients = {}
+        self.missing = set()  # connect 時連不上的 client, 之後送給它們的指令直接失敗
+
+    def add(self, name, action_ns, action_type):
+        self.clients[name] = actionlib.SimpleActionClient(action_ns, action_type)
+
+    def connect(self, timeout=0.0):
+        # timeout <= 0 表示一直等到 server 出現, 回傳連不上的 client 名稱
+        missing = []
+        for name, client in self.clients.items():
+            rospy.loginfo("Waiting for %s..." % client.action_client.ns)
+            if not client.wait_for_server(rospy.Duration(max(timeout, 0.0))):
+                rospy.logwarn("%s not available" % client.action_client.ns)
+                missing.append(name)
+        self.missing = set(missing)
+        return missing
+
+    def get(self, name):
+        return self.clients[name]
+
+
+class Step():
+    def __init__(self, label):
+        self.label = label
+        self.start = rospy.get_time()
+        self.end = None
+        self.state = None
+        self.result = None
+        self.done = threading.Event()
+
+    def done_cb(self, state, result):
+        self.end = rospy.get_time()
+        self.state, self.result = state, result
+        rospy.loginfo("step %s finished in %.2f s (state %d)" % (self.label, self.end - self.start, state))
+        self.done.set()
+
+    def wait(self):
+        while not self.done.wait(0.1):
+            if rospy.is_shutdown():
+                return None
+        return self.result
+
+    def succeeded(self):
+        return self.state == GoalStatus.SUCCEEDED
+
+
+class CommandExecutor():
+    # 不等待結果的送出指令; 同一個 client 一次只能追蹤一個 goal, 送出前先等該 client 上一個 goal 結束
+    # 每個 client 一把鎖, 等待、登記與 send_goal 都在鎖內, parallel 中送往同一個 server 的分支會依序執行
+    def __init__(self, pool):
+        self.pool = pool
+        self.active = {}  # client 名稱 -> Step
+        self.lock = threading.Lock()
+        self.client_locks = dict((name, threading.Lock()) for name in pool.clients)
+        self.steps = []
+
+    def send(self, name, goal, label=None, feedback_cb=None):
+        client = self.pool.get(name)
+        step_label = label or name
+        if name in self.pool.missing:
+            rospy.logerr("step %s failed: %s not available" % (step_label, client.action_client.ns))
+            return self.fail(step_label)
+        with self.client_locks[name]:
+            with self.lock:
+                previous = self.active.get(name)
+            if previous is not None:
+                previous.wait()
+            step = Step(step_label)
+            with self.lock:
+                self.active[name] = step
+                self.steps.append(step)
+            client.send_goal(goal, done_cb=step.done_cb, feedback_cb=feedback_cb)
+        return step
+
+    def fail(self, label):
+        # 沒有送出的指令, 回傳已結束 (ABORTED) 的 Step
+        step = Step(label)
+        step.end = step.start
+        step.state = GoalStatus.ABORTED
+        step.done.set()
+        return step
+
+    def parallel(self, functions):
+        # 每個 function 在自己的 thread 依序送出並等待, 全部結束後才回傳
+        threads = [threading.Thread(target=function, daemon=True) for function in functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive() and not rospy.is_shutdown():
+                thread.join(0.1)
+
+    def cancel_all(self):
+        with self.lock:
+            for name, step in self.active.items():
+                if not step.done.is_set():
+                    self.pool.get(name).cancel_goal()
+
+    def report(self):
+        total = {}
+        for step in self.steps:
+            if step.end is not None:
+                total[step.label] = total.get(step.label, 0.0) + step.end - step.start
+        for label, seconds in sorted(total.items(), key=lambda item: -item[1]):
+            rospy.loginfo("%-24s %8.2f s" % (label, seconds))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import math
+import rospy
+
+
+class RateLimiter():
+    # 單一軸的速度命令整形: 加速度不超過 accel, 加速度的變化不超過 jerk (0 為不限制)
+    # 接近目標時依 jerk 提前收小加速度, 不會衝過目標
+    def __init__(self, accel, jerk):
+        self.accel = accel
+        self.jerk = jerk
+        self.reset()
+
+    def reset(self, value=0.0):
+        self.value = value
+        self.rate = 0.0
+
+    def update(self, target, dt):
+        error = target - self.value
+        if self.accel <= 0 or dt <= 0:
+            self.reset(target)
+            return target
+        desired = math.copysign(self.accel, error)
+        if self.jerk > 0:
+            # 以 jerk 把加速度降到 0 所需的距離內開始減小加速度
+            desired = math.copysign(min(self.accel, math.sqrt(2.0 * self.jerk * abs(error))), error)
+            step = self.jerk * dt
+            self.rate += max(-step, min(step, desired - self.rate))
+        else:
+            self.rate = desired
+        value = self.value + self.rate * dt
+        if (target - value) * error <= 0:
+            # 已到達或越過目標
+            self.reset(target)
+            return target
+        self.value = value
+        return value
+
+
+class CommandShaper():
+    # CmdVel.cmd_pub 的輸出整形, 依 VehicleProfile 的 linear_/angular_ accel 與 jerk 限制速度變化, 避免階躍命令造成打滑與振盪
+    # 兩次命令之間最多以 max_dt 秒計算, 步驟停頓後重新開始時仍從上一次的輸出平滑變化
+    def __init__(self, profile, max_dt=0.1):
+        self.linear = RateLimiter(profile.linear_accel, profile.linear_jerk)
+        self.angular = RateLimiter(profile.angular_accel, profile.angular_jerk)
+        self.max_dt = max_dt
+        self.stamp = None
+
+    def reset(self):
+        # 立即停止 (fnStop): 不經過減速
+        self.linear.reset()
+        self.angular.reset()
+        self.stamp = None
+
+    def shape(self, linear, angular):
+        now = rospy.get_time()
+        dt = self.max_dt if self.stamp is None else min(now - self.stamp, self.max_dt)
+        self.stamp = now
+        return self.linear.update(linear, dt), self.angular.update(angular, dt)
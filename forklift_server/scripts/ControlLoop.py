@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import rospy
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+_diagnostics_pub = None
+
+
+def diagnostics_publisher():
+    # 每個 node 共用一個 /diagnostics publisher
+    global _diagnostics_pub
+    if _diagnostics_pub is None:
+        _diagnostics_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size = 10)
+    return _diagnostics_pub
+
+
+class ControlLoop():
+    # 固定頻率執行 sequence 的每一步, 統計週期抖動 (jitter) 與超時 (overrun), 定期發布到 /diagnostics
+    def __init__(self, rate, report_period=1.0, overrun_warn_ratio=0.05):
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.report_period = report_period
+        self.overrun_warn_ratio = overrun_warn_ratio
+        self.name = None
+
+    def start(self, name):
+        if self.name is not None and self.cycles > 0:
+            self.publish()  # 上一段 sequence 的統計
+        self.name = name
+        now = rospy.get_time()
+        self.deadline = now + self.period
+        self.last_wake = now
+        self.last_report = now
+        self.cycles = 0
+        self.overruns = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.work_sum = 0.0
+        self.work_max = 0.0
+        self.work_max_step = ""
+
+    def sleep(self, step=None):
+        now = rospy.get_time()
+        work = now - self.last_wake
+        self.cycles += 1
+        self.work_sum += work
+        if work > self.work_max:
+            self.work_max, self.work_max_step = work, str(step) if step is not None else ""
+        if now >= self.deadline:
+            # 這一步超過一個週期 (例如內部有 rospy.sleep), 不補跑錯過的週期
+            self.overruns += 1
+            wake = now
+            self.deadline = now + self.period
+        else:
+            rospy.sleep(self.deadline - now)
+            wake = rospy.get_time()
+            jitter = abs(wake - self.deadline)
+            self.jitter_sum += jitter
+            self.jitter_max = max(self.jitter_max, jitter)
+            self.deadline += self.period
+        self.last_wake = wake
+        if wake - self.last_report >= self.report_period:
+            self.publish()
+            self.last_report = wake
+        return not rospy.is_shutdown()
+
+    def publish(self):
+        on_time = self.cycles - self.overruns
+        status = DiagnosticStatus()
+        status.name = "%s control loop" % rospy.get_name()
+        status.hardware_id = rospy.get_name()
+        if self.cycles and self.overruns > self.overrun_warn_ratio * self.cycles:
+            status.level = DiagnosticStatus.WARN
+            status.message = "%s: %d/%d cycles overran %.0f ms" % (self.name, self.overruns, self.cycles, self.period * 1e3)
+        else:
+            status.level = DiagnosticStatus.OK
+            status.message = "%s: %.1f Hz" % (self.name, self.rate)
+        status.values = [
+            KeyValue("sequence", str(self.name)),
+            KeyValue("rate", "%.1f" % self.rate),
+            KeyValue("cycles", str(self.cycles)),
+            KeyValue("overruns", str(self.overruns)),
+            KeyValue("jitter_mean_ms", "%.2f" % (self.jitter_sum / on_time * 1e3 if on_time else 0.0)),
+            KeyValue("jitter_max_ms", "%.2f" % (self.jitter_max * 1e3)),
+            KeyValue("work_mean_ms", "%.2f" % (self.work_sum / self.cycles * 1e3 if self.cycles else 0.0)),
+            KeyValue("work_max_ms", "%.2f" % (self.work_max * 1e3)),
+            KeyValue("work_max_step", self.work_max_step)]
+        msg = DiagnosticArray()
+        msg.header.stamp = rospy.Time.now()
+        msg.status = [status]
+        diagnostics_publisher().publish(msg)
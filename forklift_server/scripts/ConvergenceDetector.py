@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+import rospy
+
+
+class ConvergenceDetector():
+    # 誤差在 band 內持續 hold 秒, 且這段時間內誤差的變化率 (最小平方法斜率) 低於 max_rate 才算收斂
+    # 以偵測的時間戳記計時, 同一筆偵測重複呼叫不會累計, 與迴圈執行次數和 CPU 速度無關
+    # band 可在 update 時給定 (門檻由參數傳入的步驟)
+    # release_ratio: 開始計時後誤差在 band * release_ratio 內就繼續計時 (遲滯)
+    # max_rate 預設 band / hold: 一個 hold 期間誤差漂移不超過 band
+    def __init__(self, hold, band=None, release_ratio=1.0, max_rate=None):
+        self.hold = hold
+        self.band = band
+        self.release_ratio = release_ratio
+        self.max_rate = max_rate
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()
+        self.entered = None     # 進入 band 的時間
+        self.last_stamp = None
+
+    def update(self, error, stamp=None, band=None):
+        # 收斂時回傳 True 並重置, 下一次使用重新計時
+        if stamp is None:
+            stamp = rospy.get_time()
+        if self.last_stamp is not None and stamp <= self.last_stamp:
+            return False
+        self.last_stamp = stamp
+        band = band if band is not None else self.band
+        if abs(error) >= (band if self.entered is None else band * self.release_ratio):
+            self.samples.clear()
+            self.entered = None
+            return False
+        if self.entered is None:
+            self.entered = stamp
+        self.samples.append((stamp, error))
+        while len(self.samples) > 2 and stamp - self.samples[1][0] >= self.hold:
+            self.samples.popleft()
+        max_rate = self.max_rate if self.max_rate is not None else band / self.hold if self.hold > 0 else float('inf')
+        if stamp - self.entered >= self.hold and abs(self.rate()) <= max_rate:
+            self.reset()
+            return True
+        return False
+
+    def rate(self):
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        mean_t = sum(t for t, _ in self.samples) / n
+        mean_e = sum(e for _, e in self.samples) / n
+        var = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if var == 0.0:
+            return 0.0
+        return sum((t - mean_t) * (e - mean_e) for t, e in self.samples) / var
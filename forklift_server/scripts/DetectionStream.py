@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import namedtuple
+import rospy
+
+# seq: 收到的第幾筆偵測, stamp: 相機影像時間 (s), received: callback 收到的時間 (s)
+DetectionSample = namedtuple('DetectionSample', 'seq stamp received x y theta')
+
+
+class DetectionStream():
+    # 保存最新一筆偵測結果並編號, 控制步驟可以等待「下一筆新的偵測」, 不會重複使用同一筆舊資料
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.sample = None
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.used = 0
+        self.timeouts = 0
+        self.age_sum = 0.0
+        self.age_max = 0.0
+
+    def update(self, x, y, theta, stamp=None):
+        received = rospy.get_time()
+        stamp = stamp.to_sec() if stamp is not None and not stamp.is_zero() else received
+        with self.condition:
+            self.seq += 1
+            self.sample = DetectionSample(self.seq, stamp, received, x, y, theta)
+            self.condition.notify_all()
+
+    def latest(self):
+        with self.condition:
+            return self.sample
+
+    def wait_next(self, last_seq, timeout):
+        # 等待 seq 大於 last_seq 的偵測, 逾時回傳 None
+        deadline = rospy.get_time() + timeout
+        with self.condition:
+            while (self.sample is None or self.sample.seq <= last_seq) and not rospy.is_shutdown():
+                remaining = deadline - rospy.get_time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    return None
+                self.condition.wait(min(remaining, 0.05))
+            sample = self.sample
+        if sample is None:
+            return None
+        age = rospy.get_time() - sample.stamp
+        self.used += 1
+        self.age_sum += age
+        self.age_max = max(self.age_max, age)
+        return sample
+
+    def summary(self):
+        # 使用時資料的延遲 (從相機影像時間算起)
+        return 'detections used {0}, timeouts {1}, age mean {2:.0f} ms max {3:.0f} ms'.format(
+            self.used, self.timeouts, self.age_sum / self.used * 1e3 if self.used else 0.0, self.age_max * 1e3)
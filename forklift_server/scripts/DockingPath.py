@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import math
+import numpy as np
+
+
+class DockingPath():
+    # 從目前位姿到棧板前 approach 位姿的三次 Bezier 路徑 (里程計世界座標), 起點與終點的切線分別為車體目前與最後的行進方向
+    # 曲率沿路徑連續, 依曲率、最大速度與減速度算出每一點的速度 (時間參數化)
+    # start / goal: (x, y, 行進方向), 倒車時行進方向為車頭方向 + pi
+    def __init__(self, start, goal, max_linear, max_angular, decel, min_linear=0.0, samples=100):
+        chord = math.hypot(goal[0] - start[0], goal[1] - start[1])
+        k = chord / 3.0
+        control = np.array([[start[0], start[1]],
+                            [start[0] + k * math.cos(start[2]), start[1] + k * math.sin(start[2])],
+                            [goal[0] - k * math.cos(goal[2]), goal[1] - k * math.sin(goal[2])],
+                            [goal[0], goal[1]]])
+        t = np.linspace(0.0, 1.0, samples)[:, None]
+        basis = np.hstack(((1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3))
+        d1 = np.hstack((-3 * (1 - t) ** 2, 3 * (1 - t) ** 2 - 6 * (1 - t) * t, 6 * (1 - t) * t - 3 * t ** 2, 3 * t ** 2))
+        d2 = np.hstack((6 * (1 - t), -12 * (1 - t) + 6 * t, 6 * (1 - t) - 12 * t, 6 * t))
+        self.points = basis.dot(control)
+        r1, r2 = d1.dot(control), d2.dot(control)
+        speed = np.maximum(np.hypot(r1[:, 0], r1[:, 1]), 1e-9)
+        self.curvature = (r1[:, 0] * r2[:, 1] - r1[:, 1] * r2[:, 0]) / speed ** 3
+        self.s = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(self.points, axis=0).T))))
+        self.length = self.s[-1]
+        # 速度曲線: 曲率限制角速度, 終點前以 decel 減速, 不低於 min_linear (馬達死區)
+        with np.errstate(divide='ignore'):
+            limit_turn = np.where(np.abs(self.curvature) > 1e-9, max_angular / np.abs(self.curvature), np.inf)
+        self.velocity = np.maximum(np.minimum(np.minimum(max_linear, limit_turn), np.sqrt(2.0 * decel * (self.length - self.s))), min_linear)
+        self.goal_direction = np.array([math.cos(goal[2]), math.sin(goal[2])])
+        self.index = 0
+
+    def duration(self):
+        # 依速度曲線估計的行駛時間 (s)
+        ds = np.diff(self.s)
+        return float(np.sum(ds / np.maximum(0.5 * (self.velocity[1:] + self.velocity[:-1]), 1e-3)))
+
+    def progress(self, x, y, window=20):
+        # 目前位置在路徑上最近的點, 只往前搜尋 (不會跳回已經走過的部分)
+        end = min(self.index + window, len(self.points))
+        distance = np.hypot(self.points[self.index:end, 0] - x, self.points[self.index:end, 1] - y)
+        self.index += int(np.argmin(distance))
+        return self.index
+
+    def lookahead(self, distance):
+        # 最近點往前 distance 的路徑點, 超過終點時沿終點切線延伸, 到終點時車身方向也已對正
+        target = self.s[self.index] + distance
+        if target >= self.length:
+            return self.points[-1] + (target - self.length) * self.goal_direction
+        return self.points[int(np.searchsorted(self.s, target))]
+
+    def remaining(self):
+        return self.length - self.s[self.index]
+
+
+def pure_pursuit(pose, target, lookahead, v, reverse=True):
+    # pose: 車體 (x, y, 車頭方向), target: 前視點; 回傳實際的 (線速度, 角速度), 倒車時線速度為負
+    dx, dy = target[0] - pose[0], target[1] - pose[1]
+    c, s = math.cos(pose[2]), math.sin(pose[2])
+    x_l, y_l = c * dx + s * dy, -s * dx + c * dy
+    if reverse:
+        # 倒車: 以車尾方向為前進方向, 前視點轉 180 度後套用同一個公式
+        x_l, y_l = -x_l, -y_l
+    distance = max(math.hypot(x_l, y_l), lookahead)
+    curvature = 2.0 * y_l / distance ** 2
+    return (-v if reverse else v), v * curvature
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import math
+from collections import deque
+
+
+class Job():
+    def __init__(self, job_id, pick, place, layer_dist, submitted):
+        self.job_id = job_id
+        self.pick = pick
+        self.place = place
+        self.layer_dist = layer_dist
+        self.submitted = submitted
+        self.assigned = None
+        self.finished = None
+        self.robot = None
+        self.result = None
+
+    def __repr__(self):
+        return "Job%d(%s -> %s)" % (self.job_id, self.pick, self.place)
+
+
+class Dispatcher():
+    # 任務佇列與派車: 閒置的車依路徑表的行駛成本接下最近的任務
+    def __init__(self, routes, robots, age_weight=0.0):
+        self.routes = routes            # RouteTable, 只用到 distance()
+        self.robots = dict(robots)      # robot -> 目前所在節點
+        self.busy = {}                  # robot -> Job
+        self.queue = deque()
+        self.age_weight = age_weight    # 每等待 1 秒扣掉的成本, 避免遠處的任務一直被略過
+        self.next_id = 1
+
+    def submit(self, pick, place, layer_dist, now):
+        job = Job(self.next_id, pick, place, layer_dist, now)
+        self.next_id += 1
+        self.queue.append(job)
+        return job
+
+    def idle(self):
+        return [robot for robot in self.robots if robot not in self.busy]
+
+    def cost(self, robot, job, now):
+        return self.routes.distance(self.robots[robot], job.pick) - self.age_weight * (now - job.submitted)
+
+    def assign(self, now):
+        # 重複挑出 (閒置車, 佇列任務) 中成本最低的一組, 直到沒有閒置車或任務; 到不了取貨點的組合不派
+        assignments = []
+        idle = self.idle()
+        while idle and self.queue:
+            best = None
+            for robot in idle:
+                for job in self.queue:
+                    if self.routes.distance(self.robots[robot], job.pick) == math.inf:
+                        continue
+                    cost = self.cost(robot, job, now)
+                    if best is None or cost < best[0]:
+                        best = (cost, robot, job)
+            if best is None:
+                break
+            _, robot, job = best
+            self.queue.remove(job)
+            idle.remove(robot)
+            job.robot, job.assigned = robot, now
+            self.busy[robot] = job
+            assignments.append(job)
+        return assignments
+
+    def finish(self, robot, node, result, now):
+        # 任務結束, node 為車最後到達的節點
+        job = self.busy.pop(robot)
+        job.finished, job.result = now, result
+        if node is not None:
+            self.robots[robot] = node
+        return job
+
+
+class FleetMetrics():
+    # 吞吐量 (jobs/hour) 與佇列延遲 (送出到派車的時間), 只統計最近 window 秒內完成或派出的任務
+    def __init__(self, start, window=3600.0):
+        self.start = start
+        self.window = window
+        self.completed = deque()  # 完成時間
+        self.latency = deque()    # (派車時間, 佇列延遲)
+        self.failed = 0
+
+    def record_assigned(self, job):
+        self.latency.append((job.assigned, job.assigned - job.submitted))
+
+    def record_finished(self, job, success):
+        if success:
+            self.completed.append(job.finished)
+        else:
+            self.failed += 1
+
+    def trim(self, now):
+        while self.completed and self.completed[0] < now - self.window:
+            self.completed.popleft()
+        while self.latency and self.latency[0][0] < now - self.window:
+            self.latency.popleft()
+
+    def jobs_per_hour(self, now):
+        self.trim(now)
+        elapsed = min(self.window, now - self.start)
+        if elapsed <= 0:
+            return 0.0
+        return len(self.completed) * 3600.0 / elapsed
+
+    def queue_latency(self, now):
+        # 回傳 (平均, 最大)
+        self.trim(now)
+        if not self.latency:
+            return 0.0, 0.0
+        values = [latency for _, latency in self.latency]
+        return sum(values) / len(values), max(values)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import math
+
+
+class ForkController():
+    # 牙叉高度 PID, 輸出 meteorcar.fork_velocity (起重電機 PWM, 上升為正)
+    # forklift_driver 會把 1 ~ 1000 的命令補到 1000, 所以非零輸出至少為 min_velocity
+    def __init__(self, kp=60000.0, ki=0.0, kd=0.0, max_velocity=3600.0, min_velocity=1000.0,
+                 max_accel=16000.0, deadband=0.005, lead=0.25, settle_time=0.1, integral_limit=0.05):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.max_velocity = max_velocity
+        self.min_velocity = min_velocity
+        self.max_accel = max_accel          # 每秒 PWM 最大變化量
+        self.deadband = deadband            # 誤差在此範圍內停止 (m)
+        self.lead = lead                    # 依目前速度預估停止後還會滑行的時間 (s), 提前停止
+        self.settle_time = settle_time      # 停在 deadband 內多久才算到位 (s)
+        self.integral_limit = integral_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+        self.previous_position = None
+        self.since_change = 0.0
+        self.rate = 0.0
+        self.velocity = 0.0
+        self.settled_time = 0.0
+        self.is_settled = False
+
+    def update(self, position, target, dt):
+        if dt <= 0:
+            return self.velocity
+        # 高度只在編碼器更新時改變, 呼叫頻率可能高於回傳頻率, 以兩次改變之間的時間估計速度
+        self.since_change += dt
+        if self.previous_position is None:
+            self.previous_position = position
+        elif position != self.previous_position:
+            self.rate += 0.5 * ((position - self.previous_position) / self.since_change - self.rate)
+            self.previous_position = position
+            self.since_change = 0.0
+        elif self.since_change > 0.2:
+            self.rate = 0.0
+
+        error = target - position
+        predicted = target - (position + self.rate * self.lead)
+        if abs(error) <= self.deadband and abs(predicted) <= self.deadband or predicted * error < 0 and self.velocity * error > 0:
+            # 已到位, 或照目前速度滑行就會超過目標: 停止
+            self.velocity = 0.0
+            self.integral = 0.0
+            self.previous_error = None
+        else:
+            self.integral = max(-self.integral_limit, min(self.integral_limit, self.integral + error * dt))
+            derivative = 0.0 if self.previous_error is None else (error - self.previous_error) / dt
+            self.previous_error = error
+            u = self.kp * error + self.ki * self.integral + self.kd * derivative
+            # PID 與誤差方向相反時 (例如 kd 抑制過衝) 不反向, 只降到最低速度
+            u = math.copysign(max(self.min_velocity, min(self.max_velocity, abs(u) if u * error > 0 else 0.0)), error)
+
+            # 速度斜坡: 起步從 min_velocity 開始, 換方向時先歸零
+            if self.velocity * u <= 0:
+                self.velocity = math.copysign(self.min_velocity, u)
+            else:
+                step = self.max_accel * dt
+                self.velocity = max(self.velocity - step, min(self.velocity + step, u))
+
+        if self.velocity == 0.0 and abs(error) <= self.deadband:
+            self.settled_time += dt
+        else:
+            self.settled_time = 0.0
+        self.is_settled = self.settled_time >= self.settle_time
+        return self.velocity
+
+
+class OnOffForkController():
+    # 只有上升 / 下降 / 停止的牙叉 (gpm_msg/forklift forkmotion), 每個控制週期呼叫 update(), 不阻塞
+    # 粗調: ForkController 以高度變化估計速度, 照目前速度滑行 lead 秒會到達目標就提前停止, 誤差小於 fine 後改為微調
+    # 微調: 脈衝長度 = 誤差 / speed, 呼叫端在 pulse 秒後送出停止; 每個脈衝後等 wait 秒讓牙叉停穩再量測, 誤差在 deadband 內才算到位
+    UP, DOWN, STOP = 1, -1, 0
+
+    def __init__(self, deadband=0.005, fine=0.01, lead=0.2, speed=0.05, wait=0.3, min_pulse=0.02, max_pulse=0.3):
+        self.coarse = ForkController(kp=1.0, min_velocity=1.0, max_velocity=1.0, deadband=deadband, lead=lead, settle_time=0.0)
+        self.deadband = deadband
+        self.fine = fine
+        self.speed = speed
+        self.wait = wait
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self.reset()
+
+    def reset(self):
+        self.coarse.reset()
+        self.is_fine = False
+        self.wait_until = 0.0
+        self.is_settled = False
+
+    def update(self, position, target, now, dt):
+        # 回傳 (motion, pulse): motion 為 UP / DOWN / STOP, None 表示維持上一個命令; pulse 不為 None 時 pulse 秒後要送出 STOP
+        error = target - position
+        if not self.is_fine:
+            velocity = self.coarse.update(position, target, dt)
+            if velocity != 0.0 and abs(error) > self.fine:
+                return (self.UP if velocity > 0 else self.DOWN), None
+            self.is_fine = True
+            self.wait_until = now + self.wait
+            return self.STOP, None
+        if now < self.wait_until:
+            return None, None
+        if abs(error) <= self.deadband:
+            self.is_settled = True
+            return self.STOP, None
+        pulse = min(max(abs(error) / self.speed, self.min_pulse), self.max_pulse)
+        self.wait_until = now + pulse + self.wait
+        return (self.UP if error > 0 else self.DOWN), pulse
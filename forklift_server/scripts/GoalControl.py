@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import rospy
+
+
+class GoalControl():
+    # 一個 PBVS goal 的取消與逾時判斷, sequence 每一步的前後呼叫 check()
+    # 取消 (cancel 或新的 goal 搶占) 或超過 timeout 秒時呼叫 stop (車體與牙叉停止), 之後 check() 都回傳同一個結果
+    # timeout <= 0 表示不限時間
+    def __init__(self, action_server, stop, timeout=0.0):
+        self._as = action_server
+        self.stop = stop
+        self.timeout = timeout
+        self.started = rospy.get_time()
+        self.outcome = None
+
+    def check(self):
+        # 回傳 None 表示繼續, 否則為 'preempted' / 'timeout'
+        if self.outcome is not None:
+            return self.outcome
+        if self._as.is_preempt_requested():
+            rospy.logwarn('PBVS preempted')
+            self.outcome = 'preempted'
+        elif self.timeout > 0 and rospy.get_time() - self.started > self.timeout:
+            rospy.logwarn('PBVS goal timeout after {0:.1f} s'.format(self.timeout))
+            self.outcome = 'timeout'
+        else:
+            return None
+        self.stop()
+        return self.outcome
+
+
+def set_goal_result(action_server, result, outcome):
+    # sequence 的結束狀態轉成 action 結果: stop (或沒有回傳結果的舊流程) 為成功, 取消為 preempted, 其餘為 aborted
+    if outcome is None or outcome == 'stop':
+        rospy.logwarn('PBVS Succeeded')
+        result.result = 'PBVS Succeeded'
+        action_server.set_succeeded(result)
+    elif outcome == 'preempted':
+        rospy.logwarn('PBVS Preempted')
+        result.result = 'PBVS Preempted'
+        action_server.set_preempted(result)
+    else:
+        rospy.logwarn('PBVS Aborted: {0}'.format(outcome))
+        result.result = 'PBVS Aborted: {0}'.format(outcome)
+        action_server.set_aborted(result)
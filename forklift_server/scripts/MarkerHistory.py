@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import threading
+import numpy as np
+import rospy
+
+# 樣本欄位: 影像時間 (s), marker_2d_pose_x, marker_2d_pose_y, marker_2d_theta
+FIELDS = {'x': 1, 'y': 2, 'theta': 3}
+
+
+def median_mad(values):
+    # 中位數與 MAD 換算的標準差 (常態分布時 1.4826 * MAD = sigma)
+    median = np.median(values)
+    return median, 1.4826 * np.median(np.abs(values - median))
+
+
+def huber(values, k=1.345, iterations=10, tolerance=1e-6):
+    # Huber M-estimator: 以中位數 / MAD 起始, IRLS 迭代; 殘差超過 k 個標準差的樣本權重降為 k / |r|
+    location, scale = median_mad(values)
+    if scale <= 0.0:
+        return location
+    for _ in range(iterations):
+        r = np.abs(values - location) / scale
+        weights = np.minimum(1.0, k / np.maximum(r, 1e-12))
+        updated = np.dot(weights, values) / np.sum(weights)
+        if abs(updated - location) < tolerance:
+            return updated
+        location = updated
+    return location
+
+
+ESTIMATORS = {
+    'median': lambda values: median_mad(values)[0],
+    'huber': huber,
+}
+
+
+class MarkerHistory():
+    # 每個 tag (key, AprilTag 為 (相機, tag id)) 一個固定長度的 ring buffer, 偵測 callback 呼叫 add(), 控制步驟呼叫 estimate() 立即取得結果
+    # 未指定 key 的查詢使用最近一筆偵測的 tag, 換 tag 後不會用到前一個 tag 的樣本
+    # 取代 TrustworthyMarker2DTheta 的阻塞取樣: 查詢最近 window 秒已收到的偵測, 不再等待 1~3 s 收集資料
+    # odometry: OdometryHistory, 有的話每個樣本先以影像時間之後的里程計推算到現在, 車體移動中的樣本也能一起估計
+    def __init__(self, size=64, estimator='huber', min_samples=3, odometry=None, camera_x=0.0):
+        self.size = size
+        self.estimator = ESTIMATORS[estimator]
+        self.min_samples = min_samples
+        self.odometry = odometry
+        self.camera_x = camera_x
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.key = None
+
+    def add(self, x, y, theta, stamp, key=None):
+        with self.lock:
+            if key not in self.buffers:
+                self.buffers[key] = [np.full((self.size, 4), np.nan), 0]
+            buffer = self.buffers[key]
+            buffer[0][buffer[1] % self.size] = (stamp, x, y, theta)
+            buffer[1] += 1
+            self.key = key
+
+    def samples(self, window, key=None, now=None):
+        # 最近 window 秒的樣本 (N x 4), key 為 None 時使用最近一筆偵測的 tag
+        now = rospy.get_time() if now is None else now
+        with self.lock:
+            buffer = self.buffers.get(self.key if key is None else key)
+            if buffer is None:
+                return np.empty((0, 4))
+            data = buffer[0].copy()
+        data = data[data[:, 0] >= now - window]
+        if self.odometry is None or len(data) == 0:
+            return data
+        motion = np.array([self.odometry.motion_since(stamp) or (np.nan, np.nan, np.nan) for stamp in data[:, 0]])
+        valid = ~np.isnan(motion[:, 0])
+        data, motion = data[valid], motion[valid]
+        # 與 ekf.propagate_marker 相同的運動模型, 一次處理全部樣本
+        c, s = np.cos(motion[:, 2]), np.sin(motion[:, 2])
+        px = data[:, 1] + self.camera_x - motion[:, 0]
+        py = data[:, 2] - motion[:, 1]
+        data[:, 1] = c * px + s * py - self.camera_x
+        data[:, 2] = -s * px + c * py
+        data[:, 3] = data[:, 3] - motion[:, 2]
+        return data
+
+    def estimate(self, field, window, key=None, now=None):
+        # 回傳 (估計值, 樣本數), 樣本少於 min_samples 時估計值為 None
+        values = self.samples(window, key, now)[:, FIELDS[field]]
+        if len(values) < self.min_samples:
+            return None, len(values)
+        return float(self.estimator(values)), len(values)
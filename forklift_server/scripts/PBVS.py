@@ -1,47 +1,17 @@
 # -*- coding: utf-8 -*-
 import rospy
 import forklift_server.msg
-from enum import Enum
 import math
 import tkinter as tk
 from PBVS_Action import Action
+from ControlLoop import ControlLoop
+from SequenceEngine import SequenceEngine, load_sequences
+from GoalControl import GoalControl
+from ProgressReporter import ProgressReporter
 from gpm_msg.msg import forklift
 
 
 class PBVS():
-    ParkingSequence = Enum('ParkingSequence',
-                           'init_fork \
-                            changing_direction_1 \
-                            Changingtheta \
-                            decide \
-                            back_turn \
-                            back \
-                            moving_nearby_parking_lot \
-                            parking \
-                            up_fork_dead_reckoning \
-                            up_fork_init \
-                            up_fork_up_half \
-                            up_fork_up \
-                            up_fork_down \
-                            up_fork_forward \
-                            up_fork_forward_half \
-                            up_fork_backword \
-                            up_fork_tilt_forward \
-                            up_fork_tilt_backword \
-                            up_fork_back \
-                            up_fork_going \
-                            down_fork_dead_reckoning \
-                            down_fork_init \
-                            down_fork_up \
-                            down_fork_down \
-                            down_fork_forward \
-                            down_fork_backword \
-                            down_fork_tilt_forward \
-                            down_fork_tilt_backword \
-                            down_fork_back \
-                            down_fork_going \
-                            stop')
-
     def __init__(self, _as, subscriber, mode):
         self._as = _as
         self._feedback = forklift_server.msg.PBVSFeedback()
@@ -55,22 +25,27 @@ class PBVS():
         self. TilePositionv = mode.TilePosition
         self. MovePosition = mode.MovePosition
         self.Action = Action(self.subscriber)
-        self.init_PBVS_parame()
 
-    def init_PBVS_parame(self):
+    def run(self):
+        # 執行 goal, 回傳結束狀態給 set_goal_result (None / 'stop' 為成功)
         self.is_sequence_finished = False
+        self.fork_init_tolerance = rospy.get_param(
+            rospy.get_name() + "/fork_init_tolerance", 0.01)
+        self.control_loop = ControlLoop(rospy.get_param(
+            rospy.get_name() + "/control_rate", 10.0))
+        self.goal_timeout = rospy.get_param(
+            rospy.get_name() + "/goal_timeout", 0.0)
+        self.progress = ProgressReporter(self._as, forklift_server.msg.PBVSFeedback, rospy.get_param(
+            rospy.get_name() + "/feedback_rate", 5.0), self.fnProgress)
+        self.engine = None
         if self.ActionCode == 20:
-            self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode == 21:
-            self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode == 22:
-            self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode == 30:
-            self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         else:
             if self.ActionCode == 10:
                 if self.ShelfParameter == 0:
@@ -101,9 +76,7 @@ class PBVS():
                     rospy.get_name() + "/bodycamera_decide_distance", 0.04)
                 self.back_distance = rospy.get_param(
                     rospy.get_name() + "/bodycamera_back_distance", 3.0)
-                self.current_parking_sequence = self.ParkingSequence.init_fork.value  # for 大車
-                # self.current_parking_sequence = self.ParkingSequence.changing_direction_1.value # for 小車
-                self.main_loop()
+                return self.main_loop('parking')  # 小車沒有牙叉: 將 parking 的 start 改為 changing_direction_1
 
             elif self.mode == "parking_forkcamera":
                 self.subscriber.updown = False
@@ -121,11 +94,7 @@ class PBVS():
                     rospy.get_name() + "/forkcamera_decide_distance", 0.04)
                 self.back_distance = rospy.get_param(
                     rospy.get_name() + "/forkcamera_back_distance", 3.0)
-                # self.current_parking_sequence = self.ParkingSequence.Changingtheta.value #test
-                self.current_parking_sequence = self.ParkingSequence.init_fork.value  # for 大車
-                # self.current_parking_sequence = self.ParkingSequence.changing_direction_1.value // for 小車
-                self.main_loop()
-                return
+                return self.main_loop('parking')
 
             elif self.mode == "raise_pallet":
                 self.subscriber.updown = False
@@ -141,9 +110,8 @@ class PBVS():
                     rospy.get_name() + "/raise_pallet_back_distance", 1.0)
                 self.navigation_helght = rospy.get_param(
                     rospy.get_name() + "/raise_pallet_navigation_helght", 0.392)
-                self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-                self.main_loop()
-                return
+                self.fork_forward_half = self.fork_forward_distance / 2
+                return self.main_loop('raise_pallet')
 
             elif self.mode == "drop_pallet":
                 self.subscriber.updown = True
@@ -159,35 +127,44 @@ class PBVS():
                     rospy.get_name() + "/drop_pallet_back_distance", 1.0)
                 self.navigation_helght = rospy.get_param(
                     rospy.get_name() + "/drop_pallet_navigation_helght", 0.07)
-                self.current_parking_sequence = self.ParkingSequence.down_fork_init.value
-                self.main_loop()
-                return
+                return self.main_loop('drop_pallet')
 
             else:
                 rospy.logwarn("mode is not correct")
-                self._result.result = 'fail'
-                self._as.set_succeeded(self._result)
-                return
-
-    def main_loop(self):
-        r = rospy.Rate(10)
-        while (not rospy.is_shutdown()):
-            if (self.PBVS()):
-                break
-            r.sleep()
+                return 'abort'
+
+    def main_loop(self, sequence=None):
+        # sequence: config/PBVS_sequences.yaml 中的名稱, ActionCode 20/21/22/30 的單一動作為 None
+        if sequence is not None:
+            table = load_sequences(default_file='PBVS_sequences.yaml')[sequence]
+            self.guard = GoalControl(self._as, self.fnStopMotion, table.get('goal_timeout', self.goal_timeout))
+            self.engine = SequenceEngine(sequence, table, (self, self.Action), stop=self.fnStopMotion, guard=self.guard)
+            self.engine.start()
+            self.progress.start(sequence, self.engine)
+            self.control_loop.start(sequence)
+        else:
+            self.guard = GoalControl(self._as, self.fnStopMotion, self.goal_timeout)
+            self.progress.start('ActionCode', state=str(self.ActionCode))
+            self.control_loop.start('ActionCode {0}'.format(self.ActionCode))
+        try:
+            while (not rospy.is_shutdown()):
+                if (self.PBVS()):
+                    break
+                self.control_loop.sleep(self.engine.state.name if self.engine is not None else None)
+        finally:
+            self.progress.stop()
+        if self.engine is not None:
+            self.engine.report()
+        rospy.loginfo('PBVS marker {0}'.format(self.subscriber.marker.summary()))
+        self.subscriber.marker.reset_statistics()
+        return self.engine.outcome if self.engine is not None else self.guard.outcome
 
     def __del__(self):
         rospy.logwarn('delet PBVS')
 
-    def PBVS(self):
-        if self._as.is_preempt_requested():
-            rospy.logwarn('PBVS Preempted')
-            self.current_parking_sequence = self.ParkingSequence.stop.value
-
-        self._feedback.feedback = str(
-            self.ParkingSequence(self.current_parking_sequence))
-        self._as.publish_feedback(self._feedback)
-        # ActionCode-->[10]:shelf, [20]:up/down, [21]:forward/backward, [22]:tile, [30]:move
+    def PBVS(self):        # ActionCode-->[10]:shelf, [20]:up/down, [21]:forward/backward, [22]:tile, [30]:move
+        if self.engine is None and self.guard.check():
+            return True
         if self.ActionCode == 20:
             self.is_sequence_finished = self.Action.fork_updown(
                 self.UpDownPosition)
@@ -208,231 +185,34 @@ class PBVS():
                 rospy.sleep(1)
                 return True
         else:
-            if self.ActionCode == 10:
-                if self.ShelfParameter == 0:
-                    self.mode = "parking_forkcamera"
-                else:
-                    self.mode == "parking_bodycamera",
-            else:  # [0]:未附值, [other]:給錯值 走舊流程
-                pass
-
-            # ============parking============
-            if self.current_parking_sequence == self.ParkingSequence.init_fork.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.init_fork)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.changing_direction_1.value
-                    self.is_sequence_finished = False
-            elif self.current_parking_sequence == self.ParkingSequence.changing_direction_1.value:
-                self.is_sequence_finished = self.Action.fnSeqChangingDirection(
-                    self.ChangingDirection_threshold)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.moving_nearby_parking_lot.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.moving_nearby_parking_lot.value:
-                self.is_sequence_finished = self.Action.fnSeqMovingNearbyParkingLot()
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.parking.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.parking.value:
-                self.is_sequence_finished = self.Action.fnSeqParking(
-                    self.Parking_distance)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.Changingtheta.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.Changingtheta.value:
-                self.is_sequence_finished = self.Action.fnSeqChangingtheta(
-                    self.Changingtheta_threshod)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.decide.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.decide.value:
-                self.is_sequence_finished = self.Action.fnSeqdecide(
-                    self.decide_distance)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.stop.value
-                    self.is_sequence_finished = False
-
-                elif self.is_sequence_finished == False:
-                    self.current_parking_sequence = self.ParkingSequence.back.value
-                    self.is_sequence_finished = False
-
-            # elif self.current_parking_sequence == self.ParkingSequence.back_turn.value:
-            #     turn_threshod = 0.04
-            #     self.is_sequence_finished = self.Action.fnseqturn(self.back_distance, turn_threshod)
-
-            #     if self.is_sequence_finished == True:
-            #         self.current_parking_sequence = self.ParkingSequence.back.value
-            #         self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.back.value:
-                self.is_sequence_finished = self.Action.fnseqmove_to_marker_dist(
-                    self.back_distance)
-
-                if self.is_sequence_finished == True:
-                    self.current_parking_sequence = self.ParkingSequence.parking.value
-                    self.is_sequence_finished = False
-            # ============raise_pallet============
-            # :TODO only raise pallet heve fork_updown_finetune()
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_init.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.init_fork)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_dead_reckoning.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_dead_reckoning.value:
-                self.is_sequence_finished = self.Action.fnseqdead_reckoning(
-                    self.dead_reckoning_dist)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_forward_half.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_forward_half.value:
-                self.is_sequence_finished = self.Action.fork_forwardback(
-                    self.fork_forward_distance/2)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_up_half.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_up_half.value:
-                self.pub_fork = rospy.Publisher(
-                    '/cmd_fork', forklift, queue_size=1)
-                rospy.sleep(0.05)
-                self.pub_fork.publish(3)
-                rospy.sleep(0.07)
-                self.pub_fork.publish(1)
-                self.is_sequence_finished = True
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_forward.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_forward.value:
-                self.is_sequence_finished = self.Action.fork_forwardback(
-                    self.fork_forward_distance)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_up.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_up.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.raise_height)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_backword.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_backword.value:
-                self.is_sequence_finished = self.Action.fork_forwardback(0)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_back.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_back.value:
-                self.is_sequence_finished = self.Action.fnseqdead_reckoning(
-                    self.back_distance)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.up_fork_going.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.up_fork_going.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.navigation_helght)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.stop.value
-                    self.is_sequence_finished = False
-            # ============drop_pallet============
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_init.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.init_fork)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_dead_reckoning.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_dead_reckoning.value:
-                self.is_sequence_finished = self.Action.fnseqdead_reckoning(
-                    self.dead_reckoning_dist)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_forward.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_forward.value:
-                self.is_sequence_finished = self.Action.fork_forwardback(
-                    self.fork_forward_distance)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_down.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_down.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.drop_height)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_backword.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_backword.value:
-                self.is_sequence_finished = self.Action.fork_forwardback(0.0)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_back.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_back.value:
-                self.is_sequence_finished = self.Action.fnseqdead_reckoning(
-                    self.back_distance)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.down_fork_going.value
-                    self.is_sequence_finished = False
-
-            elif self.current_parking_sequence == self.ParkingSequence.down_fork_going.value:
-                self.is_sequence_finished = self.Action.fork_updown(
-                    self.navigation_helght)
-
-                if self.is_sequence_finished == True:
-                    rospy.sleep(0.05)
-                    self.current_parking_sequence = self.ParkingSequence.stop.value
-                    self.is_sequence_finished = False
-            # ============stop============
-            elif self.current_parking_sequence == self.ParkingSequence.stop.value:
-
-                # self.window.destroy()
-                rospy.sleep(1)
-                return True
-
-            return False
+            # parking / raise_pallet / drop_pallet: config/PBVS_sequences.yaml
+            return self.engine.tick()
+        return False
+
+    def fnProgress(self):
+        # feedback: 控制器最近使用的 marker 位置與牙叉高度誤差
+        fork_error = self.Action.updownposition - self.Action.fork_target if self.Action.fork_target is not None else float('nan')
+        return self.Action.marker_2d_pose_x, self.Action.marker_2d_pose_y, self.Action.marker_2d_theta, fork_error
+
+    def fnForkUpHalf(self):
+        # up_fork_up_half: 牙叉短暫上升一點
+        self.pub_fork = rospy.Publisher(
+            '/cmd_fork', forklift, queue_size=1)
+        rospy.sleep(0.05)
+        self.pub_fork.publish(3)
+        rospy.sleep(0.07)
+        self.pub_fork.publish(1)
+        return True
+
+    def fnFinish(self):
+        # self.window.destroy()
+        rospy.sleep(1)
+        return True
+
+    def fnStopMotion(self):
+        # 取消或逾時: 停止車體與牙叉, 清除步驟的觸發狀態
+        self.Action.cmd_vel.fnStop()
+        self.Action.fnForkReset()
+        self.Action.pub_fork.publish(self.Action.forkmotion.stop.value)
+        self.Action.is_fork_init_moving = False
+        self.Action.is_triggered = False
@@ -5,12 +5,14 @@ import math
 from geometry_msgs.msg import Twist
 from enum import Enum
 from gpm_msg.msg import forklift
-import statistics
-class Action():
+from PBVS_Core import ActionCore
+from ConvergenceDetector import ConvergenceDetector
+from DockingPath import DockingPath, pure_pursuit
+from ForkController import OnOffForkController
+class Action(ActionCore):
     def __init__(self, Subscriber):
         # cmd_vel
-        self.cmd_vel = cmd_vel()
-        self.Subscriber = Subscriber
+        ActionCore.__init__(self, Subscriber, 'forklift', rospy.Publisher('/cmd_vel', Twist, queue_size = 1))
         self.NearbySequence = Enum('NearbySequence', 'initial_turn go_straight turn_right parking ')
         self.current_nearby_sequence = self.NearbySequence.initial_turn.value
         # fork_cmd
@@ -38,12 +40,32 @@ class Action():
         self.initial_marker_pose_x = 0.0
         self.initial_marker_pose_y = 0.0
         self.initial_marker_pose_theta = 0.0
+        self.marker_seq = self.Subscriber.marker.seq  # 只使用這次動作開始後的新偵測
+        self.marker_stamp = None
         # Fork_param
         self.forwardbackpostion = 0.0
         self.updownposition = 0.0
+        self.fork_target = None  # 目前 fork_updown 的目標高度, feedback 用
         self.fork_threshold = 0.01
+        self.is_fork_init_moving = False
+        self.fork_controller = OnOffForkController(deadband=self.Subscriber.fork_deadband, fine=self.fork_threshold,
+                                                   lead=self.Subscriber.fork_lead, speed=self.Subscriber.fork_speed,
+                                                   wait=self.Subscriber.fork_settle_wait)
+        self.fork_motions = {OnOffForkController.UP: self.forkmotion.up.value, OnOffForkController.DOWN: self.forkmotion.down.value,
+                             OnOffForkController.STOP: self.forkmotion.stop.value}
+        self.fork_pulse = None
+        self.fork_control_time = None
+        # 收斂判斷: 誤差在門檻內持續 settle_time 秒且已停止變化
+        settle_time = self.Subscriber.settle_time
+        self.settle_direction = ConvergenceDetector(settle_time)
+        self.settle_theta = ConvergenceDetector(settle_time)
+        self.settle_turn = ConvergenceDetector(settle_time)
+        self.settle_nearby_turn = ConvergenceDetector(settle_time, 0.03, release_ratio=1.5)
+        self.settle_parking = ConvergenceDetector(settle_time, max_rate=0.02)  # 與 marker 的距離變化低於 0.02 m/s (已停車)
+        # docking path (fnSeqDockingPath)
+        self.docking_path = None
+        self.docking_fallback = False  # 離 marker 太近無法規劃曲線時, 這次動作改用原本的轉彎-直走-轉彎
         # other
-        self.check_wait_time = 0
         self.is_triggered = False
 
     def SpinOnce(self):
@@ -51,42 +73,86 @@ class Action():
          self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta)=self.Subscriber.SpinOnce()
     
     
+    def SpinOnce_marker(self):
+        # 等待比上一次使用更新的 AprilTag 偵測, 逾時就停車並回傳 False
+        sample = self.Subscriber.marker.wait_next(self.marker_seq, self.Subscriber.marker_timeout)
+        if sample is None:
+            self.cmd_vel.fnStop()
+            rospy.logwarn_throttle(1.0, 'no new marker detection in {0:.2f} s'.format(self.Subscriber.marker_timeout))
+            return False
+        self.marker_seq = sample.seq
+        self.marker_stamp = sample.stamp
+        self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta = sample.x, sample.y, sample.theta
+        return True
+
+    def SpinOnce_predicted(self):
+        # 不等待新的偵測, 使用 SpinOnce() 讀入的 EKF 預測 (影像延遲與之後的車體移動已由里程計補償), 以控制頻率更新
+        # 最近一筆偵測超過 marker_timeout 就停車並回傳 False
+        sample = self.Subscriber.marker.latest()
+        if sample is None or rospy.get_time() - sample.received > self.Subscriber.marker_timeout:
+            self.cmd_vel.fnStop()
+            rospy.logwarn_throttle(1.0, 'no marker detection in {0:.2f} s'.format(self.Subscriber.marker_timeout))
+            return False
+        self.marker_stamp = rospy.get_time()
+        return True
+
+    def SpinOnce_odom_stamp(self):
+        # 以里程計轉彎的步驟 tag 多半不在相機視野內, marker 估計由 EKF 以里程計推算 (Subscriber.cbGetRobotOdom)
+        # marker_stamp 改為最新一筆偵測與里程計中較新的時間, 同一筆資料重複呼叫不會讓收斂判斷累計時間
+        latest = self.Subscriber.marker.latest()
+        stamps = [stamp for stamp in (self.marker_stamp, self.Subscriber.odom_stamp, latest.stamp if latest is not None else None)
+                  if stamp is not None]
+        if stamps:
+            self.marker_stamp = max(stamps)
+
     def update_fork(self):
         self.forwardbackpostion, self.updownposition = self.Subscriber.SpinOnce_fork()
     
-    def fork_updown_finetune(self, desired_updownposition, fork_threshold):
-        self.update_fork()
-        
-        while(abs(self.updownposition - desired_updownposition) > fork_threshold ):
-            if self.updownposition < desired_updownposition - fork_threshold:
-                
-                self.pub_fork.publish(self.forkmotion.up.value)
-                rospy.sleep(0.2)
-                self.pub_fork.publish(self.forkmotion.stop.value)
-            elif self.updownposition > desired_updownposition + fork_threshold:
-                
-                self.pub_fork.publish(self.forkmotion.down.value)
-                rospy.sleep(0.05)
-                self.pub_fork.publish(self.forkmotion.stop.value)
-            rospy.sleep(0.7)
-            self.update_fork()
-        print(self.updownposition, desired_updownposition)
-
-
     def fork_updown(self, desired_updownposition):#0~2.7
-        self.update_fork()
-        if self.updownposition < desired_updownposition - self.fork_threshold:
-            self.pub_fork.publish(self.forkmotion.up.value)
-            return False
-        elif self.updownposition > desired_updownposition + self.fork_threshold:
-            self.pub_fork.publish(self.forkmotion.down.value)
+        # 每個控制週期呼叫一次, 不阻塞: 粗調依速度估計提前停止, 微調的脈衝由 one-shot Timer 送出停止, 到位後回傳 True
+        now = rospy.get_time()
+        if desired_updownposition != self.fork_target or self.fork_control_time is None or now - self.fork_control_time > 0.5:
+            self.fnForkReset()  # 新的一段動作
+            self.fork_target = desired_updownposition
+            self.fork_control_time = now
             return False
-        else:
-            
-            self.fork_updown_finetune(desired_updownposition, 0.005)
-            self.pub_fork.publish(self.forkmotion.stop.value)
+        dt = now - self.fork_control_time
+        self.fork_control_time = now
+        self.update_fork()
+        motion, pulse = self.fork_controller.update(self.updownposition, desired_updownposition, now, dt)
+        if motion is not None:
+            self.pub_fork.publish(self.fork_motions[motion])
+        if pulse is not None:
+            self.fork_pulse = rospy.Timer(rospy.Duration(pulse), self.cbForkPulseEnd, oneshot=True)
+        if self.fork_controller.is_settled:
+            self.fnForkReset()
             return True
-    
+        return False
+
+    def cbForkPulseEnd(self, event):
+        self.fork_pulse = None
+        self.pub_fork.publish(self.forkmotion.stop.value)
+
+    def fnForkReset(self):
+        # 清除 fork_updown 的狀態, 取消還沒結束的微調脈衝
+        if self.fork_pulse is not None:
+            self.fork_pulse.shutdown()
+            self.fork_pulse = None
+        self.fork_controller.reset()
+        self.fork_control_time = None
+
+    def fork_init(self, desired_updownposition, tolerance):
+        # 牙叉已在容許範圍內 (例如導航時已預先定位) 就直接跳過初始高度調整
+        if not self.is_fork_init_moving:
+            self.update_fork()
+            if abs(self.updownposition - desired_updownposition) <= tolerance:
+                rospy.loginfo('init_fork skipped, fork at {0:.3f}'.format(self.updownposition))
+                return True
+            self.is_fork_init_moving = True
+        if self.fork_updown(desired_updownposition):
+            self.is_fork_init_moving = False
+            return True
+        return False
 
     def fork_forwardback(self, desired_forwardbackpostion):# 0~0.7
         self.update_fork()
@@ -102,6 +168,8 @@ class Action():
             
     def fnSeqChangingDirection(self, desired_angle):
         self.SpinOnce()
+        if not self.SpinOnce_marker():
+            return False
         desired_angle_turn = -1. *  math.atan2(self.marker_2d_pose_y, self.marker_2d_pose_x)
         
         if desired_angle_turn <0:
@@ -109,42 +177,28 @@ class Action():
         else:
             desired_angle_turn = desired_angle_turn - math.pi
 
-        self.cmd_vel.fnTurn(desired_angle_turn)
+        self.cmd_vel.fnTurn(theta=desired_angle_turn)
         
         if abs(desired_angle_turn) < desired_angle  :
             self.cmd_vel.fnStop()
-            if self.check_wait_time > 10 :
-                self.check_wait_time = 0
-                return True
-            else:
-                self.check_wait_time =self.check_wait_time  +1
-                return False
-        else:
-            self.check_wait_time =0
-            return False
+        return self.settle_direction.update(desired_angle_turn, self.marker_stamp, desired_angle)
         
     def fnSeqChangingtheta(self, threshod):
         self.SpinOnce()
+        if not self.SpinOnce_marker():
+            return False
         self.marker_2d_theta= self.TrustworthyMarker2DTheta(1)
         desired_angle_turn = -self.marker_2d_theta
         if abs(desired_angle_turn) < threshod  :
             self.cmd_vel.fnStop()
-            rospy.sleep(0.1)
-            return True
         else:
-            self.TurnByTime(desired_angle_turn, 1.5)
-            return False
-        
-    def TurnByTime(self, desired_angle_turn, time):
-        initial_time = rospy.Time.now().secs
-        while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.cmd_vel.fnTurn(desired_angle_turn)
-            rospy.sleep(0.1)
-        self.cmd_vel.fnStop()
-        
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
+        return self.settle_theta.update(desired_angle_turn, self.marker_stamp, threshod)
 
     def fnseqturn(self, threshod):#旋轉到後退所需角度
         self.SpinOnce()
+        if not self.SpinOnce_marker():
+            return False
         if(self.marker_2d_pose_y > 0):
             self.marker_2d_theta = self.marker_2d_theta + 0.15
         else:
@@ -153,23 +207,69 @@ class Action():
         desired_angle_turn = -self.marker_2d_theta
         if abs(desired_angle_turn) < threshod  :
             self.cmd_vel.fnStop()
-            rospy.sleep(0.1)
-            if self.check_wait_time > 5 :
-                self.check_wait_time = 0
-                return True
-            else:
-                self.check_wait_time =self.check_wait_time  +1
-                return False
         else:
-            self.cmd_vel.fnTurn(desired_angle_turn)
-            rospy.sleep(0.3)
-            self.check_wait_time =0
-            return False
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
+        return self.settle_turn.update(desired_angle_turn, self.marker_stamp, threshod)
         
     def fnSeqMovingNearbyParkingLot(self):
+        if self.Subscriber.docking_path and not self.docking_fallback:
+            return self.fnSeqDockingPath()
+        return self.fnSeqMovingNearbyParkingLotTurn()
+
+    def fnSeqDockingPath(self):
+        # 以一段連續曲線倒車到 marker 法線上的 approach 點, 取代 initial_turn -> go_straight -> turn_right 與每段之間的等待
+        # 路徑在里程計座標規劃 (DockingPath), 以 pure pursuit 追蹤, 速度曲線依 VehicleProfile 的最大線速度與角速度
+        self.SpinOnce()
+        if self.is_triggered == False:
+            if not self.SpinOnce_marker():
+                return False
+            theta = self.TrustworthyMarker2DTheta(3)
+            # marker 位置與法線方向 (marker 指向車體) 換到里程計座標
+            c, s = math.cos(self.robot_2d_theta), math.sin(self.robot_2d_theta)
+            tag_x = self.robot_2d_pose_x + c * self.marker_2d_pose_x - s * self.marker_2d_pose_y
+            tag_y = self.robot_2d_pose_y + s * self.marker_2d_pose_x + c * self.marker_2d_pose_y
+            normal = self.robot_2d_theta + theta
+            along = (self.robot_2d_pose_x - tag_x) * math.cos(normal) + (self.robot_2d_pose_y - tag_y) * math.sin(normal)
+            lateral = -(self.robot_2d_pose_x - tag_x) * math.sin(normal) + (self.robot_2d_pose_y - tag_y) * math.cos(normal)
+            if abs(lateral) < self.Subscriber.docking_skip_lateral:
+                return True
+            approach = max(along - self.Subscriber.docking_approach_ratio * abs(lateral), self.Subscriber.docking_min_distance)
+            if approach >= along:
+                rospy.logwarn('marker too close for a docking path (along {0:.2f} m), turning instead'.format(along))
+                self.docking_fallback = True
+                return False
+            goal = (tag_x + approach * math.cos(normal), tag_y + approach * math.sin(normal), normal + math.pi)
+            self.docking_path = DockingPath((self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta + math.pi), goal,
+                                            self.profile.max_linear, self.profile.max_angular, self.Subscriber.docking_decel,
+                                            self.profile.min_linear[1])
+            rospy.loginfo('docking path: lateral {0:.2f} m, length {1:.2f} m, planned {2:.1f} s'.format(
+                lateral, self.docking_path.length, self.docking_path.duration()))
+            self.is_triggered = True
+
+        path = self.docking_path
+        path.progress(self.robot_2d_pose_x, self.robot_2d_pose_y)
+        if path.remaining() < self.Subscriber.docking_tolerance:
+            self.cmd_vel.fnStop()
+            self.is_triggered = False
+            return True
+        target = path.lookahead(self.Subscriber.docking_lookahead)
+        linear, angular = pure_pursuit((self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta), target,
+                                       self.Subscriber.docking_lookahead, path.velocity[path.index])
+        twist = Twist()
+        twist.linear.x = linear if self.cmd_vel.front else -linear  # cmd_pub 在 front 為 False 時反轉線速度
+        # 與 fnTurn 相同套用 angular_sign; 這個檔案的 fnTurn 呼叫端都傳入反號的里程計誤差 (forklift angular_sign = -1),
+        # 逆時針為正的 pure_pursuit 角速度也先反號, forklift 上輸出不變, 其他 angular_sign 的車型與 fnTurn 一起反轉
+        twist.angular.z = self.profile.angular_sign * -angular
+        self.cmd_vel.cmd_pub(twist)
+        return False
+
+    def fnSeqMovingNearbyParkingLotTurn(self):
         self.SpinOnce()
+        self.SpinOnce_odom_stamp()
         if self.current_nearby_sequence == self.NearbySequence.initial_turn.value:
             if self.is_triggered == False:
+                if not self.SpinOnce_marker():
+                    return False
                 self.is_triggered = True
                 self.initial_robot_pose_theta = self.robot_2d_theta
                 self.initial_robot_pose_x = self.robot_2d_pose_x
@@ -191,26 +291,13 @@ class Action():
 
             
             desired_angle_turn = -1. * desired_angle_turn
-            self.cmd_vel.fnTurn(desired_angle_turn)
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
 
-            if abs(desired_angle_turn) < 0.03:
-                self.cmd_vel.fnStop()
-                if self.check_wait_time >10:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.go_straight.value
-                    self.is_triggered = False
-                else:
-                    self.check_wait_time =self.check_wait_time +1
-            elif abs(desired_angle_turn) < 0.045 and self.check_wait_time :
+            if abs(desired_angle_turn) < 0.03 or abs(desired_angle_turn) < 0.045 and self.settle_nearby_turn.entered is not None:
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 10:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.go_straight.value
-                    self.is_triggered = False
-                else:
-                    self.check_wait_time =self.check_wait_time +1
-            else:
-                self.check_wait_time =0    
+            if self.settle_nearby_turn.update(desired_angle_turn, self.marker_stamp):
+                self.current_nearby_sequence = self.NearbySequence.go_straight.value
+                self.is_triggered = False
 
         elif self.current_nearby_sequence == self.NearbySequence.go_straight.value:
             if self.is_triggered == False:
@@ -228,7 +315,7 @@ class Action():
             if remained_dist < 0  :remained_dist =0
 
             
-            self.cmd_vel.fnGoStraight(desired_dist)
+            self.cmd_vel.fnGoStraight(v=desired_dist)
 
             if abs(remained_dist) < 0.07:
                 self.cmd_vel.fnStop()
@@ -246,31 +333,19 @@ class Action():
             elif self.initial_marker_pose_theta > 0.0:
                 desired_angle_turn = -(math.pi / 2.0) + (self.robot_2d_theta - self.initial_robot_pose_theta)
             
-            self.cmd_vel.fnTurn(desired_angle_turn)
-            if abs(desired_angle_turn) < 0.03:
-                self.cmd_vel.fnStop()
-                if self.check_wait_time > 20:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.parking.value
-                    self.is_triggered = False
-                    return True                
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            elif abs(desired_angle_turn) < 0.045 and self.check_wait_time:
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
+            if abs(desired_angle_turn) < 0.03 or abs(desired_angle_turn) < 0.045 and self.settle_nearby_turn.entered is not None:
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 20:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.parking.value
-                    self.is_triggered = False
-                    return True                
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            else:
-                self.check_wait_time =0    
+            if self.settle_nearby_turn.update(desired_angle_turn, self.marker_stamp):
+                self.current_nearby_sequence = self.NearbySequence.parking.value
+                self.is_triggered = False
+                return True
         return False
 
     def fnSeqParking(self, parking_dist):
         self.SpinOnce()
+        if not (self.SpinOnce_predicted() if self.Subscriber.predict_marker else self.SpinOnce_marker()):
+            return False
         desired_angle_turn = math.atan2(self.marker_2d_pose_y - 0, self.marker_2d_pose_x - 0)
 
 
@@ -284,24 +359,12 @@ class Action():
 
         if (abs(self.marker_2d_pose_x) < parking_dist)  :
             self.cmd_vel.fnStop()
-            if self.check_wait_time > 10:
-                self.check_wait_time = 0
-                return True
-            else:
-                self.check_wait_time =self.check_wait_time  +1
-        elif (abs(self.marker_2d_pose_x) < parking_dist) and self.check_wait_time:
-            self.cmd_vel.fnStop()
-            if self.check_wait_time > 10:
-                self.check_wait_time = 0
-                return True
-            else:
-                self.check_wait_time =self.check_wait_time  +1
-        else:
-            self.check_wait_time =0
-            return False
+        return self.settle_parking.update(abs(self.marker_2d_pose_x), self.marker_stamp, parking_dist)
         
     def fnSeqdecide(self, decide_dist):#decide_dist偏離多少公分要後退
         self.SpinOnce()
+        if not self.SpinOnce_marker():
+            return None
         dist = self.marker_2d_pose_y
         if  abs(dist) < abs(decide_dist):
             return True
@@ -322,7 +385,7 @@ class Action():
                 self.is_triggered = False
                 return True
             else:
-                self.cmd_vel.fnGoStraight(-(dead_reckoning_dist - dist))
+                self.cmd_vel.fnGoStraight(v=-(dead_reckoning_dist - dist))
                 return False
         elif math.copysign(1, dead_reckoning_dist) < 0.0:
             if  dead_reckoning_dist - dist > 0.0:
@@ -330,11 +393,13 @@ class Action():
                 self.is_triggered = False
                 return True
             else:
-                self.cmd_vel.fnGoStraight(-(dead_reckoning_dist - dist))
+                self.cmd_vel.fnGoStraight(v=-(dead_reckoning_dist - dist))
                 return False
 
     def fnseqmove_to_marker_dist(self, marker_dist): #(使用marker)前後移動到距離marker_dist公尺的位置
         self.SpinOnce()
+        if not self.SpinOnce_marker():
+            return False
         if(marker_dist < 2.0):
             threshold = 0.015
         else:
@@ -343,140 +408,11 @@ class Action():
         dist = math.sqrt(self.marker_2d_pose_x**2 + self.marker_2d_pose_y**2)
         
         if dist < (marker_dist-threshold):
-            self.cmd_vel.fnGoStraight(-(marker_dist - dist))
+            self.cmd_vel.fnGoStraight(v=-(marker_dist - dist))
             return False
         elif dist > (marker_dist+threshold):
-            self.cmd_vel.fnGoStraight(-(marker_dist - dist))
+            self.cmd_vel.fnGoStraight(v=-(marker_dist - dist))
             return False
         else:
             self.cmd_vel.fnStop()
             return True
-            
-    def fnCalcDistPoints(self, x1, x2, y1, y2):
-        return math.sqrt((x1 - x2) ** 2. + (y1 - y2) ** 2.)
-
-    def TrustworthyMarker2DTheta(self, time):
-        marker_2d_theta_list = [0.0]
-        initial_time = rospy.Time.now().secs
-        print("self.marker_2d_theta_1", self.marker_2d_theta)
-        while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.SpinOnce()
-            marker_2d_theta_list.append(self.marker_2d_theta)
-            # print("self.marker_2d_theta", self.marker_2d_theta)
-            rospy.sleep(0.05)
-        # print("marker_2d_theta_list", marker_2d_theta_list)
-        threshold = 0.5
-        mean = statistics.mean(marker_2d_theta_list)
-        stdev = statistics.stdev(marker_2d_theta_list)
-        upcutoff = mean + threshold * stdev
-        downcutoff = mean - threshold * stdev
-        clean_list = []
-        for i in marker_2d_theta_list:
-            if(i > downcutoff and i < upcutoff):
-               clean_list.append(i)
-               
-        return statistics.median(clean_list) 
-     
-class cmd_vel():
-    def __init__(self):
-        self.pub_cmd_vel = rospy.Publisher('/cmd_vel', Twist, queue_size = 1)
-        self.front = False
-
-    def cmd_pub(self, twist):
-        if not self.front:
-            twist.linear.x = -twist.linear.x
-
-        if twist.angular.z > 0.2:
-            twist.angular.z =0.2
-        elif twist.angular.z < -0.2:
-            twist.angular.z =-0.2
-        if twist.linear.x > 0 and twist.linear.x < 0.02:
-            twist.linear.x =0.05
-        elif twist.linear.x < 0 and twist.linear.x > -0.02:
-            twist.linear.x =-0.05   
-
-        if twist.linear.x > 0.2:
-            twist.linear.x =0.2
-        elif twist.linear.x < -0.2:
-            twist.linear.x =-0.2                     
-        if twist.angular.z > 0 and twist.angular.z < 0.01:
-            twist.angular.z =0.01
-        elif twist.angular.z < 0 and twist.angular.z > -0.01:
-            twist.angular.z =-0.01
-        self.pub_cmd_vel.publish(twist)
-
-    def fnStop(self):
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnTurn(self, theta):
-        Kp = 0.3 #1.0
-        angular_z = Kp * theta
-        
-
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        
-        twist.angular.z = -angular_z
-
-        self.cmd_pub(twist)
-
-    def fnGoStraight(self,v):
-        twist = Twist()
-        twist.linear.x = v*0.8
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnGoBack(self):
-        twist = Twist()
-        twist.linear.x = -0.1
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnfork(self,direction):
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = direction
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-
-    def fnTrackMarker(self, theta):
-        Kp = 6.2 #6.5
-
-        twist = Twist()
-        twist.linear.x = 0.15
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-
-        twist.angular.z = -Kp * theta
-        self.cmd_pub(twist)
-
-  
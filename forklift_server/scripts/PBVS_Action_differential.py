@@ -3,17 +3,17 @@ from sys import flags
 import rospy
 import numpy as np
 import math
-from geometry_msgs.msg import Twist
 from enum import Enum
-import statistics
 import time
 from cut_pliers_controller.msg import CmdCutPliers
+from ConvergenceDetector import ConvergenceDetector
+from PBVS_Core import ActionCore, CmdVel
 
-class Action():
+class Action(ActionCore):
     def __init__(self, Subscriber):
         # cmd_vel
-        self.cmd_vel = cmd_vel(Subscriber)
-        self.Subscriber = Subscriber
+        ActionCore.__init__(self, Subscriber, 'differential', Subscriber.pub_cmd_vel)
+        self.cmd_vel = cmd_vel(Subscriber, self.profile)
         self.NearbySequence = Enum( 'NearbySequence', \
                     'initial_dist \
                     turn_right \
@@ -38,12 +38,17 @@ class Action():
         self.initial_marker_pose_x = 0.0
         self.initial_marker_pose_y = 0.0
         self.initial_marker_pose_theta = 0.0
+        self.marker_stamp = None
         # Fork_param
         self.forwardbackpostion = 0.0
         self.updownposition = 0.0
         self.fork_threshold = 0.005
+        # 收斂判斷: 誤差在門檻內持續 settle_time 秒且已停止變化
+        settle_time = self.Subscriber.settle_time
+        self.settle_theta = ConvergenceDetector(settle_time)
+        self.settle_marker = ConvergenceDetector(settle_time, float('inf'))  # 偵測信心值連續 settle_time 秒可信
+        self.settle_parking = ConvergenceDetector(settle_time)
         # other
-        self.check_wait_time = 0
         self.is_triggered = False
         # arm
         self.current_arm_status = self.Subscriber.current_arm_status
@@ -60,70 +65,8 @@ class Action():
     def SpinOnce(self):
         (self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
          self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_pose_z, self.marker_2d_theta)=self.Subscriber.SpinOnce()
+        self.marker_stamp = self.Subscriber.SpinOnce_stamp()
         
-    def fnRotateToRelativeLine(self, distance, Kp, v):
-        time_needed = abs(distance / (Kp * v))   # 計算所需的行駛時間
-        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
-        rospy.loginfo(f'time_needed:{time_needed}')
-        # 開始移動
-        while (rospy.Time.now().secs) < (start_time + time_needed):
-            self.cmd_vel.fnGoStraight(Kp, v)
-            time.sleep(0.1)  # 每 0.1 秒發送一次指令
-        self.cmd_vel.fnStop()   # 停止機器人
-        return True
-
-    def fnseqDeadReckoningAngle_Time(self, target_angle, Kp, theta):
-        target_angle_rad = math.radians(target_angle)   # 計算目標角度（弧度）
-        time_needed = target_angle_rad / (Kp * theta)    # 計算所需的行駛時間
-        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
-        self.TestAction.get_logger().info(f'time_needed:{time_needed}')
-        while (rospy.Time.now().secs) < (start_time + time_needed):
-            self.cmd_vel.fnTurn(Kp, theta)
-            time.sleep(0.1)  # 每 0.1 秒發送一次指令
-        self.cmd_vel.fnStop()   # 停止機器人
-        return True
-    
-    def fnseqDeadReckoningAngle(self, target_angle):
-        self.SpinOnce()  # 確保獲取到最新位置
-        Kp = 0.3
-        threshold = 0.015  # 停止的閾值（弧度）
-        target_angle_rad = math.radians(target_angle)   # 將目標角度轉換為弧度
-        if not self.is_triggered:   # 初始化：如果是第一次調用，記錄初始累積角度
-            self.is_triggered = True
-            self.initial_total_theta = self.robot_2d_theta  # 使用累積的總角度作為初始角度
-        
-        current_angle = self.robot_2d_theta - self.initial_total_theta  # 計算當前已旋轉的角度
-        remaining_angle = target_angle_rad - current_angle  # 計算剩餘的旋轉角度
-        if abs(remaining_angle) < threshold:   # 判斷是否達到目標角度
-            self.cmd_vel.fnStop()  # 停止機器人
-            self.is_triggered = False  # 重置觸發狀態
-            return True
-        else:
-            self.cmd_vel.fnTurn(Kp, remaining_angle)    # 執行旋轉，正負值決定方向
-            return False
-
-    def fnseqDeadReckoning(self, dead_reckoning_dist):  # 使用里程計算移動到指定距離
-        self.SpinOnce()  # 確保獲取到最新位置
-        Kp = 0.2
-        threshold = 0.015  # 停止的閾值
-        if self.is_triggered == False:  # 如果還沒啟動，記錄初始位置
-            self.is_triggered = True
-            self.initial_robot_pose_x = self.robot_2d_pose_x
-            self.initial_robot_pose_y = self.robot_2d_pose_y
-        # 計算當前移動距離
-        current_dist = self.fnCalcDistPoints(self.initial_robot_pose_x, self.robot_2d_pose_x, self.initial_robot_pose_y, self.robot_2d_pose_y)
-        # 計算剩餘距離
-        remaining_dist = dead_reckoning_dist - math.copysign(1, dead_reckoning_dist) * current_dist
-        # 判斷是否達到目標距離
-        if abs(remaining_dist) < threshold:  # 進入停止條件
-            self.cmd_vel.fnStop()
-            self.is_triggered = False
-            return True
-        else:
-            # 計算速度並保持方向
-            self.cmd_vel.fnGoStraight(Kp, remaining_dist)
-            return False
-            
     def fnSeqMarkerDistanceValid(self):
         self.SpinOnce()
         Kp = 0.02
@@ -143,18 +86,11 @@ class Action():
             # print("threshod", threshod)
             if abs(self.marker_2d_theta) < threshod  :
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 20 :
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time =self.check_wait_time  + 1
-                    return False
             else:
                 self.cmd_vel.fnTurn(Kp, -self.marker_2d_theta)
-                self.check_wait_time = 0
-                return False
+            return self.settle_theta.update(self.marker_2d_theta, self.marker_stamp, threshod)
         else:
-            self.check_wait_time = 0
+            self.settle_theta.reset()
             return False
         
         
@@ -209,14 +145,11 @@ class Action():
 
         elif self.current_nearby_sequence == self.NearbySequence.initial_marker.value:
             if self.TFConfidence():
-                if self.check_wait_time > 20:
-                    self.check_wait_time = 0
+                if self.settle_marker.update(0.0, self.marker_stamp):
                     self.current_nearby_sequence = self.NearbySequence.initial_dist.value
                     return True
-                else:
-                    self.check_wait_time += 1
             else:
-                self.check_wait_time = 0
+                self.settle_marker.reset()
                 return False
         return False
 
@@ -231,14 +164,9 @@ class Action():
             else:
                 # 偏差在容忍範圍內，停止前後運動
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 20:
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time += 1
-            return False
+            return self.settle_parking.update(self.marker_2d_pose_y, self.marker_stamp, tolerance)
         else:
-            self.check_wait_time = 0
+            self.settle_parking.reset()
             return False
         
     def fnSeqdecide(self, decide_dist, horizontal_dist):#decide_dist偏離多少公分要後退
@@ -273,31 +201,6 @@ class Action():
             self.cmd_vel.fnStop()
             return True
             
-    def fnCalcDistPoints(self, x1, x2, y1, y2):
-        return math.sqrt((x1 - x2) ** 2. + (y1 - y2) ** 2.)
-
-    def TrustworthyMarker2DTheta(self, time):
-        marker_2d_theta_list = [0.0]
-        initial_time = rospy.Time.now().secs
-        
-        while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.SpinOnce()
-            marker_2d_theta_list.append(self.marker_2d_theta)
-            # print("self.marker_2d_theta", self.marker_2d_theta)
-            rospy.sleep(0.05)
-        # print("marker_2d_theta_list", marker_2d_theta_list)
-        threshold = 0.5
-        mean = statistics.mean(marker_2d_theta_list)
-        stdev = statistics.stdev(marker_2d_theta_list)
-        upcutoff = mean + threshold * stdev
-        downcutoff = mean - threshold * stdev
-        clean_list = []
-        for i in marker_2d_theta_list:
-            if(i > downcutoff and i < upcutoff):
-               clean_list.append(i)
-               
-        return statistics.median(clean_list) 
-
     def ClawAlignZX(self, z_tolerance=3, x_tolerance=3):
         # 讀取當前 marker 與 arm 狀態
         self.SpinOnce()
@@ -482,76 +385,13 @@ class Action():
             return False
         return True
      
-class cmd_vel():
-    def __init__(self, Subscriber):
+class cmd_vel(CmdVel):
+    # 底盤部分由 CmdVel 處理, 這裡只加上剪鉗手臂的命令
+    def __init__(self, Subscriber, profile):
+        CmdVel.__init__(self, Subscriber.pub_cmd_vel, profile)
         self.Subscriber = Subscriber
-        self.pub_cmd_vel = self.Subscriber.pub_cmd_vel
         self.arm_pub_cmd_vel = self.Subscriber.arm_control_topic
-        self.front = False
-
-    def cmd_pub(self, twist):
-        if not self.front:
-            twist.linear.x = -twist.linear.x
-
-        if twist.angular.z > 0.2:
-            twist.angular.z =0.2
-        elif twist.angular.z < -0.2:
-            twist.angular.z =-0.2
-        if twist.linear.x > 0 and twist.linear.x < 0.03:
-            twist.linear.x =0.02
-        elif twist.linear.x < 0 and twist.linear.x > -0.03:
-            twist.linear.x =-0.02   
-
-        if twist.linear.x > 0.2:
-            twist.linear.x =0.2
-        elif twist.linear.x < -0.2:
-            twist.linear.x =-0.2                     
-        if twist.angular.z > 0 and twist.angular.z < 0.09:  #pin 0.05 -> 0.06
-            twist.angular.z =0.1
-        elif twist.angular.z < 0 and twist.angular.z > -0.09:
-            twist.angular.z =-0.1
-        self.pub_cmd_vel.publish(twist)
-
-    def fnStop(self):
-        twist = Twist()
-        self.cmd_pub(twist)
-
-    def fnTurn(self, Kp=0.2, theta=0.):
-        # Kp = 0.3 #1.0
-        twist = Twist()
-        twist.angular.z = Kp * theta
-        self.cmd_pub(twist)
-
-    def fnGoStraight(self, Kp=0.2, v=0.):
-        twist = Twist()
-        twist.linear.x = Kp * v
-
-        self.cmd_pub(twist)
-
-    def fnGoBack(self):
-        twist = Twist()
-        twist.linear.x = -0.1
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnTrackMarker(self, theta, kp):
-        # Kp = 4.0 #6.5
-
-        twist = Twist()
-        twist.linear.x = 0.05
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-
-        twist.angular.z = kp * theta
-        self.cmd_pub(twist)
-    
+
     def _clawZ_speed(self, speed):
         SPEED_MIN = 1
         SPEED_MAX = 10
@@ -2,17 +2,17 @@
 import rospy
 import numpy as np
 import math
-from geometry_msgs.msg import Twist
 from enum import Enum
 from forklift_msg.msg import meteorcar
-import statistics
 import time
+from ForkController import ForkController
+from ConvergenceDetector import ConvergenceDetector
+from PBVS_Core import ActionCore
 
-class Action():
+class Action(ActionCore):
     def __init__(self, Subscriber):
         # cmd_vel
-        self.cmd_vel = cmd_vel(Subscriber)
-        self.Subscriber = Subscriber
+        ActionCore.__init__(self, Subscriber, 'megapose', Subscriber.pub_cmd_vel)
         self.NearbySequence = Enum('NearbySequence', 'initial_turn go_straight turn_right parking ')
         self.current_nearby_sequence = self.NearbySequence.initial_turn.value
         # fork_cmd
@@ -33,17 +33,31 @@ class Action():
         self.initial_marker_pose_x = 0.0
         self.initial_marker_pose_y = 0.0
         self.initial_marker_pose_theta = 0.0
+        self.marker_stamp = None
         # Fork_param
         self.forwardbackpostion = 0.0
         self.updownposition = 0.0
-        self.fork_threshold = 0.005
+        self.fork_target = None  # 目前 fnForkUpdown 的目標高度, feedback 用
+        self.fork_threshold = self.Subscriber.fork_deadband
+        self.is_fork_init_moving = False
+        self.fork_controller = ForkController(kp=self.Subscriber.fork_kp, ki=self.Subscriber.fork_ki, kd=self.Subscriber.fork_kd,
+                                              max_velocity=self.Subscriber.fork_max_velocity, min_velocity=self.Subscriber.fork_min_velocity,
+                                              max_accel=self.Subscriber.fork_max_accel, deadband=self.fork_threshold,
+                                              lead=self.Subscriber.fork_lead, settle_time=self.Subscriber.fork_settle_time)
+        self.fork_control_time = None
+        # 收斂判斷: 誤差在門檻內持續 settle_time 秒且已停止變化
+        settle_time = self.Subscriber.settle_time
+        self.settle_direction = ConvergenceDetector(settle_time)
+        self.settle_theta = ConvergenceDetector(settle_time)
+        self.settle_nearby_turn = ConvergenceDetector(settle_time, 0.03, release_ratio=1.5)
+        self.settle_parking = ConvergenceDetector(settle_time, max_rate=0.02)  # 與 marker 的距離變化低於 0.02 m/s (已停車)
         # other
-        self.check_wait_time = 0
         self.is_triggered = False
 
     def SpinOnce(self):
         (self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
          self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta)=self.Subscriber.SpinOnce()
+        self.marker_stamp = self.Subscriber.SpinOnce_stamp()
     
     
     def update_fork(self):
@@ -74,21 +88,48 @@ class Action():
         # rospy.loginfo('fork_threshold: {0}'.format(self.fork_threshold))
         if(desired_updownposition < 0):
             return True
+        self.fork_target = desired_updownposition
         
-        self.update_fork()
-        if self.updownposition < desired_updownposition - self.fork_threshold:
-            self.fork_msg.fork_velocity = 2000.0
-            self.pub_fork.publish(self.fork_msg)
-            return False
-        elif self.updownposition > desired_updownposition + self.fork_threshold:
-            self.fork_msg.fork_velocity = -2000.0
-            self.pub_fork.publish(self.fork_msg)
-            return False
+        # PID 依誤差輸出比例的 fork_velocity, 停在 deadband 內 settle_time 後才回傳 True
+        now = rospy.get_time()
+        if self.fork_control_time is None or now - self.fork_control_time > 0.5:
+            self.fork_controller.reset()  # 新的一段動作
+            dt = 0.0
         else:
-            self.fork_msg.fork_velocity = 0.0
+            dt = now - self.fork_control_time
+        self.fork_control_time = now
+        self.update_fork()
+        if dt > 0:
+            self.fork_msg.fork_velocity = self.fork_controller.update(self.updownposition, desired_updownposition, dt)
             self.pub_fork.publish(self.fork_msg)
+        if self.fork_controller.is_settled:
+            self.fork_controller.reset()
+            self.fork_control_time = None
             return True
-    
+        return False
+
+    def fnForkInit(self, desired_updownposition):
+        # 牙叉已在容許範圍內 (例如導航時已預先定位) 就直接跳過初始高度調整
+        if not self.is_fork_init_moving:
+            self.update_fork()
+            if abs(self.updownposition - desired_updownposition) <= self.Subscriber.fork_init_tolerance:
+                rospy.loginfo('init_fork skipped, fork at {0:.3f}'.format(self.updownposition))
+                return True
+            self.is_fork_init_moving = True
+        if self.fnForkUpdown(desired_updownposition):
+            self.is_fork_init_moving = False
+            return True
+        return False
+
+    def fnForkHeightLimit(self):
+        # 車速越快允許的牙叉高度越低, 速度達 fork_height_limit_speed 時為 fork_height_limit_moving
+        speed = self.Subscriber.SpinOnce_velocity()
+        ratio = min(speed / self.Subscriber.fork_height_limit_speed, 1.0) if self.Subscriber.fork_height_limit_speed > 0 else 1.0
+        return self.Subscriber.fork_height_limit_stopped - (self.Subscriber.fork_height_limit_stopped - self.Subscriber.fork_height_limit_moving) * ratio
+
+    def fnForkStop(self):
+        self.fork_msg.fork_velocity = 0.0
+        self.pub_fork.publish(self.fork_msg)
 
     def fork_forwardback(self, desired_forwardbackpostion):# 0~0.7
         self.update_fork()
@@ -102,69 +143,6 @@ class Action():
             self.pub_fork.publish(self.forkmotion.stop.value)
             return True
         
-    def fnRotateToRelativeLine(self, distance, Kp, v):
-        time_needed = abs(distance / (Kp * v))   # 計算所需的行駛時間
-        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
-        rospy.loginfo(f'time_needed:{time_needed}')
-        # 開始移動
-        while (rospy.Time.now().secs) < (start_time + time_needed):
-            self.cmd_vel.fnGoStraight(Kp, v)
-            time.sleep(0.1)  # 每 0.1 秒發送一次指令
-        self.cmd_vel.fnStop()   # 停止機器人
-        return True
-
-    def fnseqDeadReckoningAngle_Time(self, target_angle, Kp, theta):
-        target_angle_rad = math.radians(target_angle)   # 計算目標角度（弧度）
-        time_needed = target_angle_rad / (Kp * theta)    # 計算所需的行駛時間
-        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
-        self.TestAction.get_logger().info(f'time_needed:{time_needed}')
-        while (rospy.Time.now().secs) < (start_time + time_needed):
-            self.cmd_vel.fnTurn(Kp, theta)
-            time.sleep(0.1)  # 每 0.1 秒發送一次指令
-        self.cmd_vel.fnStop()   # 停止機器人
-        return True
-    
-    def fnseqDeadReckoningAngle(self, target_angle):
-        self.SpinOnce()  # 確保獲取到最新位置
-        Kp = 0.2
-        threshold = 0.015  # 停止的閾值（弧度）
-        target_angle_rad = math.radians(target_angle)   # 將目標角度轉換為弧度
-        if not self.is_triggered:   # 初始化：如果是第一次調用，記錄初始累積角度
-            self.is_triggered = True
-            self.initial_total_theta = self.robot_2d_theta  # 使用累積的總角度作為初始角度
-        
-        current_angle = self.robot_2d_theta - self.initial_total_theta  # 計算當前已旋轉的角度
-        remaining_angle = target_angle_rad - current_angle  # 計算剩餘的旋轉角度
-        if abs(remaining_angle) < threshold:   # 判斷是否達到目標角度
-            self.cmd_vel.fnStop()  # 停止機器人
-            self.is_triggered = False  # 重置觸發狀態
-            return True
-        else:
-            self.cmd_vel.fnTurn(Kp, remaining_angle)    # 執行旋轉，正負值決定方向
-            return False
-
-    def fnseqDeadReckoning(self, dead_reckoning_dist):  # 使用里程計算移動到指定距離
-        self.SpinOnce()  # 確保獲取到最新位置
-        Kp = 0.2
-        threshold = 0.015  # 停止的閾值
-        if self.is_triggered == False:  # 如果還沒啟動，記錄初始位置
-            self.is_triggered = True
-            self.initial_robot_pose_x = self.robot_2d_pose_x
-            self.initial_robot_pose_y = self.robot_2d_pose_y
-        # 計算當前移動距離
-        current_dist = self.fnCalcDistPoints(self.initial_robot_pose_x, self.robot_2d_pose_x, self.initial_robot_pose_y, self.robot_2d_pose_y)
-        # 計算剩餘距離
-        remaining_dist = dead_reckoning_dist - math.copysign(1, dead_reckoning_dist) * current_dist
-        # 判斷是否達到目標距離
-        if abs(remaining_dist) < threshold:  # 進入停止條件
-            self.cmd_vel.fnStop()
-            self.is_triggered = False
-            return True
-        else:
-            # 計算速度並保持方向
-            self.cmd_vel.fnGoStraight(Kp, remaining_dist)
-            return False
-            
     def fnSeqChangingDirection(self, desired_angle, object_name):
         self.SpinOnce()
         Kp = 0.02
@@ -179,15 +157,7 @@ class Action():
             
             if abs(desired_angle_turn) < desired_angle  :
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 20 :
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-                    return False
-            else:
-                self.check_wait_time =0
-                return False
+            return self.settle_direction.update(desired_angle_turn, self.marker_stamp, desired_angle)
         else:
             # rospy.logwarn("Confidence Low")
             return False
@@ -201,18 +171,11 @@ class Action():
             # print("threshod", threshod)
             if abs(self.marker_2d_theta) < threshod  :
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 20 :
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time =self.check_wait_time  + 1
-                    return False
             else:
                 self.cmd_vel.fnTurn(Kp, -self.marker_2d_theta)
-                self.check_wait_time = 0
-                return False
+            return self.settle_theta.update(self.marker_2d_theta, self.marker_stamp, threshod)
         else:
-            self.check_wait_time = 0
+            self.settle_theta.reset()
             return False
         
         
@@ -245,24 +208,11 @@ class Action():
             desired_angle_turn = -1. * desired_angle_turn
             self.cmd_vel.fnTurn(Kp, desired_angle_turn)
 
-            if abs(desired_angle_turn) < 0.03:
-                self.cmd_vel.fnStop()
-                if self.check_wait_time >15:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.go_straight.value
-                    self.is_triggered = False
-                else:
-                    self.check_wait_time =self.check_wait_time +1
-            elif abs(desired_angle_turn) < 0.045 and self.check_wait_time :
+            if abs(desired_angle_turn) < 0.03 or abs(desired_angle_turn) < 0.045 and self.settle_nearby_turn.entered is not None:
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 15:
-                    self.check_wait_time = 0
-                    self.current_nearby_sequence = self.NearbySequence.go_straight.value
-                    self.is_triggered = False
-                else:
-                    self.check_wait_time =self.check_wait_time +1
-            else:
-                self.check_wait_time =0    
+            if self.settle_nearby_turn.update(desired_angle_turn):
+                self.current_nearby_sequence = self.NearbySequence.go_straight.value
+                self.is_triggered = False
 
         elif self.current_nearby_sequence == self.NearbySequence.go_straight.value:
             if self.is_triggered == False:
@@ -336,21 +286,7 @@ class Action():
 
             if (abs(self.marker_2d_pose_x) < parking_dist)  :
                 self.cmd_vel.fnStop()
-                if self.check_wait_time > 15:
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            elif (abs(self.marker_2d_pose_x) < parking_dist) and self.check_wait_time:
-                self.cmd_vel.fnStop()
-                if self.check_wait_time > 15:
-                    self.check_wait_time = 0
-                    return True
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            else:
-                self.check_wait_time =0
-                return False
+            return self.settle_parking.update(abs(self.marker_2d_pose_x), self.marker_stamp, parking_dist)
         else:
             return False
         
@@ -383,31 +319,6 @@ class Action():
             self.cmd_vel.fnStop()
             return True
             
-    def fnCalcDistPoints(self, x1, x2, y1, y2):
-        return math.sqrt((x1 - x2) ** 2. + (y1 - y2) ** 2.)
-
-    def TrustworthyMarker2DTheta(self, time):
-        marker_2d_theta_list = [0.0]
-        initial_time = rospy.Time.now().secs
-        
-        while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.SpinOnce()
-            marker_2d_theta_list.append(self.marker_2d_theta)
-            # print("self.marker_2d_theta", self.marker_2d_theta)
-            rospy.sleep(0.05)
-        # print("marker_2d_theta_list", marker_2d_theta_list)
-        threshold = 0.5
-        mean = statistics.mean(marker_2d_theta_list)
-        stdev = statistics.stdev(marker_2d_theta_list)
-        upcutoff = mean + threshold * stdev
-        downcutoff = mean - threshold * stdev
-        clean_list = []
-        for i in marker_2d_theta_list:
-            if(i > downcutoff and i < upcutoff):
-               clean_list.append(i)
-               
-        return statistics.median(clean_list) 
-
     def TFConfidence(self, object_name):#判斷TF是否可信
         # rospy.loginfo('shelf_detection: {0}'.format(self.Subscriber.sub_detectionConfidence.shelf_detection))
         # rospy.loginfo('shelf_confidence: {0}'.format(self.Subscriber.sub_detectionConfidence.shelf_confidence))
@@ -421,86 +332,3 @@ class Action():
                 self.cmd_vel.fnStop()
                 return False
         return True
-     
-class cmd_vel():
-    def __init__(self, Subscriber):
-        self.Subscriber = Subscriber
-        self.pub_cmd_vel = self.Subscriber.pub_cmd_vel
-        self.front = False
-
-    def cmd_pub(self, twist):
-        if not self.front:
-            twist.linear.x = -twist.linear.x
-
-        if twist.angular.z > 0.2:
-            twist.angular.z =0.2
-        elif twist.angular.z < -0.2:
-            twist.angular.z =-0.2
-        if twist.linear.x > 0 and twist.linear.x < 0.02:
-            twist.linear.x =0.05
-        elif twist.linear.x < 0 and twist.linear.x > -0.02:
-            twist.linear.x =-0.05   
-
-        if twist.linear.x > 0.2:
-            twist.linear.x =0.2
-        elif twist.linear.x < -0.2:
-            twist.linear.x =-0.2                     
-        if twist.angular.z > 0 and twist.angular.z < 0.05:
-            twist.angular.z =0.05
-        elif twist.angular.z < 0 and twist.angular.z > -0.05:
-            twist.angular.z =-0.05
-        self.pub_cmd_vel.publish(twist)
-
-    def fnStop(self):
-        twist = Twist()
-        self.cmd_pub(twist)
-
-    def fnTurn(self, Kp=0.2, theta=0.):
-        # Kp = 0.3 #1.0
-        twist = Twist()
-        twist.angular.z = Kp * theta
-        self.cmd_pub(twist)
-
-    def fnGoStraight(self, Kp=0.2, v=0.):
-        twist = Twist()
-        twist.linear.x = Kp * v
-
-        self.cmd_pub(twist)
-
-    def fnGoBack(self):
-        twist = Twist()
-        twist.linear.x = -0.1
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnfork(self,direction):
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = direction
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-
-    def fnTrackMarker(self, theta, kp):
-        # Kp = 4.0 #6.5
-
-        twist = Twist()
-        twist.linear.x = 0.05
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-
-        twist.angular.z = kp * theta
-        self.cmd_pub(twist)
-
-  
@@ -4,13 +4,12 @@ import numpy as np
 import math
 from geometry_msgs.msg import Twist
 from enum import Enum
+from PBVS_Core import ActionCore
 from forklift_msg.msg import meteorcar
-import statistics
-class Action():
+class Action(ActionCore):
     def __init__(self, Subscriber):
         # cmd_vel
-        self.cmd_vel = cmd_vel()
-        self.Subscriber = Subscriber
+        ActionCore.__init__(self, Subscriber, 'minicar', rospy.Publisher('/cmd_vel', Twist, queue_size = 1))
         self.NearbySequence = Enum('NearbySequence', 'initial_turn go_straight turn_right parking ')
         self.current_nearby_sequence = self.NearbySequence.initial_turn.value
         # fork_cmd
@@ -34,6 +33,7 @@ class Action():
         # Fork_param
         self.forwardbackpostion = 0.0
         self.updownposition = 0.0
+        self.fork_target = None  # 目前 fork_updown 的目標高度, feedback 用
         self.fork_threshold = 0.005
         # other
         self.check_wait_time = 0
@@ -69,6 +69,7 @@ class Action():
     def fork_updown(self, desired_updownposition):#0~2.7
         if(desired_updownposition < 0):
             return True
+        self.fork_target = desired_updownposition
         
         self.update_fork()
         if self.updownposition < desired_updownposition - self.fork_threshold:
@@ -106,7 +107,7 @@ class Action():
         else:
             desired_angle_turn = desired_angle_turn - math.pi
 
-        self.cmd_vel.fnTurn(desired_angle_turn)
+        self.cmd_vel.fnTurn(theta=desired_angle_turn)
         
         if abs(desired_angle_turn) < desired_angle  :
             self.cmd_vel.fnStop()
@@ -135,7 +136,7 @@ class Action():
     def TurnByTime(self, desired_angle_turn, time):
         initial_time = rospy.Time.now().secs
         while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.cmd_vel.fnTurn(desired_angle_turn)
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
             rospy.sleep(0.1)
         self.cmd_vel.fnStop()
         
@@ -158,7 +159,7 @@ class Action():
                 self.check_wait_time =self.check_wait_time  +1
                 return False
         else:
-            self.cmd_vel.fnTurn(desired_angle_turn)
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
             rospy.sleep(0.3)
             self.check_wait_time =0
             return False
@@ -188,7 +189,7 @@ class Action():
 
             
             desired_angle_turn = -1. * desired_angle_turn
-            self.cmd_vel.fnTurn(desired_angle_turn)
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
 
             if abs(desired_angle_turn) < 0.03:
                 self.cmd_vel.fnStop()
@@ -225,7 +226,7 @@ class Action():
             if remained_dist < 0  :remained_dist =0
 
             
-            self.cmd_vel.fnGoStraight(desired_dist)
+            self.cmd_vel.fnGoStraight(v=desired_dist)
 
             if abs(remained_dist) < 0.07:
                 self.cmd_vel.fnStop()
@@ -243,7 +244,7 @@ class Action():
             elif self.initial_marker_pose_theta > 0.0:
                 desired_angle_turn = -(math.pi / 2.0) + (self.robot_2d_theta - self.initial_robot_pose_theta)
             
-            self.cmd_vel.fnTurn(desired_angle_turn)
+            self.cmd_vel.fnTurn(theta=desired_angle_turn)
             if abs(desired_angle_turn) < 0.03:
                 self.cmd_vel.fnStop()
                 if self.check_wait_time > 20:
@@ -318,7 +319,7 @@ class Action():
                 self.is_triggered = False
                 return True
             else:
-                self.cmd_vel.fnGoStraight(-(dead_reckoning_dist - dist))
+                self.cmd_vel.fnGoStraight(v=-(dead_reckoning_dist - dist))
                 return False
         elif math.copysign(1, dead_reckoning_dist) < 0.0:
             if  dead_reckoning_dist - dist > 0.0:
@@ -326,7 +327,7 @@ class Action():
                 self.is_triggered = False
                 return True
             else:
-                self.cmd_vel.fnGoStraight(-(dead_reckoning_dist - dist))
+                self.cmd_vel.fnGoStraight(v=-(dead_reckoning_dist - dist))
                 return False
 
     def fnseqmove_to_marker_dist(self, marker_dist): #(使用marker)前後移動到距離marker_dist公尺的位置
@@ -339,140 +340,11 @@ class Action():
         dist = math.sqrt(self.marker_2d_pose_x**2 + self.marker_2d_pose_y**2)
         
         if dist < (marker_dist-threshold):
-            self.cmd_vel.fnGoStraight(-(marker_dist - dist))
+            self.cmd_vel.fnGoStraight(v=-(marker_dist - dist))
             return False
         elif dist > (marker_dist+threshold):
-            self.cmd_vel.fnGoStraight(-(marker_dist - dist))
+            self.cmd_vel.fnGoStraight(v=-(marker_dist - dist))
             return False
         else:
             self.cmd_vel.fnStop()
             return True
-            
-    def fnCalcDistPoints(self, x1, x2, y1, y2):
-        return math.sqrt((x1 - x2) ** 2. + (y1 - y2) ** 2.)
-
-    def TrustworthyMarker2DTheta(self, time):
-        marker_2d_theta_list = [0.0]
-        initial_time = rospy.Time.now().secs
-        
-        while(abs(initial_time - rospy.Time.now().secs) < time):
-            self.SpinOnce()
-            marker_2d_theta_list.append(self.marker_2d_theta)
-            # print("self.marker_2d_theta", self.marker_2d_theta)
-            rospy.sleep(0.05)
-        # print("marker_2d_theta_list", marker_2d_theta_list)
-        threshold = 0.5
-        mean = statistics.mean(marker_2d_theta_list)
-        stdev = statistics.stdev(marker_2d_theta_list)
-        upcutoff = mean + threshold * stdev
-        downcutoff = mean - threshold * stdev
-        clean_list = []
-        for i in marker_2d_theta_list:
-            if(i > downcutoff and i < upcutoff):
-               clean_list.append(i)
-               
-        return statistics.median(clean_list) 
-     
-class cmd_vel():
-    def __init__(self):
-        self.pub_cmd_vel = rospy.Publisher('/cmd_vel', Twist, queue_size = 1)
-        self.front = False
-
-    def cmd_pub(self, twist):
-        if not self.front:
-            twist.linear.x = -twist.linear.x
-
-        if twist.angular.z > 0.2:
-            twist.angular.z =0.2
-        elif twist.angular.z < -0.2:
-            twist.angular.z =-0.2
-        if twist.linear.x > 0 and twist.linear.x < 0.02:
-            twist.linear.x =0.05
-        elif twist.linear.x < 0 and twist.linear.x > -0.02:
-            twist.linear.x =-0.05   
-
-        if twist.linear.x > 0.2:
-            twist.linear.x =0.2
-        elif twist.linear.x < -0.2:
-            twist.linear.x =-0.2                     
-        if twist.angular.z > 0 and twist.angular.z < 0.05:
-            twist.angular.z =0.05
-        elif twist.angular.z < 0 and twist.angular.z > -0.05:
-            twist.angular.z =-0.05
-        self.pub_cmd_vel.publish(twist)
-
-    def fnStop(self):
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnTurn(self, theta):
-        Kp = 0.3 #1.0
-        angular_z = Kp * theta
-        
-
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        
-        twist.angular.z = -angular_z
-
-        self.cmd_pub(twist)
-
-    def fnGoStraight(self,v):
-        twist = Twist()
-        twist.linear.x = v*0.8
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnGoBack(self):
-        twist = Twist()
-        twist.linear.x = -0.1
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-    def fnfork(self,direction):
-        twist = Twist()
-        twist.linear.x = 0
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = direction
-        twist.angular.z = 0
-
-        self.cmd_pub(twist)
-
-
-    def fnTrackMarker(self, theta):
-        Kp = 4.0 #6.5
-
-        twist = Twist()
-        twist.linear.x = 0.05
-        twist.linear.y = 0
-        twist.linear.z = 0
-        twist.angular.x = 0
-        twist.angular.y = 0
-
-        twist.angular.z = -Kp * theta
-        self.cmd_pub(twist)
-
-  
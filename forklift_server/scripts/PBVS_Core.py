@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import rospy
+import math
+import time
+from geometry_msgs.msg import Twist
+from VehicleProfile import load_profile
+from CommandShaper import CommandShaper
+
+
+class CmdVel():
+    # 各車型共用的 cmd_vel 輸出, 增益、方向與限幅由 VehicleProfile 決定
+    # 所有步驟都經過 cmd_pub: 限制最大值 -> CommandShaper 限制加速度與 jerk -> 死區補償
+    def __init__(self, publisher, profile):
+        self.pub_cmd_vel = publisher
+        self.profile = profile
+        self.shaper = CommandShaper(profile)
+        self.front = False
+
+    def cmd_pub(self, twist):
+        if not self.front:
+            twist.linear.x = -twist.linear.x
+        linear, angular = self.shaper.shape(*self.profile.clamp(twist.linear.x, twist.angular.z))
+        twist.linear.x, twist.angular.z = self.profile.compensate(linear, angular)
+        self.pub_cmd_vel.publish(twist)
+
+    def fnStop(self):
+        # 停車 (到達門檻、取消、逾時、偵測中斷) 立即生效, 不經過減速
+        self.shaper.reset()
+        self.cmd_pub(Twist())
+
+    def fnTurn(self, Kp=None, theta=0.):
+        twist = Twist()
+        twist.angular.z = self.profile.angular_sign * (self.profile.turn_kp if Kp is None else Kp) * theta
+        self.cmd_pub(twist)
+
+    def fnGoStraight(self, Kp=None, v=0.):
+        twist = Twist()
+        twist.linear.x = (self.profile.straight_kp if Kp is None else Kp) * v
+        self.cmd_pub(twist)
+
+    def fnGoBack(self):
+        twist = Twist()
+        twist.linear.x = self.profile.back_speed
+        self.cmd_pub(twist)
+
+    def fnfork(self, direction):
+        twist = Twist()
+        twist.angular.y = direction
+        self.cmd_pub(twist)
+
+    def fnTrackMarker(self, theta, kp=None):
+        twist = Twist()
+        twist.linear.x = self.profile.track_speed
+        twist.angular.z = self.profile.angular_sign * (self.profile.track_kp if kp is None else kp) * theta
+        self.cmd_pub(twist)
+
+
+class ActionCore():
+    # PBVS_Action* 共用的步驟; 子類別提供 SpinOnce(), 並設定 robot_2d_* / marker_2d_* 與 is_triggered
+    def __init__(self, Subscriber, profile_name, publisher, cmd_vel_class=CmdVel):
+        self.Subscriber = Subscriber
+        self.profile = load_profile(profile_name)
+        self.cmd_vel = cmd_vel_class(publisher, self.profile)
+
+    def fnCalcDistPoints(self, x1, x2, y1, y2):
+        return math.sqrt((x1 - x2) ** 2. + (y1 - y2) ** 2.)
+
+    def fnRotateToRelativeLine(self, distance, Kp, v):
+        time_needed = abs(distance / (Kp * v))   # 計算所需的行駛時間
+        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
+        rospy.loginfo(f'time_needed:{time_needed}')
+        # 開始移動
+        while (rospy.Time.now().secs) < (start_time + time_needed):
+            self.cmd_vel.fnGoStraight(Kp, v)
+            time.sleep(0.1)  # 每 0.1 秒發送一次指令
+        self.cmd_vel.fnStop()   # 停止機器人
+        return True
+
+    def fnseqDeadReckoningAngle_Time(self, target_angle, Kp, theta):
+        target_angle_rad = math.radians(target_angle)   # 計算目標角度（弧度）
+        time_needed = target_angle_rad / (Kp * theta)    # 計算所需的行駛時間
+        start_time = rospy.Time.now().secs  # 獲取當前時間（秒）
+        rospy.loginfo(f'time_needed:{time_needed}')
+        while (rospy.Time.now().secs) < (start_time + time_needed):
+            self.cmd_vel.fnTurn(Kp, theta)
+            time.sleep(0.1)  # 每 0.1 秒發送一次指令
+        self.cmd_vel.fnStop()   # 停止機器人
+        return True
+
+    def fnseqDeadReckoningAngle(self, target_angle):
+        self.SpinOnce()  # 確保獲取到最新位置
+        Kp = self.profile.rotate_kp
+        threshold = 0.015  # 停止的閾值（弧度）
+        target_angle_rad = math.radians(target_angle)   # 將目標角度轉換為弧度
+        if not self.is_triggered:   # 初始化：如果是第一次調用，記錄初始累積角度
+            self.is_triggered = True
+            self.initial_total_theta = self.robot_2d_theta  # 使用累積的總角度作為初始角度
+
+        current_angle = self.robot_2d_theta - self.initial_total_theta  # 計算當前已旋轉的角度
+        remaining_angle = target_angle_rad - current_angle  # 計算剩餘的旋轉角度
+        if abs(remaining_angle) < threshold:   # 判斷是否達到目標角度
+            self.cmd_vel.fnStop()  # 停止機器人
+            self.is_triggered = False  # 重置觸發狀態
+            return True
+        else:
+            self.cmd_vel.fnTurn(Kp, remaining_angle)    # 執行旋轉，正負值決定方向
+            return False
+
+    def fnseqDeadReckoning(self, dead_reckoning_dist):  # 使用里程計算移動到指定距離
+        self.SpinOnce()  # 確保獲取到最新位置
+        Kp = self.profile.straight_kp
+        threshold = 0.015  # 停止的閾值
+        if self.is_triggered == False:  # 如果還沒啟動，記錄初始位置
+            self.is_triggered = True
+            self.initial_robot_pose_x = self.robot_2d_pose_x
+            self.initial_robot_pose_y = self.robot_2d_pose_y
+        # 計算當前移動距離
+        current_dist = self.fnCalcDistPoints(self.initial_robot_pose_x, self.robot_2d_pose_x, self.initial_robot_pose_y, self.robot_2d_pose_y)
+        # 計算剩餘距離
+        remaining_dist = dead_reckoning_dist - math.copysign(1, dead_reckoning_dist) * current_dist
+        # 判斷是否達到目標距離
+        if abs(remaining_dist) < threshold:  # 進入停止條件
+            self.cmd_vel.fnStop()
+            self.is_triggered = False
+            return True
+        else:
+            # 計算速度並保持方向
+            self.cmd_vel.fnGoStraight(Kp, remaining_dist)
+            return False
+
+    def TrustworthyMarker2DTheta(self, time):
+        # 最近 time 秒已收到的偵測 (Subscriber.marker_history) 以 robust 估計 (預設 Huber) 求 theta, 立即回傳不阻塞
+        # 樣本不足時使用目前的 marker_2d_theta
+        theta, count = self.Subscriber.marker_history.estimate('theta', time)
+        if theta is None:
+            rospy.logwarn('only {0} marker samples in the last {1:.1f} s, using the latest theta'.format(count, time))
+            return self.marker_2d_theta
+        return theta
@@ -3,6 +3,10 @@ import rospy
 import forklift_server.msg
 from enum import Enum
 from PBVS_Action_differential import Action
+from ControlLoop import ControlLoop
+from ConvergenceDetector import ConvergenceDetector
+from GoalControl import GoalControl
+from ProgressReporter import ProgressReporter
 # from forklift_msg.msg import meteorcar
 ParkingCameraSequence = Enum( 'ParkingCameraSequence', \
                     'initial_marker \
@@ -35,17 +39,36 @@ class PBVS():
         self.subscriber = subscriber
         self.command = mode.command
         self.layer_dist = mode.layer_dist
-        self.check_wait_time = 0
         self.Action = Action(self.subscriber)
+        self.stop_settle = ConvergenceDetector(self.subscriber.settle_time, float('inf'))  # 停止後等待 settle_time 秒才結束
+        self.control_loop = ControlLoop(self.subscriber.control_rate)
+        self.progress = ProgressReporter(self._as, forklift_server.msg.PBVSMegaposeFeedback, self.subscriber.feedback_rate, self.fnProgress)  # server 在 goal 結束時 stop()
+
+    def fnProgress(self):
+        # feedback: 控制器最近使用的 marker 位置, 此車型沒有牙叉高度目標
+        return self.Action.marker_2d_pose_x, self.Action.marker_2d_pose_y, self.Action.marker_2d_theta, float('nan')
+
+    def fnStopMotion(self):
+        # 取消或逾時: 停止車體與剪鉗手臂, 關閉偵測
+        self.Action.cmd_vel.fnStop()
+        self.Action.cmd_vel.fnClawStop()
+        self.subscriber.fnDetectionAllowed(False, self.layer_dist)  # fnDetectionAllowed(self, pose_detection, layer)
+        self.Action.is_triggered = False
 
     def parking_camera(self):
         current_sequence = ParkingCameraSequence.initial_marker.value
         previous_sequence = None  # 用來記錄上一次的階段
 
+        guard = GoalControl(self._as, self.fnStopMotion, self.subscriber.goal_timeout)
+        self.control_loop.start('parking_camera')
+        self.progress.start('parking_camera')
         while(not rospy.is_shutdown()):
+            if guard.check():
+                return guard.outcome
             # 如果 current_sequence 發生變化，記錄 log
             if current_sequence != previous_sequence:
                 rospy.loginfo('Current Sequence: {0}'.format(ParkingCameraSequence(current_sequence)))
+                self.progress.set_state(ParkingCameraSequence(current_sequence).name)
                 previous_sequence = current_sequence  # 更新 previous_sequence
 
             if(current_sequence == ParkingCameraSequence.initial_marker.value):
@@ -111,20 +134,24 @@ class PBVS():
             else:
                 rospy.logerr('Error: {0} does not exist'.format(current_sequence))
                 self.subscriber.fnDetectionAllowed(False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
+                if self.stop_settle.update(0.0):
                     return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
+            self.control_loop.sleep(ParkingCameraSequence(current_sequence).name)
     
     def odom_front(self):
         current_sequence = FrontSequence.Front.value
         previous_sequence = None  # 用來記錄上一次的階段
 
+        guard = GoalControl(self._as, self.fnStopMotion, self.subscriber.goal_timeout)
+        self.control_loop.start('odom_front')
+        self.progress.start('odom_front')
         while(not rospy.is_shutdown()):
+            if guard.check():
+                return guard.outcome
             # 如果 current_sequence 發生變化，記錄 log
             if current_sequence != previous_sequence:
                 rospy.loginfo('Current Sequence: {0}'.format(FrontSequence(current_sequence)))
+                self.progress.set_state(FrontSequence(current_sequence).name)
                 previous_sequence = current_sequence  # 更新 previous_sequence
             self.subscriber.fnDetectionAllowed(False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
 
@@ -135,27 +162,28 @@ class PBVS():
                     self.is_sequence_finished = False
 
             elif(current_sequence == FrontSequence.stop.value):
-                    if self.check_wait_time > 15 :
-                        self.check_wait_time = 0
+                    if self.stop_settle.update(0.0):
                         return
-                    else:
-                        self.check_wait_time =self.check_wait_time  +1
             else:
                 rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
+                if self.stop_settle.update(0.0):
                     return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
+            self.control_loop.sleep(FrontSequence(current_sequence).name)
             
     def odom_turn(self):
         current_sequence = TurnSequence.Turn.value
         previous_sequence = None  # 用來記錄上一次的階段
 
+        guard = GoalControl(self._as, self.fnStopMotion, self.subscriber.goal_timeout)
+        self.control_loop.start('odom_turn')
+        self.progress.start('odom_turn')
         while(not rospy.is_shutdown()):
+            if guard.check():
+                return guard.outcome
             # 如果 current_sequence 發生變化，記錄 log
             if current_sequence != previous_sequence:
                 rospy.loginfo('Current Sequence: {0}'.format(TurnSequence(current_sequence)))
+                self.progress.set_state(TurnSequence(current_sequence).name)
                 previous_sequence = current_sequence  # 更新 previous_sequence
             self.subscriber.fnDetectionAllowed(False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
 
@@ -166,15 +194,10 @@ class PBVS():
                     self.is_sequence_finished = False
                 
                 elif(current_sequence == TurnSequence.stop.value):
-                    if self.check_wait_time > 15 :
-                        self.check_wait_time = 0
+                    if self.stop_settle.update(0.0):
                         return
-                    else:
-                        self.check_wait_time =self.check_wait_time  +1
             else:
                 rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
+                if self.stop_settle.update(0.0):
                     return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
+            self.control_loop.sleep(TurnSequence(current_sequence).name)
@@ -1,51 +1,15 @@
 # -*- coding: utf-8 -*-
 import rospy
 import forklift_server.msg
-from enum import Enum
 from PBVS_Action_megapose import Action
+from ControlLoop import ControlLoop
+from ConvergenceDetector import ConvergenceDetector
+from SequenceEngine import SequenceEngine, load_sequences
+from GoalControl import GoalControl
+from ProgressReporter import ProgressReporter
 # from forklift_msg.msg import meteorcar
-ParkingBodyCameraSequence = Enum( 'ParkingBodyCameraSequence', \
-                    'init_fork \
-                    changing_direction \
-                    move_nearby_parking_lot \
-                    parking \
-                    changingtheta \
-                    decide \
-                    back \
-                    stop \
-                    error')
-ParkingForkCameraSequence = Enum( 'ParkingForkCameraSequence', \
-                        'init_fork \
-                        changing_direction \
-                        parking \
-                        changingtheta \
-                        decide \
-                        back \
-                        stop \
-                        error')
-RaisePalletSequence = Enum( 'RaisePalletSequence', \
-                        'init_fork \
-                        dead_reckoning \
-                        fork_updown \
-                        back \
-                        stop \
-                        error')
-DropPalletSequence = Enum( 'DropPalletSequence', \
-                        'init_fork \
-                        dead_reckoning \
-                        fork_updown \
-                        back \
-                        stop \
-                        error')
-FrontSequence = Enum( 'FrontSequence', \
-                        'Front \
-                        stop \
-                        error')
-TurnSequence = Enum( 'TurnSequence', \
-                        'Turn \
-                        stop \
-                        error')
-    
+
+
 class PBVS():
     def __init__(self, _as, subscriber, mode):
         self._as = _as
@@ -54,359 +18,90 @@ class PBVS():
         self.subscriber = subscriber
         self.command = mode.command
         self.layer_dist = mode.layer_dist
-        self.check_wait_time = 0
         self.Action = Action(self.subscriber)
+        self.stop_settle = ConvergenceDetector(self.subscriber.settle_time, 0.01)  # 車速低於 0.01 m/s 持續 settle_time 秒才結束
+        self.control_loop = ControlLoop(self.subscriber.control_rate)
+        self.sequences = load_sequences(default_file='PBVS_sequences_megapose.yaml')  # 每個 goal 重新讀取, rosparam load 後不用重啟
+        self.progress = ProgressReporter(self._as, forklift_server.msg.PBVSMegaposeFeedback, self.subscriber.feedback_rate, self.fnProgress)
+
+    def run_sequence(self, name):
+        # 依 config/PBVS_sequences_megapose.yaml 的表格執行 sequence, 表格的 goal_timeout 優先於 ~goal_timeout
+        table = self.sequences[name]
+        guard = GoalControl(self._as, self.fnStopMotion, table.get('goal_timeout', self.subscriber.goal_timeout))
+        engine = SequenceEngine(name, table, (self, self.subscriber, self.Action), stop=self.fnStopMotion, guard=guard)
+        self.progress.start(name, engine)
+        try:
+            outcome = engine.run(self.control_loop)
+        finally:
+            self.progress.stop()
+        if outcome == 'abort':
+            self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
+        return outcome
+
+    def fnSettle(self):
+        # stop / error state: 等車體停穩
+        return self.stop_settle.update(self.subscriber.SpinOnce_velocity())
+
+    def fnProgress(self):
+        # feedback: 控制器最近使用的 marker 位置與牙叉高度誤差
+        fork_error = self.Action.updownposition - self.Action.fork_target if self.Action.fork_target is not None else float('nan')
+        return self.Action.marker_2d_pose_x, self.Action.marker_2d_pose_y, self.Action.marker_2d_theta, fork_error
+
+    def fnStopMotion(self):
+        # 取消或逾時: 停止車體與牙叉, 關閉偵測, 清除步驟的觸發狀態
+        self.Action.cmd_vel.fnStop()
+        self.Action.fnForkStop()
+        self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
+        self.Action.fork_controller.reset()
+        self.Action.is_fork_init_moving = False
+        self.Action.is_triggered = False
 
     def parking_bodycamera(self):
-        current_sequence = ParkingBodyCameraSequence.init_fork.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(ParkingBodyCameraSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-
-            if(current_sequence == ParkingBodyCameraSequence.init_fork.value):
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-
-                self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.bodycamera_parking_fork_init)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.changing_direction.value
-                    self.is_sequence_finished = False
-            
-            elif(current_sequence == ParkingBodyCameraSequence.changing_direction.value):
-                self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqChangingDirection(self.subscriber.bodycamera_ChangingDirection_threshold, "bodycamera")
-
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.move_nearby_parking_lot.value
-                    self.is_sequence_finished = False
-            
-            elif(current_sequence == ParkingBodyCameraSequence.move_nearby_parking_lot.value):
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqMovingNearbyParkingLot(self.subscriber.bodycamera_desired_dist_threshold)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.parking.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingBodyCameraSequence.parking.value):
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqParking(self.subscriber.bodycamera_parking_stop, 1.0, "bodycamera")
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.changingtheta.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingBodyCameraSequence.changingtheta.value):
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqChangingtheta(self.subscriber.bodycamera_Changingtheta_threshold, "bodycamera")
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.decide.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingBodyCameraSequence.decide.value):
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqdecide(self.subscriber.bodycamera_decide_distance)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingBodyCameraSequence.stop.value
-                    self.is_sequence_finished = False
-                elif self.is_sequence_finished == False:
-                    current_sequence = ParkingBodyCameraSequence.back.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingBodyCameraSequence.back.value):
-                # self.is_sequence_finished = self.Action.fnseqMoveToMarkerDist(self.subscriber.bodycamera_back_distance)
-                # self.subscriber.fnDetectionAllowed(True, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(-self.subscriber.bodycamera_back_distance)
-                
-                if self.is_sequence_finished == True:
-                    rospy.Rate(1).sleep()
-                    current_sequence = ParkingBodyCameraSequence.parking.value
-                    self.is_sequence_finished = False
+        return self.run_sequence('parking_bodycamera')
 
-            elif(current_sequence == ParkingBodyCameraSequence.stop.value):
-                self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            
-            else:
-                rospy.logerr('Error: {0} does not exist'.format(current_sequence))
-                self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-               
     def parking_forkcamera(self):
-        current_sequence = ParkingForkCameraSequence.init_fork.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(ParkingForkCameraSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-
-            if(current_sequence == ParkingForkCameraSequence.init_fork.value):
-                # self.subscriber.fnDetectionAllowed(False, True, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                if self.layer_dist == 1.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.forkcamera_parking_fork_layer1)
-                elif self.layer_dist == 2.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.forkcamera_parking_fork_layer2)
-                else:
-                    rospy.loginfo('Layer is not defined')
-                    self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                    return
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingForkCameraSequence.parking.value
-                    self.is_sequence_finished = False
-            
-            elif(current_sequence == ParkingForkCameraSequence.parking.value):
-                self.subscriber.fnDetectionAllowed(False, True, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqParking(self.subscriber.forkcamera_parking_stop, 1.0, "forkcamera")
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingForkCameraSequence.changingtheta.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingForkCameraSequence.changingtheta.value):
-                # self.subscriber.fnDetectionAllowed(False, True, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqChangingtheta(self.subscriber.forkcamera_Changingtheta_threshold, "forkcamera")
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingForkCameraSequence.decide.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingForkCameraSequence.decide.value):
-                # self.subscriber.fnDetectionAllowed(False, True, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnSeqdecide(self.subscriber.forkcamera_decide_distance)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingForkCameraSequence.stop.value
-                    self.is_sequence_finished = False
-                elif self.is_sequence_finished == False:
-                    current_sequence = ParkingForkCameraSequence.back.value
-                    self.is_sequence_finished = False
-            elif(current_sequence == ParkingForkCameraSequence.back.value):
-                # self.is_sequence_finished = self.Action.fnseqMoveToMarkerDist(self.subscriber.forkcamera_back_distance)
-                # self.subscriber.fnDetectionAllowed(False, True, self.layer_dist)  # fnDetectionAllowed(self, shelf_detection, pallet_detection, layer)
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(-self.subscriber.forkcamera_back_distance)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = ParkingForkCameraSequence.parking.value
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == ParkingForkCameraSequence.stop.value):
-                self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            
-            else:
-                rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
+        return self.run_sequence('parking_forkcamera')
 
     def raise_pallet(self):
-        current_sequence = RaisePalletSequence.init_fork.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(RaisePalletSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-            self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-
-            if(current_sequence == RaisePalletSequence.init_fork.value):
-                if self.layer_dist == 1.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.raise_pallet_fork_init_layer1)
-                elif self.layer_dist == 2.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.raise_pallet_fork_init_layer2)
-                else:
-                    rospy.loginfo('Layer is not defined')
-                    return
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = RaisePalletSequence.dead_reckoning.value
-                    feedback = str(RaisePalletSequence(current_sequence))
-                    rospy.loginfo('fnseqDeadReckoning change to:{0}'.format(feedback))
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == RaisePalletSequence.dead_reckoning.value):
-                # rospy.loginfo('fnseqDeadReckoning: {0}'.format(self.subscriber.raise_pallet_dead_reckoning_dist))
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(self.subscriber.raise_pallet_dead_reckoning_dist)
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = RaisePalletSequence.fork_updown.value
-                    self.is_sequence_finished = False
+        return self.run_sequence('raise_pallet')
 
-            elif(current_sequence == RaisePalletSequence.fork_updown.value):
-                if self.layer_dist == 1.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.raise_pallet_raise_height_layer1)
-                elif self.layer_dist == 2.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.raise_pallet_raise_height_layer2)
-                else:
-                    rospy.loginfo('Layer is not defined')
-                    return
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = RaisePalletSequence.back.value
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == RaisePalletSequence.back.value):
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(-self.subscriber.raise_pallet_back_distance)
-
-                if self.is_sequence_finished == True:
-                    current_sequence = RaisePalletSequence.stop.value
-                    self.is_sequence_finished = False
-            
-            elif(current_sequence == RaisePalletSequence.stop.value):
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            
-            else:
-                rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-              
     def drop_pallet(self):
-        current_sequence = DropPalletSequence.init_fork.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(DropPalletSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-            self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-
-            if(current_sequence == DropPalletSequence.init_fork.value):
-                if self.layer_dist == 1.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.drop_pallet_fork_init_layer1)
-                elif self.layer_dist == 2.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.drop_pallet_fork_init_layer2)
-                else:
-                    rospy.loginfo('Layer is not defined')
-                    return
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = DropPalletSequence.dead_reckoning.value
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == DropPalletSequence.dead_reckoning.value):
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(self.subscriber.drop_pallet_dead_reckoning_dist)
-                if self.is_sequence_finished == True:
-                    current_sequence = DropPalletSequence.fork_updown.value
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == DropPalletSequence.fork_updown.value):
-                if self.layer_dist == 1.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.drop_pallet_drop_height_layer1)
-                elif self.layer_dist == 2.0:
-                    self.is_sequence_finished = self.Action.fnForkUpdown(self.subscriber.drop_pallet_drop_height_layer2)
-                else:
-                    rospy.loginfo('Layer is not defined')
-                    return
-                
-                if self.is_sequence_finished == True:
-                    current_sequence = DropPalletSequence.back.value
-                    self.is_sequence_finished = False
+        return self.run_sequence('drop_pallet')
+
+    def pre_position_fork(self):
+        # 導航途中先把牙叉移向 parking_forkcamera 的初始高度, 高度不超過依車速計算的安全上限
+        # 完成回傳 'stop', 層數未定義或目標高於靜止時的上限回傳 'abort'
+        if self.layer_dist == 1.0:
+            target = self.subscriber.forkcamera_parking_fork_layer1
+        elif self.layer_dist == 2.0:
+            target = self.subscriber.forkcamera_parking_fork_layer2
+        else:
+            rospy.logwarn('Layer is not defined')
+            return 'abort'
+        if target > self.subscriber.fork_height_limit_stopped:
+            # 車停止時也到不了的高度, 等下去只會逾時
+            rospy.logwarn('pre_position_fork target {0:.3f} above fork_height_limit_stopped {1:.3f}'.format(
+                target, self.subscriber.fork_height_limit_stopped))
+            return 'abort'
+
+        guard = GoalControl(self._as, self.Action.fnForkStop, self.subscriber.goal_timeout)
+        self.control_loop.start('pre_position_fork')
+        self.progress.start('pre_position_fork', state='fork_updown')
+        try:
+            while(not rospy.is_shutdown()):
+                if guard.check():
+                    return guard.outcome
+                desired = min(target, self.Action.fnForkHeightLimit())
+                self.is_sequence_finished = self.Action.fnForkUpdown(desired)
+                if self.is_sequence_finished == True and desired >= target:
+                    return 'stop'
+                self.control_loop.sleep()
+            return 'abort'  # rospy shutdown
+        finally:
+            self.progress.stop()
 
-            elif(current_sequence == DropPalletSequence.back.value):
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(-self.subscriber.drop_pallet_back_distance)
-                if self.is_sequence_finished == True:
-                    current_sequence = DropPalletSequence.stop.value
-                    self.is_sequence_finished = False
-
-            elif(current_sequence == DropPalletSequence.stop.value):
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            else:
-                rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-    
     def odom_front(self):
-        current_sequence = FrontSequence.Front.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(FrontSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-            self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-
-            if(current_sequence == FrontSequence.Front.value):
-                self.is_sequence_finished = self.Action.fnseqDeadReckoning(-self.layer_dist)
-                if self.is_sequence_finished == True:
-                    current_sequence = FrontSequence.stop.value
-                    self.is_sequence_finished = False
+        return self.run_sequence('odom_front')
 
-            elif(current_sequence == FrontSequence.stop.value):
-                    if self.check_wait_time > 15 :
-                        self.check_wait_time = 0
-                        return
-                    else:
-                        self.check_wait_time =self.check_wait_time  +1
-            else:
-                rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
-            
     def odom_turn(self):
-        current_sequence = TurnSequence.Turn.value
-        previous_sequence = None  # 用來記錄上一次的階段
-
-        while(not rospy.is_shutdown()):
-            # 如果 current_sequence 發生變化，記錄 log
-            if current_sequence != previous_sequence:
-                rospy.loginfo('Current Sequence: {0}'.format(TurnSequence(current_sequence)))
-                previous_sequence = current_sequence  # 更新 previous_sequence
-            self.subscriber.fnDetectionAllowed(False, False, self.layer_dist)  # fnDetectionAllowed(self, shelf_string, pallet_string)
-
-            if(current_sequence == TurnSequence.Turn.value):
-                self.is_sequence_finished = self.Action.fnseqDeadReckoningAngle(self.layer_dist)
-                if self.is_sequence_finished == True:
-                    current_sequence = TurnSequence.stop.value
-                    self.is_sequence_finished = False
-                
-                elif(current_sequence == TurnSequence.stop.value):
-                    if self.check_wait_time > 15 :
-                        self.check_wait_time = 0
-                        return
-                    else:
-                        self.check_wait_time =self.check_wait_time  +1
-            else:
-                rospy.loginfo('Error: {0} does not exist'.format(current_sequence))
-                if self.check_wait_time > 15 :
-                    self.check_wait_time = 0
-                    return
-                else:
-                    self.check_wait_time =self.check_wait_time  +1
+        return self.run_sequence('odom_turn')
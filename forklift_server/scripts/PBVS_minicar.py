@@ -3,6 +3,9 @@ import rospy
 import forklift_server.msg
 from enum import Enum
 from PBVS_Action_minicar import Action
+from ControlLoop import ControlLoop
+from GoalControl import GoalControl
+from ProgressReporter import ProgressReporter
 # from forklift_msg.msg import meteorcar
 class PBVS():
     ParkingSequence = Enum( 'ParkingSequence', \
@@ -41,23 +44,26 @@ class PBVS():
         self. TilePositionv=mode.TilePosition
         self. MovePosition=mode.MovePosition
         self.Action = Action(self.subscriber)
-        self.init_PBVS_parame()
         
 
-    def init_PBVS_parame(self):
+    def run(self):
+        # 執行 goal, 回傳結束狀態給 set_goal_result (None 為成功)
         self.is_sequence_finished = False
+        self.control_loop = ControlLoop(rospy.get_param(rospy.get_name() + "/control_rate", 10.0))
+        self.guard = GoalControl(self._as, self.fnStopMotion, rospy.get_param(rospy.get_name() + "/goal_timeout", 0.0))
+        self.progress = ProgressReporter(self._as, forklift_server.msg.PBVSFeedback, rospy.get_param(rospy.get_name() + "/feedback_rate", 5.0), self.fnProgress)
         if self.ActionCode==20:
             self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode==21:
             self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode==22:
             self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         elif self.ActionCode==30:
             self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-            self.main_loop()
+            return self.main_loop()
         else:
             if self.ActionCode==10:
                 if self.ShelfParameter==0:
@@ -78,7 +84,7 @@ class PBVS():
                 self.back_distance = rospy.get_param(rospy.get_name() + "/bodycamera_back_distance", 3.0)
                 self.current_parking_sequence = self.ParkingSequence.init_fork.value #for 大車
                 # self.current_parking_sequence = self.ParkingSequence.changing_direction_1.value # for 小車
-                self.main_loop()
+                return self.main_loop()
 
             elif self.mode == "parking_forkcamera":
                 self.subscriber.updown = False
@@ -100,8 +106,7 @@ class PBVS():
                 self.back_distance = rospy.get_param(rospy.get_name() + "/forkcamera_back_distance", 3.0)
                 # self.current_parking_sequence = self.ParkingSequence.Changingtheta.value #test
                 self.current_parking_sequence = self.ParkingSequence.init_fork.value # for 小車
-                self.main_loop()
-                return
+                return self.main_loop()
 
             elif self.mode == "raise_pallet":
                 self.subscriber.updown = False
@@ -123,8 +128,7 @@ class PBVS():
                 self.back_distance = rospy.get_param(rospy.get_name() + "/raise_pallet_back_distance", 1.0)
                 self.navigation_helght = rospy.get_param(rospy.get_name() + "/raise_pallet_navigation_helght", 0.392)
                 self.current_parking_sequence = self.ParkingSequence.up_fork_init.value
-                self.main_loop()
-                return
+                return self.main_loop()
 
             elif self.mode == "drop_pallet":
                 self.subscriber.updown = True
@@ -147,34 +151,45 @@ class PBVS():
                 self.back_distance = rospy.get_param(rospy.get_name() + "/drop_pallet_back_distance", 1.0)
                 self.navigation_helght = rospy.get_param(rospy.get_name() + "/drop_pallet_navigation_helght", 0.07)
                 self.current_parking_sequence = self.ParkingSequence.down_fork_init.value
-                self.main_loop()
-                return
+                return self.main_loop()
 
             else:
                 rospy.logwarn("mode is not correct")
-                self._result.result = 'fail'
-                self._as.set_succeeded(self._result)
-                return
+                return 'abort'
 
    
     def main_loop(self):
-        r = rospy.Rate(10)
-        while(not rospy.is_shutdown()):
-            if(self.PBVS()):
-                break
-            r.sleep()
+        self.control_loop.start('ActionCode {0}'.format(self.ActionCode))
+        self.progress.start(self.mode if self.ActionCode not in (20, 21, 22, 30) else 'ActionCode {0}'.format(self.ActionCode))
+        try:
+            while(not rospy.is_shutdown()):
+                if(self.PBVS()):
+                    break
+                self.control_loop.sleep(self.ParkingSequence(self.current_parking_sequence).name)
+        finally:
+            self.progress.stop()
+        return self.guard.outcome
 
     def __del__(self):
         rospy.logwarn('delet PBVS')
+
+    def fnProgress(self):
+        # feedback: 控制器最近使用的 marker 位置與牙叉高度誤差
+        fork_error = self.Action.updownposition - self.Action.fork_target if self.Action.fork_target is not None else float('nan')
+        return self.Action.marker_2d_pose_x, self.Action.marker_2d_pose_y, self.Action.marker_2d_theta, fork_error
+
+    def fnStopMotion(self):
+        # 取消或逾時: 停止車體與牙叉, 清除步驟的觸發狀態
+        self.Action.cmd_vel.fnStop()
+        self.Action.fork_msg.fork_velocity = 0.0
+        self.Action.pub_fork.publish(self.Action.fork_msg)
+        self.Action.is_triggered = False
         
     def PBVS(self):
-        if self._as.is_preempt_requested():
-            rospy.logwarn('PBVS Preempted')
-            self.current_parking_sequence = self.ParkingSequence.stop.value
-            
+        if self.guard.check():
+            return True
             
-        self._feedback.feedback = str(self.ParkingSequence(self.current_parking_sequence))
-        self._as.publish_feedback(self._feedback)
+        self.progress.set_state(self.ParkingSequence(self.current_parking_sequence).name)
         # ActionCode-->[10]:shelf, [20]:up/down, [21]:forward/backward, [22]:tile, [30]:move
         if self.ActionCode==20:
             self.is_sequence_finished = self.Action.fork_updown(self.UpDownPosition)
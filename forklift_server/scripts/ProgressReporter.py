@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import threading
+import rospy
+
+
+class ProgressReporter():
+    # 以固定頻率 (rospy.Timer) 發布結構化的 PBVS action feedback, 步驟內有 sleep 或迴圈阻塞時也照常發布
+    # measure(): 回傳 (marker_x, marker_y, marker_theta, fork_height_error), 由各車型的 PBVS 提供
+    # 有 SequenceEngine 時 state 與剩餘時間取自 engine, 手寫迴圈則呼叫 set_state()
+    # feedback_type: PBVSFeedback / PBVSMegaposeFeedback, 每次發布建立新的訊息, timer thread 不與 sequence thread 共用物件
+    def __init__(self, action_server, feedback_type, rate, measure):
+        self._as = action_server
+        self.feedback_type = feedback_type
+        self.period = 1.0 / rate if rate > 0 else 0.0
+        self.measure = measure
+        self.lock = threading.Lock()
+        self.timer = None
+        self.engine = None
+        self.sequence = ""
+        self.state = ""
+
+    def start(self, sequence, engine=None, state=""):
+        self.stop()
+        now = rospy.get_time()
+        with self.lock:
+            self.sequence = sequence
+            self.engine = engine
+            self.state = state
+            self.started = now
+            self.entered = now
+        if self.period > 0:
+            self.timer = rospy.Timer(rospy.Duration(self.period), self.publish)
+
+    def set_state(self, state):
+        with self.lock:
+            if state != self.state:
+                self.state = state
+                self.entered = rospy.get_time()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.shutdown()
+            self.timer = None
+
+    def publish(self, event=None):
+        now = rospy.get_time()
+        with self.lock:
+            engine = self.engine
+            if engine is not None and engine.state is not None:
+                state, entered = engine.state.name, engine.entered
+                remaining = engine.estimate_remaining()
+            else:
+                state, entered, remaining = self.state, self.entered, -1.0
+            sequence, started = self.sequence, self.started
+        feedback = self.feedback_type()
+        feedback.feedback = '{0}.{1}'.format(sequence, state)
+        feedback.sequence = sequence
+        feedback.state = state
+        feedback.time_in_state = now - entered
+        feedback.elapsed = now - started
+        feedback.remaining = remaining
+        feedback.marker_x, feedback.marker_y, feedback.marker_theta, feedback.fork_height_error = self.measure()
+        if self._as.is_active():
+            self._as.publish_feedback(feedback)
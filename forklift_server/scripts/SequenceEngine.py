@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import rospy
+import yaml
+from ControlLoop import diagnostics_publisher
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+# 步驟執行時間直方圖的上界 (ms), 最後一格為超過 1000 ms
+HISTOGRAM_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# 每個 node 累計的 state 統計 {sequence: {state: StateTiming}}, 跨 goal 保留
+_timings = {}
+
+
+def load_sequences(param="sequences", default_file=None):
+    # 讀取 ~sequences 參數 (launch 以 rosparam load 載入 YAML), 沒有設定時直接讀 config/ 內的預設檔
+    table = rospy.get_param(rospy.get_name() + "/" + param, None)
+    if table is None and default_file is not None:
+        path = os.path.join(os.path.dirname(__file__), '..', 'config', default_file)
+        with open(path) as f:
+            table = yaml.safe_load(f)
+    if not table:
+        raise ValueError('sequence table "%s" not found' % param)
+    return table
+
+
+class Lookup():
+    # 依序在 sources (PBVS, subscriber, Action ...) 找屬性, 給參數解析與 str.format_map 使用
+    def __init__(self, sources):
+        self.sources = sources
+
+    def __getitem__(self, name):
+        for source in self.sources:
+            if hasattr(source, name):
+                return getattr(source, name)
+        raise KeyError(name)
+
+
+class StateTiming():
+    def __init__(self):
+        self.visits = 0
+        self.ticks = 0
+        self.step_sum = 0.0
+        self.step_max = 0.0
+        self.dwell_sum = 0.0
+        self.dwell_max = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+
+    def add_step(self, seconds):
+        ms = seconds * 1e3
+        self.ticks += 1
+        self.step_sum += seconds
+        self.step_max = max(self.step_max, seconds)
+        for i, edge in enumerate(HISTOGRAM_EDGES_MS):
+            if ms <= edge:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def add_dwell(self, seconds):
+        self.visits += 1
+        self.dwell_sum += seconds
+        self.dwell_max = max(self.dwell_max, seconds)
+
+    def percentile_ms(self, ratio):
+        # 以直方圖估計百分位數, 回傳所在格的上界
+        target = ratio * self.ticks
+        count = 0
+        for i, n in enumerate(self.histogram):
+            count += n
+            if n and count >= target:
+                return HISTOGRAM_EDGES_MS[i] if i < len(HISTOGRAM_EDGES_MS) else float('inf')
+        return 0.0
+
+    def histogram_text(self):
+        labels = ['<=%d' % edge for edge in HISTOGRAM_EDGES_MS] + ['>%d' % HISTOGRAM_EDGES_MS[-1]]
+        return ' '.join('%s:%d' % (label, n) for label, n in zip(labels, self.histogram) if n)
+
+
+class State():
+    # 表格中的一個 state, 建立時就把函式名稱解析成 bound method, 執行時不再查表
+    def __init__(self, name, spec, defaults, lookup):
+        self.name = name
+        self.call = self.resolve_callable(spec['call'], lookup)
+        self.args = list(spec.get('args', []))
+        before = spec.get('before', defaults.get('before'))
+        self.before = None if before is None else (self.resolve_callable(before['call'], lookup), list(before.get('args', [])))
+        self.done = spec.get('done')
+        self.fail = spec.get('fail')
+        self.end = spec.get('end', False)
+        self.pause = spec.get('pause', defaults.get('pause', 0.0))
+        self.timeout = spec.get('timeout', defaults.get('timeout'))
+        self.on_timeout = spec.get('on_timeout', defaults.get('on_timeout', 'error'))
+        if not self.end and self.done is None:
+            raise ValueError('state %s needs "done" or "end"' % name)
+
+    @staticmethod
+    def resolve_callable(name, lookup):
+        try:
+            function = lookup[name]
+        except KeyError:
+            raise ValueError('step %s does not exist' % name)
+        if not callable(function):
+            raise ValueError('step %s is not callable' % name)
+        return function
+
+
+class SequenceEngine():
+    # 以表格 (YAML) 描述的 sequence, 取代 if current_sequence == ... 的長串判斷
+    # 每個 state: call/args 為每一步呼叫的函式與參數, 回傳 True 進入 done, 回傳 False 且有 fail 時進入 fail
+    # args 中 "$name" 取 PBVS / subscriber / Action 的屬性, "-$name" 取負值, 名稱可用 {layer_dist:g} 之類的格式
+    # timeout: 在 state 停留超過秒數就呼叫 stop (停車) 並進入 on_timeout 指定的 state
+    # end: true 的 state 完成後結束 sequence
+    # guard: GoalControl, 每一步的前後檢查取消與 goal 逾時, 成立時已由 guard 停車, sequence 以 'preempted' / 'timeout' 結束
+    def __init__(self, name, table, sources, stop=None, guard=None):
+        self.name = name
+        self.lookup = Lookup(sources)
+        self.stop = stop
+        self.guard = guard
+        defaults = dict((key, value) for key, value in table.items() if key not in ('start', 'states', 'goal_timeout'))
+        self.states = dict((state, State(state, spec, defaults, self.lookup)) for state, spec in table['states'].items())
+        for state in self.states.values():
+            for target in (state.done, state.fail, state.on_timeout if state.timeout else None):
+                if target is not None and target not in self.states:
+                    raise ValueError('%s: state %s goes to unknown state %s' % (name, state.name, target))
+        self.initial = table['start']
+        self.timing = _timings.setdefault(name, {})
+        self.state = None
+
+    def start(self, state=None):
+        self.finished = False
+        self.outcome = None
+        self.path = []
+        self.enter(self.initial if state is None else state)
+
+    def enter(self, name):
+        now = rospy.get_time()
+        if self.state is not None and not self.finished and self.path:
+            self.timing.setdefault(self.state.name, StateTiming()).add_dwell(now - self.entered)
+        self.state = self.states[name]
+        self.entered = now
+        self.path.append(name)
+        self.resolved_args = None
+        rospy.loginfo('Current Sequence: {0}.{1}'.format(self.name, name))
+
+    def resolve(self, arg):
+        if not isinstance(arg, str) or '$' not in arg:
+            return arg
+        value = self.lookup[arg.lstrip('-').lstrip('$').format_map(self.lookup)]
+        return -value if arg.startswith('-') else value
+
+    def resolve_args(self, args):
+        try:
+            return [self.resolve(arg) for arg in args]
+        except KeyError as e:
+            rospy.logwarn('{0}.{1}: {2} is not defined'.format(self.name, self.state.name, e.args[0]))
+            return None
+
+    def finish(self, outcome):
+        self.timing.setdefault(self.state.name, StateTiming()).add_dwell(rospy.get_time() - self.entered)
+        self.finished = True
+        self.outcome = outcome
+
+    def tick(self):
+        # 執行目前 state 的一步, sequence 結束時回傳 True
+        state = self.state
+        if self.guard is not None and self.guard.check():
+            self.finish(self.guard.outcome)
+            return True
+        if state.timeout and rospy.get_time() - self.entered > state.timeout:
+            rospy.logwarn('{0}.{1} timeout after {2:.1f} s'.format(self.name, state.name, state.timeout))
+            if self.stop is not None:
+                self.stop()
+            self.enter(state.on_timeout)
+            return False
+        if self.resolved_args is None:
+            self.resolved_args = self.resolve_args(state.args)
+            self.resolved_before = None if state.before is None else self.resolve_args(state.before[1])
+            if self.resolved_args is None or (state.before is not None and self.resolved_before is None):
+                self.finish('abort')
+                return True
+        started = time.perf_counter()
+        if state.before is not None:
+            state.before[0](*self.resolved_before)
+        result = state.call(*self.resolved_args)
+        self.timing.setdefault(state.name, StateTiming()).add_step(time.perf_counter() - started)
+        if self.guard is not None and self.guard.check():
+            # 這一步執行中被取消: guard 已在步驟發出的命令之後再停一次車
+            self.finish(self.guard.outcome)
+            return True
+        if result is True:
+            if state.end:
+                self.finish(state.name)
+                return True
+            if state.pause:
+                rospy.sleep(state.pause)
+            self.enter(state.done)
+        elif result is False and state.fail is not None:
+            self.enter(state.fail)
+        return False
+
+    def estimate_remaining(self):
+        # 目前 state 剩下的平均停留時間, 加上沿 done 走到結束的各 state 平均停留時間; 沒有歷史資料時回傳 -1
+        state = self.state
+        remaining = 0.0
+        visited = set()
+        while state is not None and state.name not in visited:
+            visited.add(state.name)
+            timing = self.timing.get(state.name)
+            if timing is None or timing.visits == 0:
+                return -1.0
+            mean = timing.dwell_sum / timing.visits
+            if state is self.state:
+                mean = max(mean - (rospy.get_time() - self.entered), 0.0)
+            remaining += mean
+            state = None if state.end else self.states[state.done]
+        return remaining
+
+    def run(self, control_loop):
+        # 以 control_loop 的固定頻率執行到 sequence 結束, 回傳結束的 state 名稱 (或 'abort' / 'preempted' / 'timeout')
+        control_loop.start(self.name)
+        self.start()
+        while not rospy.is_shutdown():
+            if self.tick():
+                break
+            control_loop.sleep(self.state.name)
+        self.report()
+        return self.outcome
+
+    def report(self):
+        # 依累計停留時間排序, 寫 log 並發布到 /diagnostics
+        ranked = sorted(self.timing.items(), key=lambda item: item[1].dwell_sum, reverse=True)
+        rospy.loginfo('{0} finished ({1}): {2}'.format(self.name, self.outcome, ' -> '.join(self.path)))
+        rospy.loginfo('{0} state timing since node start:'.format(self.name))
+        values = [KeyValue("sequence", self.name), KeyValue("outcome", str(self.outcome))]
+        for state, timing in ranked:
+            rospy.loginfo('  {0:<24} visits {1:>4} dwell {2:8.2f} s (max {3:.2f}) step p50 {4} ms p95 {5} ms max {6:.1f} ms | {7}'.format(
+                state, timing.visits, timing.dwell_sum, timing.dwell_max, timing.percentile_ms(0.5), timing.percentile_ms(0.95),
+                timing.step_max * 1e3, timing.histogram_text()))
+            values += [KeyValue(state + ".visits", str(timing.visits)),
+                       KeyValue(state + ".dwell_s", "%.2f" % timing.dwell_sum),
+                       KeyValue(state + ".step_mean_ms", "%.2f" % (timing.step_sum / timing.ticks * 1e3 if timing.ticks else 0.0)),
+                       KeyValue(state + ".step_max_ms", "%.2f" % (timing.step_max * 1e3)),
+                       KeyValue(state + ".step_hist_ms", timing.histogram_text())]
+        status = DiagnosticStatus()
+        status.name = "%s sequence %s" % (rospy.get_name(), self.name)
+        status.hardware_id = rospy.get_name()
+        status.level = DiagnosticStatus.OK if self.outcome == 'stop' else DiagnosticStatus.WARN
+        status.message = "%s: %s" % (self.outcome, ranked[0][0] if ranked else "")
+        status.values = values
+        msg = DiagnosticArray()
+        msg.header.stamp = rospy.Time.now()
+        msg.status = [status]
+        diagnostics_publisher().publish(msg)
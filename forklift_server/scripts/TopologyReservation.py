@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import math
+
+
+class ReservationTable():
+    # resource (節點位置或走道) -> [(開始時間, 結束時間, robot), ...]
+    def __init__(self):
+        self.reservations = {}
+
+    def conflict(self, robot, resource, start, end):
+        # 回傳與其他 robot 重疊的保留中最晚結束的時間, 沒有衝突回傳 None
+        latest = None
+        for s, e, owner in self.reservations.get(resource, []):
+            if owner != robot and s < end and start < e:
+                latest = e if latest is None else max(latest, e)
+        return latest
+
+    def schedule(self, robot, windows, now, max_wait=math.inf):
+        # windows: [(resource, 相對開始時間, 相對結束時間)], 第一個為目前所在位置
+        # 找出最早可出發的時間, 讓整段路徑的保留都不與其他 robot 重疊
+        depart = now
+        while depart - now <= max_wait:
+            delayed = False
+            for resource, start, end in windows[1:]:
+                latest = self.conflict(robot, resource, depart + start, depart + end)
+                if latest is not None:
+                    if latest == math.inf:
+                        return None  # 被停在該位置的 robot 永久佔用
+                    depart += latest - (depart + start)
+                    delayed = True
+                    break
+            if not delayed:
+                # 等待出發期間仍停在原地, 這段時間若已被其他 robot 保留則無法靠延後解決
+                resource, start, end = windows[0]
+                if self.conflict(robot, resource, now, depart + end) is not None:
+                    return None
+                return depart
+        return None
+
+    def reserve(self, robot, windows, depart, now):
+        # 取代 robot 原有的保留; 等待出發期間仍佔用目前位置
+        self.release(robot)
+        resource, start, end = windows[0]
+        self.reservations.setdefault(resource, []).append((now, depart + end, robot))
+        for resource, start, end in windows[1:]:
+            self.reservations.setdefault(resource, []).append((depart + start, depart + end, robot))
+
+    def others(self, robot):
+        # 其他 robot 的保留 [(resource, 開始時間, 結束時間)], 供規劃路徑時避開
+        return [(resource, s, e) for resource, windows in self.reservations.items() for s, e, owner in windows if owner != robot]
+
+    def release(self, robot):
+        for resource in list(self.reservations):
+            self.reservations[resource] = [r for r in self.reservations[resource] if r[2] != robot]
+            if not self.reservations[resource]:
+                del self.reservations[resource]
+
+    def expire(self, now):
+        for resource in list(self.reservations):
+            self.reservations[resource] = [r for r in self.reservations[resource] if r[1] > now]
+            if not self.reservations[resource]:
+                del self.reservations[resource]
+
+
+def location(waypoints, node):
+    # 節點以座標為 key (同座標不同名稱的節點是同一個位置)
+    return "%.2f,%.2f" % (waypoints[node][0], waypoints[node][1])
+
+
+def corridor(a, b):
+    # 兩個位置之間的走道, 不分方向
+    return "%s|%s" % tuple(sorted((a, b)))
+
+
+def path_windows(path, waypoints, durations, margin, hold=math.inf):
+    # 依每段預估時間產生 path 的保留時段
+    windows = [(location(waypoints, path[0]), 0.0, margin if len(path) > 1 else hold)]
+    t = 0.0
+    for i in range(1, len(path)):
+        a, b = location(waypoints, path[i-1]), location(waypoints, path[i])
+        arrival = t + durations[i-1]
+        if a != b:
+            windows.append((corridor(a, b), t, arrival))
+        end = hold if i == len(path) - 1 else arrival + margin
+        windows.append((b, arrival - margin, end))
+        t = arrival
+    return windows
+
+
+class ReservationPenalty():
+    # RouteTable.astar 的邊額外成本: 預估通過時走道或下一個節點已被其他 robot 保留, 加上等到保留結束的時間 (換算成邊權重)
+    # reservations: 其他 robot 的保留 [(resource, 開始, 結束)], 時間相對現在; 被永久佔用 (停在該位置) 的邊回傳 inf
+    # 到達時間以累計成本 * time_per_weight 估計, 每段另加 leg_delay; offset 為這段路徑之前已走的成本 (多停靠點)
+    def __init__(self, reservations, waypoints, time_per_weight, leg_delay, margin):
+        self.busy = {}
+        for resource, start, end in reservations:
+            self.busy.setdefault(resource, []).append((start, end))
+        self.waypoints = waypoints
+        self.time_per_weight = time_per_weight
+        self.leg_delay = leg_delay
+        self.margin = margin
+        self.offset = 0.0
+
+    def __call__(self, a, b, weight, dist):
+        depart = (self.offset + dist) * self.time_per_weight
+        arrival = depart + weight * self.time_per_weight + self.leg_delay
+        la, lb = location(self.waypoints, a), location(self.waypoints, b)
+        windows = [(lb, arrival - self.margin, arrival + self.margin)]
+        if la != lb:
+            windows.append((corridor(la, lb), depart, arrival))
+        wait = 0.0
+        for resource, start, end in windows:
+            for s, e in self.busy.get(resource, ()):
+                if s < end and start < e:
+                    if e == math.inf:
+                        return math.inf
+                    wait = max(wait, e - start)
+        return wait / self.time_per_weight if self.time_per_weight > 0 else wait
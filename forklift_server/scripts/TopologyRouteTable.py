@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+import heapq
+import math
+from array import array
+
+
+class RouteTable():
+    # 每個起點保存一棵最短路徑樹 (distance, parent)，查詢時只需沿 parent 回溯
+    def __init__(self, graph, prebuild=True):
+        self.index = {node: i for i, node in enumerate(graph)}
+        for neighbors in graph.values():
+            for node in neighbors:
+                if node not in self.index:
+                    self.index[node] = len(self.index)  # 只出現在終點的節點
+        self.nodes = list(self.index)
+        self.adjacency = [dict() for _ in self.nodes]
+        self.incoming = [dict() for _ in self.nodes]
+        for node, neighbors in graph.items():
+            for neighbor, weight in neighbors.items():
+                self.adjacency[self.index[node]][self.index[neighbor]] = float(weight)
+                self.incoming[self.index[neighbor]][self.index[node]] = float(weight)
+        self.blocked = {}  # (u, v) -> 封閉前的權重
+        self.rows = {}
+        if prebuild:
+            for source in range(len(self.nodes)):
+                self.rows[source] = self.shortest_path_tree(source)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def shortest_path_tree(self, source):
+        n = len(self.nodes)
+        distance = array('d', [math.inf]) * n
+        parent = array('i', [-1]) * n
+        distance[source] = 0.0
+        self._relax(distance, parent, [(0.0, source)])
+        return distance, parent
+
+    def _relax(self, distance, parent, pqueue):
+        adjacency = self.adjacency
+        while pqueue:
+            dist, vertex = heapq.heappop(pqueue)
+            if dist > distance[vertex]:
+                continue  # 過期的佇列項目
+            for w, weight in adjacency[vertex].items():
+                d = dist + weight
+                if d < distance[w]:
+                    distance[w] = d
+                    parent[w] = vertex
+                    heapq.heappush(pqueue, (d, w))
+
+    def row(self, source):
+        # 未預先建立的起點在第一次查詢時建立並快取
+        if source not in self.rows:
+            self.rows[source] = self.shortest_path_tree(source)
+        return self.rows[source]
+
+    def path(self, start, goal):
+        if start not in self.index or goal not in self.index:
+            return []
+        s, t = self.index[start], self.index[goal]
+        distance, parent = self.row(s)
+        if distance[t] == math.inf:
+            return []
+        path = [goal]
+        while t != s:
+            t = parent[t]
+            path.append(self.nodes[t])
+        path.reverse()
+        return path
+
+    def distance(self, start, goal):
+        if start not in self.index or goal not in self.index:
+            return math.inf
+        distance, _ = self.row(self.index[start])
+        return distance[self.index[goal]]
+
+    def astar(self, start, goal, coordinates, scale, penalty=None):
+        # 單次搜尋, h = scale * 兩點歐氏距離; scale = 0 即為 Dijkstra. 回傳 (path, 展開節點數)
+        # penalty(u, v, weight, dist): 邊 u -> v 的額外成本 (>= 0, inf 為不可通過), dist 為起點到 u 的成本
+        if start not in self.index or goal not in self.index:
+            return [], 0
+        s, t = self.index[start], self.index[goal]
+        if scale > 0:
+            gx, gy = coordinates[goal][0:2]
+            def h(i):
+                x, y = coordinates[self.nodes[i]][0:2]
+                return scale * math.hypot(x - gx, y - gy)
+        else:
+            def h(i):
+                return 0.0  # Dijkstra 不需要座標, waypoints 缺少節點時也可使用
+
+        distance = {s: 0.0}
+        parent = {s: -1}
+        closed = set()
+        pqueue = [(h(s), 0.0, s)]
+        expanded = 0
+        while pqueue:
+            _, dist, vertex = heapq.heappop(pqueue)
+            if vertex in closed:
+                continue
+            closed.add(vertex)
+            expanded += 1
+            if vertex == t:
+                break
+            for w, weight in self.adjacency[vertex].items():
+                d = dist + weight
+                if penalty is not None:
+                    d += penalty(self.nodes[vertex], self.nodes[w], weight, dist)
+                if d < distance.get(w, math.inf):
+                    distance[w] = d
+                    parent[w] = vertex
+                    heapq.heappush(pqueue, (d + h(w), d, w))
+        if t not in closed:
+            return [], expanded
+        path = [goal]
+        while t != s:
+            t = parent[t]
+            path.append(self.nodes[t])
+        path.reverse()
+        return path, expanded
+
+    def consistent_heuristic_scale(self, coordinates):
+        # 歐氏距離乘上 scale 仍不超過任一條邊權重時, heuristic 為 consistent (也就 admissible)
+        scale = math.inf
+        for u, neighbors in enumerate(self.adjacency):
+            ux, uy = coordinates[self.nodes[u]][0:2]
+            for v, weight in neighbors.items():
+                vx, vy = coordinates[self.nodes[v]][0:2]
+                length = math.hypot(ux - vx, uy - vy)
+                if length > 0:
+                    scale = min(scale, weight / length)
+        return 0.0 if scale == math.inf else scale
+
+    def visit_order(self, start, stops, exact_limit=10):
+        # 由 start 出發拜訪所有 stops (不需回到起點) 的最短順序, 少量停靠點用 Held-Karp 求精確解, 其餘用最近鄰 + 2-opt
+        stops = list(dict.fromkeys(stop for stop in stops if stop != start))
+        if len(stops) <= 1:
+            return stops
+        cost = [[self.distance(a, b) for b in stops] for a in stops]
+        first = [self.distance(start, b) for b in stops]
+        if len(stops) <= exact_limit:
+            order = self._held_karp(first, cost)
+        else:
+            order = self._two_opt(self._nearest_neighbor(first, cost), first, cost)
+        return [stops[i] for i in order]
+
+    def route_cost(self, start, stops):
+        nodes = [start] + list(stops)
+        return sum(self.distance(a, b) for a, b in zip(nodes, nodes[1:]))
+
+    def _held_karp(self, first, cost):
+        n = len(first)
+        best = {(1 << j, j): (first[j], -1) for j in range(n)}
+        for mask in range(1, 1 << n):
+            for j in range(n):
+                if (mask, j) not in best:
+                    continue
+                d, _ = best[(mask, j)]
+                for k in range(n):
+                    if mask & (1 << k):
+                        continue
+                    key = (mask | (1 << k), k)
+                    if d + cost[j][k] < best.get(key, (math.inf, -1))[0]:
+                        best[key] = (d + cost[j][k], j)
+        full = (1 << n) - 1
+        j = min(range(n), key=lambda j: best[(full, j)][0])
+        order = []
+        mask = full
+        while j != -1:
+            order.append(j)
+            j, mask = best[(mask, j)][1], mask & ~(1 << j)
+        order.reverse()
+        return order
+
+    def _nearest_neighbor(self, first, cost):
+        remaining = set(range(len(first)))
+        current = min(remaining, key=lambda j: first[j])
+        order = [current]
+        remaining.remove(current)
+        while remaining:
+            current = min(remaining, key=lambda j: cost[current][j])
+            order.append(current)
+            remaining.remove(current)
+        return order
+
+    def _two_opt(self, order, first, cost):
+        # 有向圖反轉區段會改變區段內的方向, 每次都重算整條路徑的成本
+        def total(order):
+            return first[order[0]] + sum(cost[a][b] for a, b in zip(order, order[1:]))
+        best = total(order)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    d = total(candidate)
+                    if d < best:
+                        order, best = candidate, d
+                        improved = True
+        return order
+
+    def weight(self, start, goal):
+        u, v = self.index[start], self.index[goal]
+        return self.adjacency[u].get(v, math.inf)
+
+    def block_edge(self, start, goal):
+        if (start, goal) in self.blocked:
+            return 0
+        weight = self.weight(start, goal)
+        if weight == math.inf:
+            raise KeyError("edge %s -> %s does not exist" % (start, goal))
+        self.blocked[(start, goal)] = weight
+        return self.set_weight(start, goal, math.inf)
+
+    def unblock_edge(self, start, goal):
+        if (start, goal) not in self.blocked:
+            return 0
+        return self.set_weight(start, goal, self.blocked.pop((start, goal)))
+
+    def set_weight(self, start, goal, weight):
+        # 修改一條邊並只修補受影響的最短路徑樹, 回傳修補過的起點數
+        if start not in self.index or goal not in self.index:
+            raise KeyError("unknown node %s or %s" % (start, goal))
+        if (start, goal) in self.blocked and weight != math.inf:
+            self.blocked[(start, goal)] = float(weight)  # 封閉中只更新解除後的權重
+            return 0
+        u, v = self.index[start], self.index[goal]
+        old_weight = self.adjacency[u].get(v, math.inf)
+        weight = float(weight)
+        if weight == old_weight:
+            return 0
+        if weight == math.inf:
+            del self.adjacency[u][v]
+            del self.incoming[v][u]
+        else:
+            self.adjacency[u][v] = weight
+            self.incoming[v][u] = weight
+
+        repaired = 0
+        for distance, parent in self.rows.values():
+            if weight < old_weight:
+                repaired += self._repair_decrease(distance, parent, u, v, weight)
+            else:
+                repaired += self._repair_increase(distance, parent, u, v)
+        return repaired
+
+    def _repair_decrease(self, distance, parent, u, v, weight):
+        d = distance[u] + weight
+        if d >= distance[v]:
+            return 0
+        distance[v] = d
+        parent[v] = u
+        self._relax(distance, parent, [(d, v)])
+        return 1
+
+    def _repair_increase(self, distance, parent, u, v):
+        if parent[v] != u:
+            return 0  # 不是樹上的邊, 最短路徑不受影響
+        # 找出以 v 為根的子樹, 這些節點的距離全部失效
+        affected = [v]
+        for x in affected:
+            for y in self.adjacency[x]:
+                if parent[y] == x:
+                    affected.append(y)
+        for x in affected:
+            distance[x] = math.inf
+            parent[x] = -1
+        # 由子樹外的節點重新接回子樹, 再只對子樹做 Dijkstra
+        pqueue = []
+        for x in affected:
+            for y, weight in self.incoming[x].items():
+                d = distance[y] + weight
+                if d < distance[x]:
+                    distance[x] = d
+                    parent[x] = y
+            if distance[x] < math.inf:
+                pqueue.append((distance[x], x))
+        heapq.heapify(pqueue)
+        self._relax(distance, parent, pqueue)
+        return 1
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+import numpy as np
+import yaml
+
+
+def sweep_levels(maximum, steps):
+    # 由小到大的命令大小, 正反方向交替測試 (直線測試前進後退抵銷, 車不會一直往同一方向跑)
+    levels = np.linspace(maximum / steps, maximum, steps)
+    return [float(sign * level) for level in levels for sign in (1.0, -1.0)]
+
+
+def fit_deadband(commands, speeds, moving=0.005):
+    # 致動器模型: |速度| = gain * (|命令| - deadband), |命令| <= deadband 時不動
+    # 以速度超過 moving 的樣本做最小平方直線擬合, 回傳 (deadband, gain, 殘差標準差)
+    commands = np.abs(np.asarray(commands, dtype=float))
+    speeds = np.abs(np.asarray(speeds, dtype=float))
+    valid = speeds > moving
+    if np.count_nonzero(valid) < 2:
+        raise ValueError('vehicle did not move at enough command levels (%d)' % np.count_nonzero(valid))
+    gain, offset = np.polyfit(commands[valid], speeds[valid], 1)
+    if gain <= 0:
+        raise ValueError('speed does not increase with command (gain %.3f)' % gain)
+    # 擬合的截距可能落在負的命令, 死區至少要大於最大的不動命令
+    stalled = commands[~valid & (commands < commands[valid].min())]
+    deadband = max(-offset / gain, float(stalled.max()) if len(stalled) else 0.0, 0.0)
+    residual = speeds[valid] - (gain * commands[valid] + offset)
+    return float(deadband), float(gain), float(np.std(residual))
+
+
+def profile_fields(linear, angular, margin=1.1):
+    # linear / angular: fit_deadband 的結果, 換成 VehicleProfile 的欄位
+    # 非零命令至少輸出 deadband * margin (剛好能動的命令), gain 讓 cmd_vel 換算成實際速度
+    fields = {}
+    for axis, result in (('linear', linear), ('angular', angular)):
+        if result is None:
+            continue
+        deadband, gain, _ = result
+        minimum = round(deadband * margin, 4)
+        fields['min_' + axis] = [minimum, minimum]
+        fields[axis + '_gain'] = round(gain, 4)
+    return fields
+
+
+def write_profile(path, name, fields, samples=None):
+    # 寫出 VehicleProfile 欄位; samples 只做紀錄, load_profile 不讀取
+    data = dict(fields)
+    if samples is not None:
+        data['calibration'] = samples
+    with open(path, 'w') as f:
+        f.write('# %s 的致動器校正結果 (node/Vehicle_calibration.py, %s)\n' % (name, time.strftime('%Y-%m-%d %H:%M:%S')))
+        f.write('# min_*: [門檻, 輸出], *_gain: 實際速度 / cmd_vel, 由 VehicleProfile.load_profile 載入\n')
+        yaml.safe_dump(data, f, default_flow_style=None, sort_keys=False)
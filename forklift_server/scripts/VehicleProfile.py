@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+
+
+class VehicleProfile():
+    # 各車型的運動學與速度限制, PBVS_Core 的 CmdVel / ActionCore 依此輸出 cmd_vel
+    # angular_sign: fnTurn / fnTrackMarker 的旋轉方向 (舊 forklift / minicar 為 -1)
+    # min_linear / min_angular: (門檻, 輸出) 絕對值小於門檻的非零命令改為輸出值, 克服馬達死區
+    # linear_accel / angular_accel / linear_jerk / angular_jerk: CommandShaper 的加速度與加加速度限制, 0 為不限制
+    # linear_gain / angular_gain: 實際速度 / cmd_vel, compensate 以此把速度換成 cmd_vel (node/Vehicle_calibration.py 量測)
+    def __init__(self, name, angular_sign=1.0, turn_kp=0.2, straight_kp=0.2, track_kp=0.2, track_speed=0.05,
+                 rotate_kp=0.2, back_speed=-0.1, max_linear=0.2, max_angular=0.2,
+                 min_linear=(0.02, 0.05), min_angular=(0.05, 0.05),
+                 linear_accel=0.25, angular_accel=0.5, linear_jerk=1.0, angular_jerk=2.0,
+                 linear_gain=1.0, angular_gain=1.0):
+        self.name = name
+        self.angular_sign = angular_sign
+        self.turn_kp = turn_kp
+        self.straight_kp = straight_kp
+        self.track_kp = track_kp
+        self.track_speed = track_speed
+        self.rotate_kp = rotate_kp          # 里程計旋轉 (fnseqDeadReckoningAngle) 的比例增益
+        self.back_speed = back_speed
+        self.max_linear = max_linear
+        self.max_angular = max_angular
+        self.min_linear = tuple(min_linear)
+        self.min_angular = tuple(min_angular)
+        self.linear_accel = linear_accel
+        self.angular_accel = angular_accel
+        self.linear_jerk = linear_jerk
+        self.angular_jerk = angular_jerk
+        self.linear_gain = linear_gain
+        self.angular_gain = angular_gain
+
+    def limit(self, linear, angular):
+        # cmd_pub 的限幅: 限制最大值再補死區 (死區輸出小於最大值, 兩者順序不影響結果)
+        return self.compensate(*self.clamp(linear, angular))
+
+    def clamp(self, linear, angular):
+        if linear > self.max_linear:
+            linear = self.max_linear
+        elif linear < -self.max_linear:
+            linear = -self.max_linear
+        if angular > self.max_angular:
+            angular = self.max_angular
+        elif angular < -self.max_angular:
+            angular = -self.max_angular
+        return linear, angular
+
+    def compensate(self, linear, angular):
+        # 速度換成 cmd_vel 後做死區補償: 絕對值小於門檻的非零命令改為輸出值
+        linear = linear / self.linear_gain
+        angular = angular / self.angular_gain
+        threshold, value = self.min_linear
+        if 0 < linear < threshold:
+            linear = value
+        elif -threshold < linear < 0:
+            linear = -value
+        threshold, value = self.min_angular
+        if 0 < angular < threshold:
+            angular = value
+        elif -threshold < angular < 0:
+            angular = -value
+        return linear, angular
+
+PROFILES = {
+    'forklift': VehicleProfile('forklift', angular_sign=-1.0, turn_kp=0.3, straight_kp=0.8, track_kp=6.2, track_speed=0.15,
+                               min_angular=(0.01, 0.01)),
+    'minicar': VehicleProfile('minicar', angular_sign=-1.0, turn_kp=0.3, straight_kp=0.8, track_kp=4.0, track_speed=0.05),
+    'megapose': VehicleProfile('megapose', rotate_kp=0.2),
+    'differential': VehicleProfile('differential', rotate_kp=0.3, min_linear=(0.03, 0.02), min_angular=(0.09, 0.1)),
+}
+
+
+def profile_path(name):
+    # 校正結果的預設位置: config/vehicle_<name>.yaml
+    return os.path.join(os.path.dirname(__file__), '..', 'config', 'vehicle_%s.yaml' % name)
+
+
+def load_profile(name):
+    # 以 PROFILES 為預設值, 依序以校正檔 (~vehicle_profile, 預設 config/vehicle_<name>.yaml, 不存在則略過)
+    # 與 ~vehicle/<欄位> 參數覆寫 (例如 ~vehicle/max_linear)
+    import rospy
+    import yaml
+    default = PROFILES[name]
+    path = rospy.get_param(rospy.get_name() + "/vehicle_profile", profile_path(name))
+    calibrated = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            calibrated = yaml.safe_load(f) or {}
+        rospy.loginfo("vehicle profile: {}".format(path))
+    fields = dict((key, rospy.get_param(rospy.get_name() + "/vehicle/" + key, calibrated.get(key, value)))
+                  for key, value in vars(default).items() if key != 'name')
+    return VehicleProfile(name, **fields)
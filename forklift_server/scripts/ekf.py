@@ -1,4 +1,11 @@
 #!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import math
+import threading
+from collections import deque
+import numpy as np
+
+
 class KalmanFilter():
     initialized = False
     _P = .0
@@ -22,10 +29,165 @@ class KalmanFilter():
             print ('Filter is not initialized!')
         self.x_hat_minus = float(self.x_hat) # self.x_hat_minus=0
         P_minus = float(self._P + self._Q)  #P_minus=12
-        
+
         self.K = float(P_minus / (P_minus + self._R))
-        
+
         self.x_hat = float(self.x_hat_minus + self.K * (z - self.x_hat_minus))
-        P = float((1 - self.K) * P_minus)
-        
-        return self.x_hat
\ No newline at end of file
+        self._P = float((1 - self.K) * P_minus)
+
+        return self.x_hat
+
+
+def wrap_angle(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+def propagate_marker(x, y, theta, dx, dy, dtheta, camera_x=0.0):
+    # 車體在原本的車體座標移動 (dx, dy) 並旋轉 dtheta 之後, 固定不動的 marker 在相機座標的位置
+    c, s = math.cos(dtheta), math.sin(dtheta)
+    px = x + camera_x - dx
+    py = y - dy
+    return c * px + s * py - camera_x, -s * px + c * py, wrap_angle(theta - dtheta)
+
+
+def body_delta(start, end):
+    # 兩筆世界座標位姿 (stamp, x, y, theta) 之間, 在 start 車體座標的 (dx, dy, dtheta)
+    c, s = math.cos(start[3]), math.sin(start[3])
+    return (c * (end[1] - start[1]) + s * (end[2] - start[2]), -s * (end[1] - start[1]) + c * (end[2] - start[2]),
+            wrap_angle(end[3] - start[3]))
+
+
+class MarkerEKF():
+    # marker 在車體座標的 (x, y, theta) EKF, 相機偵測之間以輪式里程計推算 marker 的相對位置
+    # predict(): 里程計在車體座標的位移 (dx, dy, dtheta) 與經過時間 dt, marker 固定不動, 車體移動後重新表示 marker
+    # update(): 相機量測 (x, y, theta), 以 Mahalanobis 距離剔除離群值, 連續 reset_after 次被剔除就以量測重新初始化
+    # camera_x: 相機相對旋轉中心在車體 x 方向的位置 (m), 量測與輸出都在相機座標 (marker_2d_pose_* 的定義)
+    # 所有標準差的單位為 m / rad, process 雜訊: 每秒 q_* 加上每移動 1 m (或旋轉 1 rad) odom_* 的誤差
+    def __init__(self, meas_xy=0.02, meas_theta=0.05, q_xy=0.01, q_theta=0.02, odom_trans=0.05, odom_rot=0.05,
+                 camera_x=0.0, gate=11.34, reset_after=3):
+        self.R = np.diag([meas_xy ** 2, meas_xy ** 2, meas_theta ** 2])
+        self.q = np.array([q_xy ** 2, q_xy ** 2, q_theta ** 2])
+        self.odom_trans = odom_trans ** 2
+        self.odom_rot = odom_rot ** 2
+        self.camera_x = camera_x
+        self.gate = gate  # chi-square 3 自由度 99% 為 11.34
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.x = np.zeros(3)
+            self.P = np.diag([1e3, 1e3, 1e3])
+            self.initialized = False
+            self.rejected = 0
+
+    def predict(self, dx, dy, dtheta, dt):
+        # 車體座標 (移動前) 的位移 dx, dy 與旋轉 dtheta, 回傳是否已有估計值
+        with self.lock:
+            if not self.initialized:
+                return False
+            self.x[:] = propagate_marker(self.x[0], self.x[1], self.x[2], dx, dy, dtheta, self.camera_x)
+            c, s = math.cos(dtheta), math.sin(dtheta)
+            F = np.array([[c, s, 0.0],
+                          [-s, c, 0.0],
+                          [0.0, 0.0, 1.0]])
+            Q = np.diag(self.q * max(dt, 0.0) + self.motion_noise(dx, dy, dtheta))
+            self.P = F.dot(self.P).dot(F.T) + Q
+            return True
+
+    def motion_noise(self, dx, dy, dtheta):
+        dist = math.hypot(dx, dy)
+        return np.array([self.odom_trans * dist, self.odom_trans * dist, self.odom_rot * abs(dtheta)])
+
+    def update(self, x, y, theta, motion=None):
+        # 回傳 True 表示量測已融合 (或用來初始化), False 為離群值
+        # motion: 影像時間到現在的車體位移 (dx, dy, dtheta), 量測先推算到現在再融合 (補償偵測延遲)
+        with self.lock:
+            R = self.R
+            if motion is not None:
+                x, y, theta = propagate_marker(x, y, theta, motion[0], motion[1], motion[2], self.camera_x)
+                R = R + np.diag(self.motion_noise(*motion))
+            z = np.array([x, y, theta], dtype=float)
+            if not self.initialized:
+                self.x = z
+                self.P = R.copy()
+                self.initialized = True
+                return True
+            innovation = z - self.x
+            innovation[2] = wrap_angle(innovation[2])
+            S = self.P + R  # H = I
+            S_inv = np.linalg.inv(S)
+            if innovation.dot(S_inv).dot(innovation) > self.gate:
+                self.rejected += 1
+                if self.rejected < self.reset_after:
+                    return False
+                # 連續離群: 估計值已經不可信 (換 marker 或里程計打滑), 以量測重新開始
+                self.x = z
+                self.P = R.copy()
+                self.rejected = 0
+                return True
+            self.rejected = 0
+            K = self.P.dot(S_inv)
+            self.x = self.x + K.dot(innovation)
+            self.x[2] = wrap_angle(self.x[2])
+            I_K = np.eye(3) - K
+            self.P = I_K.dot(self.P).dot(I_K.T) + K.dot(R).dot(K.T)  # Joseph form, 保持對稱正定
+            return True
+
+    def estimate(self):
+        # 回傳 (x, y, theta, 3x3 共變異數), 尚未初始化時回傳 None
+        with self.lock:
+            if not self.initialized:
+                return None
+            return float(self.x[0]), float(self.x[1]), float(self.x[2]), self.P.copy()
+
+
+class OdometryHistory():
+    # 保留最近 max_age 秒的 /odom 位姿 (世界座標)
+    # update(): 與前一筆之間的車體位移, 給 MarkerEKF.predict()
+    # motion_since(): 偵測的影像時間到最新一筆之間的車體位移, 補償相機與偵測的延遲
+    def __init__(self, max_age=2.0):
+        self.max_age = max_age
+        self.poses = deque()
+        self.lock = threading.Lock()
+
+    def update(self, x, y, theta, stamp):
+        # 回傳 (dx, dy, dtheta, dt), 第一筆回傳 None
+        pose = (stamp, x, y, theta)
+        with self.lock:
+            previous = self.poses[-1] if self.poses else None
+            self.poses.append(pose)
+            while stamp - self.poses[0][0] > self.max_age:
+                self.poses.popleft()
+        if previous is None:
+            return None
+        return body_delta(previous, pose) + (stamp - previous[0],)
+
+    def motion_since(self, stamp):
+        # 回傳 stamp 到最新一筆的 (dx, dy, dtheta), stamp 之前沒有資料時回傳 None
+        with self.lock:
+            if not self.poses or stamp < self.poses[0][0]:
+                return None
+            latest = self.poses[-1]
+            if stamp >= latest[0]:
+                return (0.0, 0.0, 0.0)
+            # 偵測通常只落後幾筆, 從最新往回找 stamp 前後的兩筆並內插
+            i = len(self.poses) - 1
+            while self.poses[i - 1][0] > stamp:
+                i -= 1
+            older, newer = self.poses[i - 1], self.poses[i]
+        span = newer[0] - older[0]
+        ratio = (stamp - older[0]) / span if span > 0 else 0.0
+        pose = (stamp, older[1] + ratio * (newer[1] - older[1]), older[2] + ratio * (newer[2] - older[2]),
+                older[3] + ratio * wrap_angle(newer[3] - older[3]))
+        return body_delta(pose, latest)
+
+
+def load_marker_ekf():
+    # MarkerEKF 的參數可用 ~ekf/<欄位> 覆寫 (例如 ~ekf/meas_theta)
+    import inspect
+    import rospy
+    fields = dict((key, rospy.get_param(rospy.get_name() + "/ekf/" + key, parameter.default))
+                  for key, parameter in inspect.signature(MarkerEKF).parameters.items())
+    return MarkerEKF(**fields)
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 不需 ROS, 以事件模擬比較依行駛成本派車與先進先出派車的 jobs/hour 與佇列延遲
+# python3 Fleet_dispatch_test.py [車數] [節點數]
+import heapq
+import random
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyRouteTable import RouteTable
+from FleetDispatch import Dispatcher, FleetMetrics
+from Topology_map_benchmark import warehouse_graph
+
+SPEED = 0.5      # m/s, 權重為走道長度
+SERVICE = 30.0   # 取貨與放貨各自對位、叉取的秒數
+HOURS = 8.0
+
+
+def simulate(routes, nodes, robots, arrival, age_weight, seed=1):
+    # HOURS 小時內持續送出任務並統計最後一小時, 之後不再送出任務, 繼續執行到佇列與所有車都清空
+    random.seed(seed)
+    starts = {"robot%d" % i: random.choice(nodes) for i in range(robots)}
+    dispatcher = Dispatcher(routes, starts, age_weight)
+    metrics = FleetMetrics(0.0)
+    events = []  # (時間, 種類, 資料)
+    end = HOURS * 3600
+    t = random.expovariate(1.0 / arrival)
+    submitted = 0
+    while t < end:
+        pick, place = random.sample(nodes, 2)
+        heapq.heappush(events, (t, 'job', (pick, place)))
+        submitted += 1
+        t += random.expovariate(1.0 / arrival)
+    heapq.heappush(events, (end, 'end', None))
+    finished = 0
+    while events:
+        now, kind, data = heapq.heappop(events)
+        if kind == 'end':
+            result = metrics.jobs_per_hour(end), metrics.queue_latency(end), len(dispatcher.queue)
+            continue
+        if kind == 'job':
+            dispatcher.submit(data[0], data[1], 0.0, now)
+        else:
+            job = dispatcher.finish(data, dispatcher.busy[data].place, 'success', now)
+            metrics.record_finished(job, True)
+            finished += 1
+        for job in dispatcher.assign(now):
+            metrics.record_assigned(job)
+            travel = routes.distance(starts[job.robot], job.pick) + routes.distance(job.pick, job.place)
+            starts[job.robot] = job.place
+            heapq.heappush(events, (now + travel / SPEED + 2 * SERVICE, 'done', job.robot))
+    assert not dispatcher.queue and not dispatcher.busy and finished == submitted, "queue did not drain"
+    return result + (now - end,)
+
+
+if __name__ == '__main__':
+    robots = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    graph, _ = warehouse_graph(size)
+    routes = RouteTable(graph)
+    nodes = list(graph)
+    for arrival in (60.0, 40.0, 30.0):
+        results = {}
+        for name, age_weight in (("fifo", 1e6), ("nearest", 0.0), ("nearest+age", 0.05)):
+            jobs_per_hour, (mean, longest), queued, drain = results[name] = simulate(routes, nodes, robots, arrival, age_weight)
+            print("%d robots, job every %4.0f s | %-11s | %6.1f jobs/hour | queue latency mean %7.1f s max %7.1f s | %3d left in queue, drained in %6.0f s"
+                  % (robots, arrival, name, jobs_per_hour, mean, longest, queued, drain))
+        # 依行駛成本派車: 吞吐量不低於先進先出, 平均佇列延遲與剩餘任務不高於先進先出
+        for name in ("nearest", "nearest+age"):
+            assert results[name][0] >= results["fifo"][0], "%s jobs/hour below fifo at %.0f s" % (name, arrival)
+            assert results[name][1][0] <= results["fifo"][1][0], "%s queue latency above fifo at %.0f s" % (name, arrival)
+            assert results[name][2] <= results["fifo"][2], "%s backlog above fifo at %.0f s" % (name, arrival)
+        # 任務間隔 60 s 時所有方式都跟得上, 結束時佇列中的任務不超過車數的兩倍
+        if arrival == 60.0:
+            for name, result in results.items():
+                assert result[2] <= 2 * robots, "%s backlog %d at %.0f s" % (name, result[2], arrival)
+    print("policy ordering and queue drain checks passed")
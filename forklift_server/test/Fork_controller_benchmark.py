@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 在模擬牙叉上比較原本的 bang-bang (fnForkUpdown)、bang-bang + 脈衝微調 (fork_updown_finetune) 與 ForkController 的到位時間與誤差
+# gpm 牙叉 (只有上升/下降/停止, PBVS_simulation.GpmForkPlant) 另外比較原本阻塞的 fork_updown 與不阻塞的 OnOffForkController
+# python3 Fork_controller_benchmark.py
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from ForkController import ForkController, OnOffForkController
+from fork_simulation import ForkPlant
+from PBVS_simulation import GpmForkPlant
+
+DT = 0.001          # 模擬步長
+MEASURE = 0.04      # forklift_driver 25 Hz 回傳高度
+CONTROL = 0.05      # 控制迴圈 20 Hz
+TIMEOUT = 20.0
+TOLERANCE = 0.005
+GPM_CONTROL = 0.1  # PBVS_server control_rate 10 Hz
+MOVES = [(0.0, 0.26), (0.26, 0.02), (0.02, 0.11), (0.11, 0.33), (0.33, 0.28), (0.28, 0.0), (0.25, 0.257), (0.1, 0.094)]
+
+
+class BangBang():
+    # PBVS_Action_megapose.fnForkUpdown
+    def __init__(self):
+        self.done = False
+
+    def update(self, position, target, t):
+        if position < target - TOLERANCE:
+            return 2000.0
+        elif position > target + TOLERANCE:
+            return -2000.0
+        self.done = True
+        return 0.0
+
+
+class PulseFinetune():
+    # PBVS_Action.fork_updown: 先 bang-bang 到 0.01 內, 再以上升 0.2 s / 下降 0.05 s 的脈衝加上 0.7 s 等待微調到 0.005
+    def __init__(self):
+        self.done = False
+        self.coarse = True
+        self.until = 0.0
+        self.output = 0.0
+
+    def update(self, position, target, t):
+        if self.coarse:
+            if position < target - 0.01:
+                return 2000.0
+            elif position > target + 0.01:
+                return -2000.0
+            self.coarse = False
+            self.until = t
+        if t < self.until:
+            return self.output
+        if self.output != 0.0:
+            self.output = 0.0
+            self.until = t + 0.7
+            return 0.0
+        if abs(position - target) <= TOLERANCE:
+            self.done = True
+            return 0.0
+        self.output, self.until = (2000.0, t + 0.2) if position < target else (-2000.0, t + 0.05)
+        return self.output
+
+
+class PID():
+    def __init__(self):
+        self.controller = ForkController(deadband=TOLERANCE)
+        self.done = False
+        self.last = None
+
+    def update(self, position, target, t):
+        dt = 0.0 if self.last is None else t - self.last
+        self.last = t
+        velocity = self.controller.update(position, target, dt if dt > 0 else CONTROL)
+        self.done = self.controller.is_settled
+        return velocity
+
+
+def run(controller, start, target, seed):
+    plant = ForkPlant(position=start, seed=seed)
+    measured = plant.measure()
+    t = 0.0
+    next_measure = next_control = 0.0
+    commands = []
+    peak = 0.0
+    while t < TIMEOUT:
+        if t >= next_measure:
+            measured = plant.measure()
+            next_measure += MEASURE
+        if t >= next_control:
+            velocity = controller.update(measured, target, t)
+            plant.set_velocity(velocity)
+            commands.append(velocity)
+            next_control += CONTROL
+            if controller.done:
+                break
+        plant.step(DT)
+        t += DT
+        peak = max(peak, (plant.position - target) * (1 if target > start else -1))
+    settle = t
+    for _ in range(int(1.0 / DT)):  # 停止後再等 1 秒讓牙叉停穩
+        plant.step(DT)
+    reversals = sum(1 for a, b in zip(commands, commands[1:]) if a * b < 0)
+    return settle, abs(plant.position - target), peak, reversals, controller.done
+
+
+class GpmBlocking():
+    # 原本的 PBVS_Action.fork_updown: bang-bang 到 0.01 內, 再以 fork_updown_finetune 的 rospy.sleep 脈衝 (上升 0.2 s / 下降 0.05 s, 等待 0.7 s) 微調
+    def __init__(self):
+        self.done = False
+        self.coarse = True
+        self.until = 0.0
+        self.pulsing = False
+        self.next_control = 0.0
+
+    def update(self, position, target, t):
+        if self.coarse:
+            if t < self.next_control:
+                return None
+            self.next_control += GPM_CONTROL
+            if position < target - 0.01:
+                return 2
+            elif position > target + 0.01:
+                return 3
+            self.coarse = False
+        if t < self.until:
+            return None
+        if self.pulsing:
+            self.pulsing = False
+            self.until = t + 0.7
+            return 1
+        if abs(position - target) <= TOLERANCE:
+            self.done = True
+            return 1
+        self.pulsing = True
+        self.until = t + (0.2 if position < target else 0.05)
+        return 2 if position < target else 3
+
+
+class GpmOnOff():
+    # PBVS_Action.fork_updown: 每個控制週期呼叫 OnOffForkController, 微調脈衝由 one-shot Timer 在 pulse 秒後停止
+    MOTIONS = {OnOffForkController.UP: 2, OnOffForkController.DOWN: 3, OnOffForkController.STOP: 1}
+
+    def __init__(self):
+        self.controller = OnOffForkController(deadband=TOLERANCE)
+        self.done = False
+        self.next_control = GPM_CONTROL  # 第一次呼叫只記錄時間
+        self.stop_at = None
+
+    def update(self, position, target, t):
+        if self.stop_at is not None and t >= self.stop_at:
+            self.stop_at = None
+            return 1
+        if t < self.next_control:
+            return None
+        self.next_control += GPM_CONTROL
+        motion, pulse = self.controller.update(position, target, t, GPM_CONTROL)
+        if pulse is not None:
+            self.stop_at = t + pulse
+        self.done = self.controller.is_settled
+        return self.MOTIONS[motion] if motion is not None else None
+
+
+def run_gpm(controller, start, target, seed):
+    plant = GpmForkPlant(height=start, seed=seed)
+    measured = plant.measure()[0]
+    t = 0.0
+    next_measure = 0.0
+    commands = 0
+    last = None
+    peak = 0.0
+    while t < TIMEOUT:
+        if t >= next_measure:
+            measured = plant.measure()[0]
+            next_measure += MEASURE
+        motion = controller.update(measured, target, t)
+        if motion is not None:
+            plant.set_motion(motion)
+            if motion != last:
+                commands += 1
+                last = motion
+        if controller.done:
+            break
+        plant.step(DT)
+        t += DT
+        peak = max(peak, (plant.height - target) * (1 if target > start else -1))
+    settle = t
+    for _ in range(int(1.0 / DT)):
+        plant.step(DT)
+    return settle, abs(plant.height - target), peak, commands, controller.done
+
+
+if __name__ == '__main__':
+    for name, factory in (("bang-bang", BangBang), ("pulse finetune", PulseFinetune), ("pid", PID)):
+        times, errors, overshoots, reversals, failures, within = [], [], [], 0, 0, 0
+        for i, (start, target) in enumerate(MOVES):
+            settle, error, peak, reversal, done = run(factory(), start, target, seed=i)
+            times.append(settle)
+            errors.append(error)
+            overshoots.append(max(peak, 0.0))
+            reversals += reversal
+            failures += 0 if done else 1
+            within += 1 if error <= TOLERANCE else 0
+        print("%-15s | settle mean %6.2f s max %6.2f s | final error mean %5.1f mm max %5.1f mm | overshoot max %5.1f mm | in tolerance %d/%d | reversals %3d | timeouts %d"
+              % (name, sum(times) / len(times), max(times), sum(errors) / len(errors) * 1e3, max(errors) * 1e3,
+                 max(overshoots) * 1e3, within, len(MOVES), reversals, failures))
+
+    # gpm 牙叉: 每組移動以 10 組亂數種子重複
+    for name, factory in (("gpm blocking", GpmBlocking), ("gpm on/off", GpmOnOff)):
+        times, errors, overshoots, commands, failures = [], [], [], 0, 0
+        for seed in range(10):
+            for i, (start, target) in enumerate(MOVES):
+                settle, error, peak, count, done = run_gpm(factory(), start, target, seed=seed * len(MOVES) + i)
+                times.append(settle)
+                errors.append(error)
+                overshoots.append(max(peak, 0.0))
+                commands += count
+                failures += 0 if done else 1
+        print("%-15s | settle mean %6.2f s max %6.2f s | final error mean %5.1f mm max %5.1f mm | overshoot max %5.1f mm | in tolerance %d/%d | commands %4d | timeouts %d"
+              % (name, sum(times) / len(times), max(times), sum(errors) / len(errors) * 1e3, max(errors) * 1e3,
+                 max(overshoots) * 1e3, sum(1 for e in errors if e <= TOLERANCE), len(errors), commands, failures))
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 確認 VehicleProfile.limit 與原本四份 cmd_vel.cmd_pub 的限幅結果一致, 並比較每個控制週期實際執行的步驟時間:
+# SpinOnce (PBVS_Action.Action) -> fnTrackMarker -> cmd_pub (限幅 -> CommandShaper -> 死區補償), 與原本 PBVS_Action.py 的寫法比較
+# publisher 換成不做事的物件, 只量測 Python 端的計算; 需要 ROS 環境 (rospy, geometry_msgs, gpm_msg)
+# python3 PBVS_core_benchmark.py
+import sys
+import os
+import math
+import timeit
+import types
+import rospy
+from geometry_msgs.msg import Twist
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from VehicleProfile import PROFILES
+from PBVS_Core import CmdVel
+from PBVS_Action import Action
+
+TICKS = 20000
+
+
+def legacy(linear_floor, linear_out, angular_floor, angular_out):
+    # 原本 cmd_pub 的 if/elif 限幅
+    def cmd_pub(x, z):
+        if z > 0.2:
+            z = 0.2
+        elif z < -0.2:
+            z = -0.2
+        if x > 0 and x < linear_floor:
+            x = linear_out
+        elif x < 0 and x > -linear_floor:
+            x = -linear_out
+        if x > 0.2:
+            x = 0.2
+        elif x < -0.2:
+            x = -0.2
+        if z > 0 and z < angular_floor:
+            z = angular_out
+        elif z < 0 and z > -angular_floor:
+            z = -angular_out
+        return x, z
+    return cmd_pub
+
+
+LEGACY = {
+    'forklift': legacy(0.02, 0.05, 0.01, 0.01),       # PBVS_Action.py
+    'minicar': legacy(0.02, 0.05, 0.05, 0.05),        # PBVS_Action_minicar.py
+    'megapose': legacy(0.02, 0.05, 0.05, 0.05),       # PBVS_Action_megapose.py
+    'differential': legacy(0.03, 0.02, 0.09, 0.1),    # PBVS_Action_differential.py
+}
+
+
+class NullPublisher():
+    def publish(self, msg):
+        pass
+
+
+class Subscriber():
+    # node/PBVS_server.py Subscriber.SpinOnce 回傳的欄位
+    def __init__(self):
+        self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta = 0.1, 0.2, 0.3
+        self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta = -1.0, 0.05, 0.02
+
+    def SpinOnce(self):
+        return self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
+               self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta
+
+
+class LegacyAction():
+    # 原本 PBVS_Action.py 的 SpinOnce, cmd_vel.fnTrackMarker 與 cmd_pub
+    def __init__(self, Subscriber):
+        self.Subscriber = Subscriber
+        self.pub_cmd_vel = NullPublisher()
+        self.front = False
+
+    def SpinOnce(self):
+        (self.robot_2d_pose_x, self.robot_2d_pose_y, self.robot_2d_theta, \
+         self.marker_2d_pose_x, self.marker_2d_pose_y, self.marker_2d_theta)=self.Subscriber.SpinOnce()
+
+    def cmd_pub(self, twist):
+        if not self.front:
+            twist.linear.x = -twist.linear.x
+        if twist.angular.z > 0.2:
+            twist.angular.z =0.2
+        elif twist.angular.z < -0.2:
+            twist.angular.z =-0.2
+        if twist.linear.x > 0 and twist.linear.x < 0.02:
+            twist.linear.x =0.05
+        elif twist.linear.x < 0 and twist.linear.x > -0.02:
+            twist.linear.x =-0.05
+        if twist.linear.x > 0.2:
+            twist.linear.x =0.2
+        elif twist.linear.x < -0.2:
+            twist.linear.x =-0.2
+        if twist.angular.z > 0 and twist.angular.z < 0.01:
+            twist.angular.z =0.01
+        elif twist.angular.z < 0 and twist.angular.z > -0.01:
+            twist.angular.z =-0.01
+        self.pub_cmd_vel.publish(twist)
+
+    def fnTrackMarker(self, theta):
+        Kp = 6.2
+        twist = Twist()
+        twist.linear.x = 0.15
+        twist.angular.z = -Kp * theta
+        self.cmd_pub(twist)
+
+
+def new_action(subscriber, profile):
+    # 不經過 ActionCore.__init__ (需要參數伺服器), 只放入 SpinOnce 與 fnTrackMarker 用到的欄位
+    action = types.SimpleNamespace(Subscriber=subscriber, cmd_vel=CmdVel(NullPublisher(), profile))
+    return action
+
+
+def ticks(spin, track, subscriber, n=TICKS):
+    # 每個控制週期: 讀入最新位姿, 依 marker 角度輸出一個命令; theta 每週期變化讓 CommandShaper 一直在整形
+    def run():
+        for i in range(n):
+            subscriber.marker_2d_theta = 0.03 * math.sin(i * 0.05)
+            spin()
+            track(-subscriber.marker_2d_theta)
+    return run
+
+
+def per_tick(function, n=TICKS, repeat=5):
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / n * 1e6
+
+
+if __name__ == '__main__':
+    values = [i * 0.0025 for i in range(-160, 161)]
+    print("limit (clamp + compensate) vs legacy cmd_pub clamp")
+    for name, profile in PROFILES.items():
+        old = LEGACY[name]
+        mismatches = sum(1 for x in values for z in values if old(x, z) != profile.limit(x, z))
+        t_old = timeit.timeit(lambda: [old(x, z) for x in values[::8] for z in values[::8]], number=200)
+        t_new = timeit.timeit(lambda: [profile.limit(x, z) for x in values[::8] for z in values[::8]], number=200)
+        print("  %-13s | mismatches %d/%d | legacy %.3f s new %.3f s" % (name, mismatches, len(values) ** 2, t_old, t_new))
+
+    # CommandShaper 以 rospy.get_time() 計算 dt, 不啟動 node 時使用 wall time
+    rospy.rostime.set_rostime_initialized(True)
+    profile = PROFILES['forklift']
+    subscriber = Subscriber()
+    old = LegacyAction(subscriber)
+    new = new_action(subscriber, profile)
+    unshaped = new_action(subscriber, profile)
+    unshaped.cmd_vel.shaper.shape = lambda linear, angular: (linear, angular)
+    rows = [
+        ("legacy SpinOnce + fnTrackMarker", per_tick(ticks(old.SpinOnce, old.fnTrackMarker, subscriber))),
+        ("new, without CommandShaper", per_tick(ticks(lambda: Action.SpinOnce(unshaped), unshaped.cmd_vel.fnTrackMarker, subscriber))),
+        ("new SpinOnce + fnTrackMarker", per_tick(ticks(lambda: Action.SpinOnce(new), new.cmd_vel.fnTrackMarker, subscriber))),
+    ]
+    print("per control tick (forklift, publish excluded)")
+    for label, us in rows:
+        print("  %-34s %6.2f us  (%4.2fx legacy, %.4f %% of a 10 Hz period)" % (label, us, us / rows[0][1], us / 1e3))
@@ -0,0 +1,304 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 在模擬堆高機 (PBVS_simulation.py) 上以隨機場景執行 PBVS_server 的 sequence, 統計成功率、最終誤差與完成時間
+# 使用 node/PBVS_server.py 的 Subscriber 與 scripts/PBVS.py, 感測資料直接送進 Subscriber 的 callback, 命令直接寫入模擬車
+# 時間由模擬時鐘驅動 (與 /clock 的 sim time 相同), 以 --speed 倍速執行; 需要 ROS 環境與 roscore (參數伺服器)
+# 參數預設讀取 launch/PBVS_server.launch, topic 改到 /pbvs_simulation 底下, 不會送命令給實車
+# python3 PBVS_docking_benchmark.py [--runs 100] [--speed 10] [--seed 0] [--launch 檔案] [sequence ...]
+import argparse
+import random
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import yaml
+import rospy
+import tf
+from nav_msgs.msg import Odometry
+from apriltag_ros.msg import AprilTagDetection, AprilTagDetectionArray
+from gpm_msg.msg import forkposition
+import forklift_server.msg
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+sys.path.append( os.path.join( script_dir, '..', 'node' ) )
+from PBVS_server import Subscriber
+from PBVS import PBVS
+from PBVS_simulation import BasePlant, GpmForkPlant, TagCamera
+
+NODE = 'PBVS_simulation'
+NAMESPACE = '/pbvs_simulation'
+SEQUENCES = ['parking_bodycamera', 'parking_forkcamera', 'raise_pallet', 'drop_pallet']
+SETTLE = 3.0  # 每個場景開始前靜止的時間 (s), 讓 EKF 與 MarkerHistory 只留下新場景的偵測
+
+
+def load_launch_params(path):
+    # launch 檔第一個 <node> 內的 <param> 與 <rosparam command="load">, 設為這個 node 的私有參數
+    package = os.path.join(script_dir, '..')
+    node = ElementTree.parse(path).getroot().find('node')
+    for element in node:
+        if element.tag == 'param':
+            rospy.set_param('~' + element.get('name'), param_value(element.get('value'), element.get('type')))
+        elif element.tag == 'rosparam' and element.get('command') == 'load':
+            with open(element.get('file').replace('$(find forklift_server)', package)) as f:
+                rospy.set_param('~' + element.get('ns', ''), yaml.safe_load(f))
+
+
+def param_value(value, kind=None):
+    # 與 roslaunch 相同的型別判斷: 指定 type 時照 type 轉換, 否則依序試 int / float / bool
+    if kind == 'str':
+        return value
+    if kind == 'double':
+        return float(value)
+    if kind == 'int':
+        return int(value)
+    if kind == 'bool' or value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def set_clock(t):
+    # 與 rospy 收到 /clock 時相同: 設定 rostime 並喚醒等待中的 rospy.sleep
+    rospy.rostime._set_rostime(rospy.Time.from_sec(t))
+    condition = rospy.rostime.get_rostime_cond()
+    with condition:
+        condition.notify_all()
+
+
+class CommandSink():
+    # 取代 Action 的 rospy.Publisher, publish() 直接把命令交給模擬車
+    def __init__(self, lock, callback):
+        self.lock = lock
+        self.callback = callback
+
+    def publish(self, msg):
+        with self.lock:
+            self.callback(msg)
+
+
+class SimulatedActionServer():
+    # PBVS 只用到 is_active / is_preempt_requested / publish_feedback, preempted 設為 True 時 goal 在下一步結束
+    def __init__(self):
+        self.feedback = None
+        self.preempted = False
+
+    def is_active(self):
+        return True
+
+    def is_preempt_requested(self):
+        return self.preempted
+
+    def publish_feedback(self, feedback):
+        self.feedback = feedback
+
+
+class SimulatedTruck():
+    # 背景執行緒以 dt 推進模擬時鐘、車體與牙叉, 依各感測器的頻率與延遲直接呼叫 Subscriber 的 callback
+    # (與 rospy callback 執行緒相同), 控制迴圈在主執行緒照常 rospy.sleep 等待模擬時間
+    def __init__(self, subscriber, dt=0.01, speed=10.0, odom_rate=50.0, fork_rate=25.0, seed=0):
+        self.subscriber = subscriber
+        self.dt = dt
+        self.speed = speed
+        self.odom_period = 1.0 / odom_rate
+        self.fork_period = 1.0 / fork_rate
+        self.base = BasePlant()
+        self.fork = GpmForkPlant(seed=seed)
+        self.camera = TagCamera(camera_x=subscriber.marker_ekf.camera_x, seed=seed)
+        self.tag = (0.0, 0.0, 0.0)  # marker 在世界座標的位置與法線方向
+        self.lock = threading.Lock()
+        self.time = 1.0  # rospy.sleep 在時間為 0 時會等待時鐘初始化
+        self.next_odom = self.next_fork = self.next_camera = self.time
+        self.pending = []  # (送達時間, 影像時間, 偵測)
+        self.cmd_vel = CommandSink(self.lock, lambda twist: self.base.set_cmd(twist.linear.x, twist.angular.z))
+        self.cmd_fork = CommandSink(self.lock, lambda msg: self.fork.set_motion(getattr(msg, 'forkmotion', msg)))
+        self.running = False
+        set_clock(self.time)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            started = time.time()
+            self.step()
+            delay = self.dt / self.speed - (time.time() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def step(self):
+        messages = []
+        with self.lock:
+            self.base.step(self.dt)
+            self.fork.step(self.dt)
+            self.time += self.dt
+            now = self.time
+            if now >= self.next_odom:
+                self.next_odom += self.odom_period
+                messages.append((self.subscriber.cbGetRobotOdom, self.odometry_msg(now)))
+            if now >= self.next_fork:
+                self.next_fork += self.fork_period
+                msg = forkposition()
+                msg.updownposition, msg.forwardbackpostion = self.fork.measure()
+                messages.append((self.subscriber.cbGetforkpos, msg))
+            if now >= self.next_camera:
+                self.next_camera += self.camera.period
+                detection = self.camera.observe(self.pose(), self.tag)
+                if detection is not None:
+                    self.pending.append((now + self.camera.latency, now, detection))
+            while self.pending and self.pending[0][0] <= now:
+                _, stamp, detection = self.pending.pop(0)
+                msg = self.detection_msg(stamp, detection)
+                # 兩支相機看同一個 tag, Subscriber 依 updown 只使用其中一支
+                messages += [(self.subscriber.cbGetMarker_up, msg), (self.subscriber.cbGetMarker_down, msg)]
+        set_clock(now)
+        for callback, msg in messages:
+            callback(msg)
+
+    def pose(self):
+        return self.base.x, self.base.y, self.base.theta
+
+    def odometry_msg(self, now):
+        msg = Odometry()
+        msg.header.stamp = rospy.Time.from_sec(now)
+        msg.header.frame_id = 'odom'
+        msg.pose.pose.position.x, msg.pose.pose.position.y = self.base.odom[0], self.base.odom[1]
+        (msg.pose.pose.orientation.x, msg.pose.pose.orientation.y, msg.pose.pose.orientation.z,
+         msg.pose.pose.orientation.w) = tf.transformations.quaternion_from_euler(0.0, 0.0, self.base.odom[2])
+        return msg
+
+    def detection_msg(self, stamp, detection):
+        # apriltag_ros 的相機座標, 與 Subscriber.cbGetMarker_* 的轉換相反:
+        # marker_2d_pose_x = -position.z, marker_2d_pose_y = position.x + offset_x, marker_2d_theta = -pitch
+        x, y, theta = detection
+        tag = AprilTagDetection()
+        tag.id = [0]
+        pose = tag.pose.pose.pose
+        pose.position.x, pose.position.z = y, -x
+        (pose.orientation.x, pose.orientation.y, pose.orientation.z,
+         pose.orientation.w) = tf.transformations.quaternion_from_euler(0.0, -theta, 0.0)
+        msg = AprilTagDetectionArray()
+        msg.header.stamp = rospy.Time.from_sec(stamp)
+        msg.detections = [tag]
+        return msg
+
+    def attach(self, action):
+        # Action 的 cmd_vel 與牙叉命令改送到模擬車
+        action.cmd_vel.pub_cmd_vel = self.cmd_vel
+        action.pub_fork = self.cmd_fork
+
+    def reset(self, scenario):
+        with self.lock:
+            self.base.teleport(*scenario['pose'])
+            self.base.deadband = scenario['deadband']
+            self.base.gain = scenario['gain']
+            self.base.odom_scale = scenario['odom_scale']
+            self.fork.height = scenario['fork']
+            self.fork.reach = 0.0
+            self.fork.motion = 1
+            self.fork.commands = []
+            self.pending = []
+        self.subscriber.marker_ekf.reset()
+
+    def truth(self):
+        # 相機座標的真實 marker 位置 (x, y, theta) 與牙叉高度
+        with self.lock:
+            return self.camera.truth(self.pose(), self.tag), self.fork.height
+
+
+def random_scenario(rng, sequence):
+    # marker 在原點, 法線朝 +x; 車頭朝 +x 時車尾相機正對 marker
+    if sequence.startswith('parking'):
+        pose = (rng.uniform(2.6, 4.5), rng.uniform(-0.8, 0.8), rng.uniform(-0.25, 0.25))
+    else:
+        # raise_pallet / drop_pallet 接在 parking 之後, 從已對位的位置開始
+        pose = (rng.uniform(1.4, 2.0), rng.gauss(0.0, 0.01), rng.gauss(0.0, 0.01))
+    # 致動器死區小於 VehicleProfile 的最小命令 (已校正的車, 見 node/Vehicle_calibration.py)
+    return {'pose': pose, 'fork': rng.uniform(0.0, 1.0),
+            'deadband': (rng.uniform(0.0, 0.02), rng.uniform(0.0, 0.008)),
+            'gain': (rng.uniform(0.85, 1.15), rng.uniform(0.85, 1.15)),
+            'odom_scale': (rng.gauss(0.0, 0.01), rng.gauss(0.0, 0.02))}
+
+
+def run_scenario(truck, subscriber, server, sequence, scenario):
+    truck.reset(scenario)
+    rospy.sleep(SETTLE)
+    pbvs = PBVS(server, subscriber, forklift_server.msg.PBVSGoal(command=sequence))
+    truck.attach(pbvs.Action)
+    started = rospy.get_time()
+    outcome = pbvs.run()
+    elapsed = rospy.get_time() - started
+    subscriber.updown = True  # 與 PBVSAction.execute_cb 相同
+    (x, y, theta), height = truck.truth()
+    succeeded = outcome is None or outcome == 'stop'
+    if sequence.startswith('parking'):
+        # 對位目標是 tag 偏移 offset_x 的位置, 成功條件與 fnSeqdecide 相同
+        lateral = y + subscriber.offset_x
+        errors = {'lateral': lateral, 'heading': theta, 'distance': abs(x) - pbvs.Parking_distance}
+        success = succeeded and abs(lateral) < abs(pbvs.decide_distance)
+    else:
+        errors = {'fork': height - pbvs.navigation_helght}
+        success = succeeded and abs(errors['fork']) < 0.01
+    return {'outcome': str(outcome), 'success': success, 'time': elapsed, 'errors': errors}
+
+
+def report(sequence, results):
+    outcomes = {}
+    for result in results:
+        outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+    times = np.array([result['time'] for result in results])
+    print("%-20s | success %3d/%3d (%5.1f %%) | time mean %6.1f s p95 %6.1f s max %6.1f s | outcomes %s"
+          % (sequence, sum(result['success'] for result in results), len(results),
+             100.0 * sum(result['success'] for result in results) / len(results),
+             times.mean(), np.percentile(times, 95), times.max(), outcomes))
+    for name in results[0]['errors']:
+        values = np.abs([result['errors'][name] for result in results])
+        unit, scale = ('mrad', 1e3) if name == 'heading' else ('mm', 1e3)
+        print("%-20s |   final %-8s error mean %7.1f %s p95 %7.1f %s max %7.1f %s"
+              % ('', name, values.mean() * scale, unit, np.percentile(values, 95) * scale, unit, values.max() * scale, unit))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sequences', nargs='*', default=SEQUENCES)
+    parser.add_argument('--runs', type=int, default=100, help='每個 sequence 的隨機場景數')
+    parser.add_argument('--speed', type=float, default=10.0, help='模擬時間相對實際時間的倍率')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=180.0, help='每個 goal 的 goal_timeout (s)')
+    parser.add_argument('--launch', default=os.path.join(script_dir, '..', 'launch', 'PBVS_server.launch'))
+    args = parser.parse_args()
+
+    # 所有輸出 topic 換到 /pbvs_simulation, 時鐘由 SimulatedTruck 設定
+    remap = ['{0}:={1}{0}'.format(topic, NAMESPACE) for topic in ('/cmd_vel', '/cmd_fork', '/diagnostics')]
+    rospy.init_node(NODE, argv=sys.argv[:1] + remap, disable_signals=True, disable_rostime=True)
+    load_launch_params(args.launch)
+    for name in ('odom', 'tag_detections_up', 'tag_detections_down', 'forkpos'):
+        rospy.set_param('~' + name, NAMESPACE + '/' + name)
+    rospy.set_param('~goal_timeout', args.timeout)
+
+    subscriber = Subscriber()
+    truck = SimulatedTruck(subscriber, speed=args.speed, seed=args.seed)
+    truck.start()
+    server = SimulatedActionServer()
+    rng = random.Random(args.seed)
+    summary = []
+    for sequence in args.sequences:
+        results = [run_scenario(truck, subscriber, server, sequence, random_scenario(rng, sequence)) for _ in range(args.runs)]
+        summary.append((sequence, results))
+    truck.stop()
+    for sequence, results in summary:
+        report(sequence, results)
@@ -0,0 +1,227 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 以實車錄下的 rosbag 離線重播 PBVS: /odom, /tag_detections_up/down, /forkpos 依錄製時間送進 node/PBVS_server.py 的 Subscriber,
+# 記錄每個 goal 的 sequence 會發出的 cmd_vel 與牙叉命令, 與 bag 中實際的 /cmd_vel, /cmd_fork 比較
+# 開迴路重播: 感測資料是實車當時的反應, 控制器修改後的命令不會改變之後的資料, 命令差異大的 state 就是行為改變的地方
+# goal 取自 bag 的 <server>/goal (PBVSActionGoal), 沒有錄到時用 --sequence 與 --start 指定
+# 時間由 bag 時間驅動 (sim time), 以 --speed 倍速執行; 需要 ROS 環境與 roscore (參數伺服器)
+# python3 PBVS_replay_benchmark.py 檔案.bag [...] [--speed 20] [--server /PBVS_server] [--launch 檔案] [--sequence parking_bodycamera --start 秒]
+import argparse
+import threading
+import time
+import numpy as np
+import rosbag
+import rospy
+import forklift_server.msg
+
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+sys.path.append( os.path.join( script_dir, '..', 'node' ) )
+from PBVS_server import Subscriber
+from PBVS import PBVS
+from PBVS_docking_benchmark import NAMESPACE, load_launch_params, set_clock, CommandSink, SimulatedActionServer
+
+NODE = 'PBVS_replay'
+SENSORS = ('odom', 'tag_detections_up', 'tag_detections_down', 'forkpos')
+
+
+class BagReplay():
+    # 背景執行緒依錄製時間把感測訊息送進 Subscriber 的 callback, 兩筆訊息之間以 dt 推進時鐘 (控制迴圈的 rospy.sleep 照常醒來)
+    # bag 結束後時鐘繼續前進, 並設定 finished 讓主執行緒取消還在執行的 goal
+    def __init__(self, bag, callbacks, speed=20.0, dt=0.01):
+        self.bag = bag
+        self.callbacks = callbacks  # {topic: callback}
+        self.speed = speed
+        self.dt = dt
+        self.time = bag.get_start_time()
+        self.finished = threading.Event()
+        self.stopped = False
+        set_clock(self.time)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+    def advance(self, until):
+        while self.time < until and not self.stopped:
+            self.time = min(self.time + self.dt, until)
+            set_clock(self.time)
+            time.sleep(self.dt / self.speed)
+
+    def run(self):
+        for topic, msg, stamp in self.bag.read_messages(topics=list(self.callbacks)):
+            self.advance(stamp.to_sec())
+            if self.stopped:
+                return
+            self.callbacks[topic](msg)
+        self.finished.set()
+        while not self.stopped:
+            self.advance(self.time + self.dt)
+
+
+def logged_goals(bag, server):
+    # bag 中的 goal: [(開始時間, PBVSGoal, 結束時間)], 沒有 result 的 goal 結束時間為 bag 結束
+    goals, results = [], []
+    for topic, msg, stamp in bag.read_messages(topics=[server + '/goal', server + '/result']):
+        (goals if topic.endswith('/goal') else results).append((stamp.to_sec(), msg))
+    spans = []
+    for i, (start, msg) in enumerate(goals):
+        following = goals[i + 1][0] if i + 1 < len(goals) else bag.get_end_time()
+        ends = [stamp for stamp, _ in results if start <= stamp <= following]
+        spans.append((start, msg.goal, ends[0] if ends else following))
+    return spans
+
+
+def logged_commands(bag, cmd_vel, cmd_fork):
+    # 實車的命令: cmd_vel [(時間, linear.x, angular.z)], 牙叉 [(時間, forkmotion)]
+    velocity, fork = [], []
+    for topic, msg, stamp in bag.read_messages(topics=[cmd_vel, cmd_fork]):
+        if topic == cmd_vel:
+            velocity.append((stamp.to_sec(), msg.linear.x, msg.angular.z))
+        else:
+            fork.append((stamp.to_sec(), msg.forkmotion))
+    return velocity, fork
+
+
+def held(logged, times):
+    # 每個時間點當時有效的實車命令 (最近一筆不晚於該時間的命令, 之前沒有命令時為 nan)
+    if not logged:
+        return np.full((len(times), 1), np.nan)
+    data = np.array([entry[1:] for entry in logged], dtype=float)
+    index = np.searchsorted([entry[0] for entry in logged], times, side='right') - 1
+    values = data[np.maximum(index, 0)]
+    values[index < 0] = np.nan
+    return values
+
+
+def compare(replayed, logged):
+    # replayed: [(時間, linear, angular, state)], 回傳 {state: (命令數, linear RMSE, angular RMSE, 方向一致比例)}
+    if not replayed:
+        return {}
+    times = np.array([entry[0] for entry in replayed])
+    ours = np.array([entry[1:3] for entry in replayed], dtype=float)
+    theirs = held(logged, times)
+    states = np.array([entry[3] for entry in replayed])
+    table = {}
+    for state in dict.fromkeys(states):
+        rows = (states == state) & ~np.isnan(theirs[:, 0])
+        if not rows.any():
+            continue
+        error = ours[rows] - theirs[rows]
+        agree = np.mean(np.all(np.sign(np.round(ours[rows], 3)) == np.sign(np.round(theirs[rows], 3)), axis=1))
+        table[state] = (int(rows.sum()), float(np.sqrt(np.mean(error[:, 0] ** 2))), float(np.sqrt(np.mean(error[:, 1] ** 2))), float(agree))
+    return table
+
+
+def fork_agreement(replayed, logged):
+    # 牙叉命令 (forkmotion) 與實車當時命令相同的比例
+    if not replayed or not logged:
+        return float('nan')
+    theirs = held(logged, np.array([entry[0] for entry in replayed]))[:, 0]
+    return float(np.mean(np.array([entry[1] for entry in replayed]) == theirs))
+
+
+def preempt_when(event, server):
+    event.wait()
+    server.preempted = True
+
+
+class Recorder():
+    # 取代 Action 的 cmd_vel 與牙叉 publisher, 記錄命令與當時 sequence 的 state
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pbvs = None
+        self.velocity = []
+        self.fork = []
+        self.cmd_vel = CommandSink(self.lock, lambda twist: self.velocity.append(
+            (rospy.get_time(), twist.linear.x, twist.angular.z, self.state())))
+        self.cmd_fork = CommandSink(self.lock, lambda msg: self.fork.append(
+            (rospy.get_time(), getattr(msg, 'forkmotion', msg))))
+
+    def state(self):
+        engine = self.pbvs.engine if self.pbvs is not None else None
+        return engine.state.name if engine is not None and engine.state is not None else ''
+
+    def attach(self, pbvs):
+        self.pbvs = pbvs
+        pbvs.Action.cmd_vel.pub_cmd_vel = self.cmd_vel
+        pbvs.Action.pub_fork = self.cmd_fork
+
+
+def replay(path, args, topics):
+    bag = rosbag.Bag(path)
+    subscriber = Subscriber()
+    callbacks = {topics['odom']: subscriber.cbGetRobotOdom, topics['tag_detections_up']: subscriber.cbGetMarker_up,
+                 topics['tag_detections_down']: subscriber.cbGetMarker_down, topics['forkpos']: subscriber.cbGetforkpos}
+    if args.sequence:
+        goals = [(bag.get_start_time() + args.start, forklift_server.msg.PBVSGoal(command=args.sequence), bag.get_end_time())]
+    else:
+        goals = logged_goals(bag, args.server)
+    velocity, fork = logged_commands(bag, args.cmd_vel, args.cmd_fork)
+    player = BagReplay(bag, callbacks, args.speed)
+    player.start()
+    runs = []
+    for start, goal, end in goals:
+        if rospy.get_time() > start:
+            rospy.logwarn('goal at {0:.1f} s skipped, previous replay still running'.format(start - bag.get_start_time()))
+            continue
+        while rospy.get_time() < start and not player.finished.is_set():
+            rospy.sleep(0.05)
+        server = SimulatedActionServer()
+        recorder = Recorder()
+        pbvs = PBVS(server, subscriber, goal)
+        recorder.attach(pbvs)
+        # bag 播完後沒有新的感測資料, 取消還在執行的 goal
+        watchdog = threading.Thread(target=preempt_when, args=(player.finished, server))
+        watchdog.daemon = True
+        watchdog.start()
+        outcome = pbvs.run()
+        subscriber.updown = True  # 與 PBVSAction.execute_cb 相同
+        runs.append({'goal': goal.command or 'ActionCode {0}'.format(goal.ActionCode), 'outcome': str(outcome),
+                     'logged': end - start, 'replayed': rospy.get_time() - start,
+                     'states': compare(recorder.velocity, [c for c in velocity if start <= c[0] <= max(end, rospy.get_time())]),
+                     'fork': fork_agreement(recorder.fork, fork)})
+    player.stop()
+    bag.close()
+    return runs
+
+
+def report(path, runs):
+    print(path)
+    for run in runs:
+        print("  %-20s | outcome %-10s | logged %6.1f s replayed %6.1f s | fork command agreement %5.1f %%"
+              % (run['goal'], run['outcome'], run['logged'], run['replayed'], 100.0 * run['fork']))
+        for state, (count, linear, angular, agree) in run['states'].items():
+            print("  %-20s |   %-28s %5d cmds | linear RMSE %6.3f m/s angular RMSE %6.3f rad/s | direction agreement %5.1f %%"
+                  % ('', state, count, linear, angular, 100.0 * agree))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('bags', nargs='+')
+    parser.add_argument('--speed', type=float, default=20.0, help='重播時間相對實際時間的倍率')
+    parser.add_argument('--server', default='/PBVS_server', help='bag 中 PBVS action 的名稱 (<server>/goal, <server>/result)')
+    parser.add_argument('--cmd_vel', default='/cmd_vel')
+    parser.add_argument('--cmd_fork', default='/cmd_fork')
+    parser.add_argument('--sequence', help='bag 中沒有 goal 時要重播的 command, 例如 parking_bodycamera')
+    parser.add_argument('--start', type=float, default=0.0, help='--sequence 從 bag 開始後第幾秒開始')
+    parser.add_argument('--launch', default=os.path.join(script_dir, '..', 'launch', 'PBVS_server.launch'))
+    args = parser.parse_args()
+
+    # 命令與 Subscriber 的 topic 都改到 NAMESPACE 底下, 資料只從 bag 送入
+    remap = ['{0}:={1}{0}'.format(topic, NAMESPACE) for topic in ('/cmd_vel', '/cmd_fork', '/diagnostics')]
+    rospy.init_node(NODE, argv=sys.argv[:1] + remap, disable_signals=True, disable_rostime=True)
+    load_launch_params(args.launch)
+    topics = dict((name, rospy.get_param('~' + name, '/' + name)) for name in SENSORS)
+    for name in SENSORS:
+        rospy.set_param('~' + name, NAMESPACE + '/' + name)
+    for path in args.bags:
+        report(path, replay(path, args, topics))
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# gpm 堆高機的運動學模擬: 車體 (單輪車模型)、牙叉 (forkmotion 上下前後) 與車尾相機的合成 AprilTag 偵測
+# 不需 ROS, PBVS_docking_benchmark.py 以這些模型餵 node/PBVS_server.py 的 Subscriber
+import math
+import random
+
+
+def wrap_angle(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+class BasePlant():
+    # cmd_vel (linear.x, angular.z) 經過 delay 秒生效, 一階延遲 tau 追上命令
+    # 致動器: |命令| 小於 deadband 不動, 超過後速度 = gain * (|命令| - deadband), 與 VehicleCalibration 的模型相同
+    # 里程計: 以輪速積分, 線速度與角速度各有 odom_scale 的比例誤差, 與真實位姿逐漸偏離
+    def __init__(self, pose=(0.0, 0.0, 0.0), tau=0.2, delay=0.05, deadband=(0.01, 0.01), gain=(1.0, 1.0),
+                 max_speed=(0.5, 0.8), odom_scale=(0.0, 0.0)):
+        self.tau = tau
+        self.delay = delay
+        self.deadband = deadband
+        self.gain = gain
+        self.max_speed = max_speed
+        self.odom_scale = odom_scale
+        self.x, self.y, self.theta = pose
+        self.odom = [0.0, 0.0, 0.0]
+        self.velocity = [0.0, 0.0]
+        self.command = (0.0, 0.0)
+        self.commands = []  # (生效時間, linear, angular)
+        self.time = 0.0
+
+    def teleport(self, x, y, theta):
+        # 換場景: 真實位姿跳到新位置, 里程計與實車一樣保持連續
+        self.x, self.y, self.theta = x, y, theta
+        self.velocity = [0.0, 0.0]
+        self.command = (0.0, 0.0)
+        self.commands = []
+
+    def set_cmd(self, linear, angular):
+        self.commands.append((self.time + self.delay, linear, angular))
+
+    def actuate(self, command, axis):
+        magnitude = abs(command) - self.deadband[axis]
+        if magnitude <= 0:
+            return 0.0
+        return math.copysign(min(self.gain[axis] * magnitude, self.max_speed[axis]), command)
+
+    def step(self, dt):
+        self.time += dt
+        while self.commands and self.commands[0][0] <= self.time:
+            self.command = self.commands.pop(0)[1:]
+        for axis in (0, 1):
+            target = self.actuate(self.command[axis], axis)
+            self.velocity[axis] += (target - self.velocity[axis]) * min(1.0, dt / self.tau)
+        v, w = self.velocity
+        # 以中點角度積分
+        heading = self.theta + 0.5 * w * dt
+        self.x += v * dt * math.cos(heading)
+        self.y += v * dt * math.sin(heading)
+        self.theta = wrap_angle(self.theta + w * dt)
+        v, w = v * (1.0 + self.odom_scale[0]), w * (1.0 + self.odom_scale[1])
+        heading = self.odom[2] + 0.5 * w * dt
+        self.odom[0] += v * dt * math.cos(heading)
+        self.odom[1] += v * dt * math.sin(heading)
+        self.odom[2] = wrap_angle(self.odom[2] + w * dt)
+
+
+class GpmForkPlant():
+    # gpm_msg/forklift 的 forkmotion: 1 停止, 2 上升, 3 下降, 4 前伸, 5 後縮, 其他為停止
+    # 每個動作以固定速度移動 (下降比上升快), 一階延遲 tau, forkposition 以 resolution 量化並加上雜訊
+    SPEEDS = {2: (0.05, 0.0), 3: (-0.06, 0.0), 4: (0.0, 0.05), 5: (0.0, -0.05)}
+
+    def __init__(self, height=0.0, reach=0.0, tau=0.1, delay=0.05, height_range=(0.0, 1.2), reach_range=(0.0, 0.7),
+                 resolution=0.001, noise=0.0005, seed=0):
+        self.height = height
+        self.reach = reach
+        self.tau = tau
+        self.delay = delay
+        self.height_range = height_range
+        self.reach_range = reach_range
+        self.resolution = resolution
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.velocity = [0.0, 0.0]
+        self.motion = 1
+        self.commands = []  # (生效時間, forkmotion)
+        self.time = 0.0
+
+    def set_motion(self, forkmotion):
+        self.commands.append((self.time + self.delay, forkmotion))
+
+    def step(self, dt):
+        self.time += dt
+        while self.commands and self.commands[0][0] <= self.time:
+            self.motion = self.commands.pop(0)[1]
+        target = self.SPEEDS.get(self.motion, (0.0, 0.0))
+        for axis in (0, 1):
+            self.velocity[axis] += (target[axis] - self.velocity[axis]) * min(1.0, dt / self.tau)
+        self.height = max(self.height_range[0], min(self.height_range[1], self.height + self.velocity[0] * dt))
+        self.reach = max(self.reach_range[0], min(self.reach_range[1], self.reach + self.velocity[1] * dt))
+
+    def measure(self):
+        # 回傳 (updownposition, forwardbackpostion)
+        return tuple(round((value + self.random.gauss(0.0, self.noise)) / self.resolution) * self.resolution
+                     for value in (self.height, self.reach))
+
+
+class TagCamera():
+    # 車尾相機看到的 marker, 回傳 Subscriber 的 marker_2d 定義 (車體座標, 相機在車尾所以 x 為負)
+    # theta: marker 法線 (指向車體) 與車頭方向的夾角, 車體逆時針旋轉時變小
+    # 只在視角 fov、距離 max_range 與 tag 斜角 max_angle 內才偵測得到; 雜訊隨距離增加, 偶爾產生離群值
+    def __init__(self, rate=15.0, latency=0.08, camera_x=0.0, fov=1.2, max_range=5.0, max_angle=1.1,
+                 noise_xy=(0.003, 0.004), noise_theta=(0.01, 0.01), outlier=0.01, dropout=0.05, seed=0):
+        self.period = 1.0 / rate
+        self.latency = latency
+        self.camera_x = camera_x
+        self.fov = fov
+        self.max_range = max_range
+        self.max_angle = max_angle
+        self.noise_xy = noise_xy      # (固定, 每公尺) 標準差 (m)
+        self.noise_theta = noise_theta  # (固定, 每公尺) 標準差 (rad)
+        self.outlier = outlier
+        self.dropout = dropout
+        self.random = random.Random(seed)
+
+    def truth(self, robot, tag):
+        # robot: (x, y, 車頭方向), tag: (x, y, 法線方向); 回傳相機座標的 (x, y, theta)
+        dx, dy = tag[0] - robot[0], tag[1] - robot[1]
+        c, s = math.cos(robot[2]), math.sin(robot[2])
+        return c * dx + s * dy - self.camera_x, -s * dx + c * dy, wrap_angle(tag[2] - robot[2])
+
+    def visible(self, x, y, theta):
+        return x < 0 and math.hypot(x, y) < self.max_range and abs(math.atan2(y, -x)) < self.fov / 2 \
+            and abs(theta) < self.max_angle
+
+    def observe(self, robot, tag):
+        # 偵測不到 (或這張影像漏偵測) 回傳 None
+        x, y, theta = self.truth(robot, tag)
+        if not self.visible(x, y, theta) or self.random.random() < self.dropout:
+            return None
+        distance = math.hypot(x, y)
+        scale = 10.0 if self.random.random() < self.outlier else 1.0
+        sigma_xy = scale * (self.noise_xy[0] + self.noise_xy[1] * distance)
+        sigma_theta = scale * (self.noise_theta[0] + self.noise_theta[1] * distance)
+        return (x + self.random.gauss(0.0, sigma_xy), y + self.random.gauss(0.0, sigma_xy),
+                theta + self.random.gauss(0.0, sigma_theta))
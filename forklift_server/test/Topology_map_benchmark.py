@@ -0,0 +1,145 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 比較每個 goal 跑兩次 Dijkstra 與查路徑表的延遲, A* 與 Dijkstra 展開的節點數, 以及線上改邊時修補與重建路徑表的時間
+# python3 Topology_map_benchmark.py [節點數 ...]
+import heapq
+import math
+import random
+import sys
+import os
+import time
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyRouteTable import RouteTable
+
+QUERIES = 200
+FULL_BUILD_LIMIT = 2000
+
+
+def warehouse_graph(nodes, seed=0, spacing=2.0):
+    # 走道網格, 雙向邊, 權重為走道長度乘上隨機壅塞係數; 回傳 (graph, waypoints)
+    random.seed(seed)
+    cols = int(math.sqrt(nodes))
+    rows = int(math.ceil(nodes / cols))
+    graph = {}
+    waypoints = {}
+    for i in range(nodes):
+        r, c = divmod(i, cols)
+        graph["n%d" % i] = {}
+        waypoints["n%d" % i] = [c * spacing, r * spacing, 0.0, 1.0]
+    for i in range(nodes):
+        r, c = divmod(i, cols)
+        for j in (i + 1 if c + 1 < cols else None, i + cols if r + 1 < rows else None):
+            if j is not None and j < nodes:
+                w = round(spacing * random.uniform(1.0, 1.5), 2)
+                graph["n%d" % i]["n%d" % j] = w
+                graph["n%d" % j]["n%d" % i] = w
+    return graph, waypoints
+
+
+def legacy_dijkstra(graph, s):
+    # 原本 TopologyMap.dijkstra 的寫法
+    pqueue = [(0, s)]
+    seen = set()
+    parent = {s: None}
+    distance = {vertex: math.inf for vertex in graph}
+    distance[s] = 0
+    while pqueue:
+        dist, vertex = heapq.heappop(pqueue)
+        seen.add(vertex)
+        for w in graph[vertex]:
+            if w not in seen and dist + graph[vertex][w] < distance[w]:
+                heapq.heappush(pqueue, (dist + graph[vertex][w], w))
+                parent[w] = vertex
+                distance[w] = dist + graph[vertex][w]
+    return parent, distance
+
+
+def legacy_path(graph, s, end):
+    legacy_dijkstra(graph, s)  # path() 與 distance_path() 各跑一次
+    parent, _ = legacy_dijkstra(graph, s)
+    path = [end]
+    while parent[end] != None:
+        path.append(parent[end])
+        end = parent[end]
+    path.reverse()
+    return path
+
+
+def benchmark(nodes):
+    graph, waypoints = warehouse_graph(nodes)
+    names = list(graph)
+    queries = [(random.choice(names), random.choice(names)) for _ in range(QUERIES)]
+
+    start = time.perf_counter()
+    for s, t in queries[:20]:
+        legacy_path(graph, s, t)
+    legacy = (time.perf_counter() - start) / 20
+
+    start = time.perf_counter()
+    table = RouteTable(graph, prebuild = nodes <= FULL_BUILD_LIMIT)
+    build = time.perf_counter() - start
+    if nodes > FULL_BUILD_LIMIT:
+        # 節點過多時只建立查詢用到的起點, 再依單列時間推估完整建表時間
+        start = time.perf_counter()
+        for s in set(s for s, _ in queries):
+            table.row(table.index[s])
+        row = (time.perf_counter() - start) / len(set(s for s, _ in queries))
+        build = row * nodes
+    for s, t in queries:
+        table.row(table.index[s])
+
+    start = time.perf_counter()
+    for s, t in queries:
+        path = table.path(s, t)
+    lookup = (time.perf_counter() - start) / QUERIES
+
+    for s, t in queries[:20]:
+        assert table.distance(s, t) == legacy_dijkstra(graph, s)[1][t]
+
+    print("nodes %6d | per-goal dijkstra x2 %9.3f ms | table build %s%8.2f s | table lookup %8.4f ms | speedup x%.0f"
+          % (nodes, legacy * 1e3, "~" if nodes > FULL_BUILD_LIMIT else " ", build, lookup * 1e3, legacy / lookup))
+    benchmark_astar(table, waypoints, queries)
+    if nodes <= FULL_BUILD_LIMIT:
+        benchmark_updates(graph, table, build)
+
+
+def benchmark_astar(table, waypoints, queries):
+    scale = table.consistent_heuristic_scale(waypoints)
+    result = {}
+    for name, k in (("dijkstra", 0.0), ("astar", scale)):
+        expanded = 0
+        start = time.perf_counter()
+        for s, t in queries:
+            path, n = table.astar(s, t, waypoints, k)
+            expanded += n
+            assert abs(sum(table.weight(a, b) for a, b in zip(path, path[1:])) - table.distance(s, t)) < 1e-6
+        result[name] = (expanded / len(queries), (time.perf_counter() - start) / len(queries))
+    print("             | dijkstra %8.0f nodes %8.3f ms | astar (scale %.2f) %8.0f nodes %8.3f ms"
+          % (result["dijkstra"][0], result["dijkstra"][1] * 1e3, scale, result["astar"][0], result["astar"][1] * 1e3))
+
+
+def benchmark_updates(graph, table, build):
+    # 隨機封閉再解除走道, 修補後結果須與重新建表一致
+    edges = [(u, v) for u in graph for v in graph[u]]
+    updates = 50
+    start = time.perf_counter()
+    repaired = 0
+    for u, v in random.sample(edges, updates):
+        repaired += table.block_edge(u, v)
+        repaired += table.unblock_edge(u, v)
+    update = (time.perf_counter() - start) / (updates * 2)
+    u, v = random.choice(edges)
+    table.set_weight(u, v, 100)
+    rebuilt = RouteTable({n: {m: table.weight(n, m) for m in graph[n]} for n in graph})
+    for s, t in random.sample(edges, 20):
+        assert table.distance(s, t) == rebuilt.distance(s, t)
+    print("             | edge update repair %8.3f ms (%.1f trees/update) | full rebuild %8.2f s"
+          % (update * 1e3, repaired / (updates * 2.0), build))
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000]
+    for n in sizes:
+        benchmark(n)
@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 不需 ROS, 模擬多台車在 Topology_map_multi.launch 的地圖上輪流派工, 檢查保留時段互不重疊
+import random
+import sys
+import os
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from TopologyRouteTable import RouteTable
+from TopologyReservation import ReservationTable, ReservationPenalty, path_windows
+
+graph = {
+    'LoopPlace': {'Pick1': 1, 'LoopPlaceCorrect': 4},
+    'LoopPlaceCorrect': {'Place0': 16},
+    'Pick1': {'Pick2': 2},
+    'Pick2': {'Pick3Before': 1},
+    'Pick3Before': {'Pick4': 1},
+    'Pick4': {'Pick5': 4},
+    'Pick5': {'LoopPlace': 4},
+    'Place0': {'Place1': 4},
+    'Place1': {'Place2': 4},
+    'Place2': {'Place3Before': 4},
+    'Place3Before': {'Place4': 4},
+    'Place4': {'Place5': 4},
+    'Place5': {'LoopPick': 4},
+    'LoopPick': {'Pick0': 4},
+    'Pick0': {'Pick1': 4}
+}
+waypoints = {
+    'LoopPlace': [12.228, 34.329], 'LoopPlaceCorrect': [12.228, 37.282],
+    'Pick1': [12.228, 34.329], 'Pick2': [14.267, 34.329], 'Pick3Before': [14.267, 34.329],
+    'Pick4': [14.267, 34.329], 'Pick5': [12.228, 34.329],
+    'Place0': [11.875, 47.021], 'Place1': [11.875, 47.021], 'Place2': [14.194, 47.111],
+    'Place3Before': [14.194, 47.111], 'Place4': [14.194, 47.111], 'Place5': [11.875, 47.021],
+    'LoopPick': [11.875, 47.021], 'Pick0': [12.228, 34.329]
+}
+goals = ['LoopPlace', 'Pick3Before', 'LoopPlaceCorrect', 'Place0', 'Place3Before']
+SERVICE = 20.0  # 到達後取放貨停留的秒數, 也是終點保留的時間
+
+
+def check(table):
+    for resource, windows in table.reservations.items():
+        for i, (s1, e1, r1) in enumerate(windows):
+            for s2, e2, r2 in windows[i + 1:]:
+                assert r1 == r2 or e1 <= s2 or e2 <= s1, "%s: %s %s overlap" % (resource, r1, r2)
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    routes = RouteTable(graph)
+    table = ReservationTable()
+    robots = {'robot1': ['LoopPlace', 0.0], 'robot2': ['Place0', 0.0], 'robot3': ['Pick4', 0.0]}
+    for robot, (start, _) in robots.items():
+        table.reserve(robot, path_windows([start], waypoints, [], margin = 0.5, hold = SERVICE), 0.0, 0.0)  # 啟動時登記所在位置
+    now = 0.0
+    for job in range(30):
+        robot = min(robots, key=lambda r: robots[r][1])  # 最早閒置的車接下一個任務
+        start, now = robots[robot][0], max(now, robots[robot][1])
+        # 只派往沒有其他車停放的位置
+        occupied = set(tuple(waypoints[robots[r][0]]) for r in robots)
+        candidates = [g for g in goals if tuple(waypoints[g]) not in occupied]
+        random.shuffle(candidates)
+        # 與 TopologyMap_server 相同, 規劃時以其他車的保留作為邊的額外成本
+        penalty = ReservationPenalty([(r, s - now, e - now) for r, s, e in table.others(robot)], waypoints, 1.0, 0.0, 0.5)
+        for goal in candidates:
+            path, _ = routes.astar(start, goal, waypoints, 0.0, penalty)
+            if not path:
+                continue
+            durations = [routes.weight(a, b) for a, b in zip(path, path[1:])]
+            windows = path_windows(path, waypoints, durations, margin = 0.5, hold = sum(durations) + SERVICE)
+            depart = table.schedule(robot, windows, now, max_wait = 300.0)
+            if depart is not None:
+                break
+        else:
+            print("t=%6.1f %s %-12s blocked" % (now, robot, start))
+            robots[robot][1] = now + 5.0
+            continue
+        table.reserve(robot, windows, depart, now)
+        check(table)
+        arrive = depart + sum(durations)
+        print("t=%6.1f %s %-12s -> %-12s wait %5.1f s arrive %6.1f" % (now, robot, start, goal, depart - now, arrive))
+        robots[robot] = [goal, arrive + SERVICE]
+    print("no overlapping reservations")
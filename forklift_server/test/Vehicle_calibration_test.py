@@ -0,0 +1,40 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 不需 ROS, 以已知死區與增益的致動器模型產生量測, 檢查 fit_deadband 與寫出的 VehicleProfile 欄位
+import random
+import tempfile
+import sys
+import os
+import yaml
+script_dir = os.path.dirname( __file__ )
+mymodule_dir = os.path.join( script_dir, '..', 'scripts' )
+sys.path.append( mymodule_dir )
+from VehicleCalibration import sweep_levels, fit_deadband, profile_fields, write_profile
+from VehicleProfile import VehicleProfile
+
+
+def actuator(command, deadband, gain, noise):
+    if abs(command) <= deadband:
+        return random.gauss(0.0, noise * 0.1)
+    return gain * (abs(command) - deadband) * (1 if command > 0 else -1) + random.gauss(0.0, noise)
+
+
+random.seed(0)
+for deadband, gain, maximum in ((0.04, 0.9, 0.3), (0.08, 1.2, 0.5), (0.0, 1.0, 0.2)):
+    commands = sweep_levels(maximum, 10)
+    speeds = [actuator(c, deadband, gain, 0.002) for c in commands]
+    fitted, fitted_gain, residual = fit_deadband(commands, speeds)
+    print('deadband {:.3f} -> {:.3f}, gain {:.2f} -> {:.2f}, residual {:.4f}'.format(deadband, fitted, gain, fitted_gain, residual))
+    assert abs(fitted - deadband) < 0.01 and abs(fitted_gain - gain) < 0.05
+
+fields = profile_fields((0.04, 0.9, 0.0), (0.08, 1.2, 0.0))
+path = os.path.join(tempfile.mkdtemp(), 'vehicle_test.yaml')
+write_profile(path, 'test', fields, {'linear': [[0.1, 0.05]]})
+with open(path) as f:
+    loaded = yaml.safe_load(f)
+profile = VehicleProfile('test', **dict((key, value) for key, value in loaded.items() if key != 'calibration'))
+# 想要的速度換成 cmd_vel, 太小的命令補到剛好能動
+print(profile.compensate(0.09, 0.01), profile.min_linear, profile.min_angular)
+assert abs(profile.compensate(0.09, 0.0)[0] - 0.1) < 1e-9
+assert profile.compensate(0.001, 0.0)[0] == profile.min_linear[1]
+print('ok')
@@ -1,29 +1,86 @@
 #! /usr/bin/env python3
-import rospy
-from gpm_msg.msg import forklift, forkposition
-
-class fork():
-    forwordbackpostion = 0.0
-    updownposition = 0.0
-    def __init__(self):
-        self.sub_fork_cmd = rospy.Subscriber('/cmd_fork', forklift, self.cbGetforkcmd, queue_size = 10)
-        self.pub_fork_pos = rospy.Publisher('/forkpos', forkposition, queue_size = 10)
-    
-    def cbGetforkcmd(self, msg):
-        if(msg.forkmotion == 1):
-            self.updownposition = self.updownposition + 0.01
-        elif(msg.forkmotion == 2):
-            self.updownposition = self.updownposition - 0.01
-        elif(msg.forkmotion == 3):
-            
-        
-
-    def updat_fork(self):
-        while not rospy.is_shutdown():
-            self.pub_fork_pos.publish(self.forwordbackpostion, self.updownposition)
-            rospy.sleep(0.1)
-        
-if __name__ == '__main__':
+# -*- coding: utf-8 -*-
+# 牙叉模擬: 訂閱 /cmd_fork (meteorcar.fork_velocity), 以一階延遲的起重電機模型積分高度, 發布 /forklift_pose
+# ForkPlant 不需 ROS, Fork_controller_benchmark.py 直接使用
+import random
+
+
+class ForkPlant():
+    def __init__(self, position=0.0, up_gain=2.5e-5, down_gain=5e-5, tau=0.15, delay=0.04,
+                 min_velocity=1000.0, max_velocity=3600.0, height=(0.0, 0.6), resolution=0.001, noise=0.0005, seed=0):
+        # up_gain/down_gain: 每單位 PWM 的穩態速度 (m/s), 載重下降比上升快
+        self.position = position
+        self.speed = 0.0
+        self.up_gain = up_gain
+        self.down_gain = down_gain
+        self.tau = tau
+        self.delay = delay
+        self.min_velocity = min_velocity
+        self.max_velocity = max_velocity
+        self.height = height
+        self.resolution = resolution
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.commands = []  # (生效時間, PWM)
+        self.command = 0.0
+        self.time = 0.0
+
+    def set_velocity(self, fork_velocity):
+        # 與 forklift_driver CmdForkCB 相同的限幅: 超過 3600 截斷, 1 ~ 1000 補到 1000
+        v = fork_velocity
+        if abs(v) > self.max_velocity:
+            v = self.max_velocity * (1 if v > 0 else -1)
+        elif 1 < abs(v) < self.min_velocity:
+            v = self.min_velocity * (1 if v > 0 else -1)
+        elif abs(v) < 1:
+            v = 0.0
+        self.commands.append((self.time + self.delay, v))
+
+    def step(self, dt):
+        self.time += dt
+        while self.commands and self.commands[0][0] <= self.time:
+            self.command = self.commands.pop(0)[1]
+        target = self.command * (self.up_gain if self.command > 0 else self.down_gain)
+        self.speed += (target - self.speed) * min(1.0, dt / self.tau)
+        self.position = max(self.height[0], min(self.height[1], self.position + self.speed * dt))
+
+    def measure(self):
+        # 編碼器解析度與雜訊
+        value = self.position + self.random.gauss(0.0, self.noise)
+        return round(value / self.resolution) * self.resolution
+
+
+def main():
+    import rospy
+    from forklift_msg.msg import meteorcar
+
+    class ForkSimulation():
+        def __init__(self):
+            self.plant = ForkPlant(position=rospy.get_param(rospy.get_name() + "/init_position", 0.0))
+            self.sub_fork_cmd = rospy.Subscriber('/cmd_fork', meteorcar, self.cbGetforkcmd, queue_size = 10)
+            self.pub_fork_pos = rospy.Publisher('/forklift_pose', meteorcar, queue_size = 10)
+
+        def cbGetforkcmd(self, msg):
+            self.plant.set_velocity(msg.fork_velocity)
+
+        def update_fork(self):
+            rate = 100
+            r = rospy.Rate(rate)
+            msg = meteorcar()
+            i = 0
+            while not rospy.is_shutdown():
+                self.plant.step(1.0 / rate)
+                i += 1
+                if i % 4 == 0:  # forklift_driver 以 25 Hz 發布
+                    msg.fork_position = self.plant.measure()
+                    msg.fork_velocity = self.plant.command
+                    self.pub_fork_pos.publish(msg)
+                r.sleep()
+
     rospy.init_node('fork_simulation', anonymous = True)
-    fork = fork()
-    rospy.spin()
+    fork = ForkSimulation()
+    fork.update_fork()
+
+
+if __name__ == '__main__':
+    main()